@@ -0,0 +1,399 @@
+"""本地模拟的百度街景接口(mapsv0.bdimg.com)
+
+用于在不访问百度服务器的情况下测试爬虫吞吐量，提供与真实接口格式一致的
+qsdata/sdata(JSONP)、pr3d街景图与pdata全景图瓦片。
+
+模拟的街景路网:
+    - 道路为百度墨卡托坐标系中间隔 road_spacing 米的横向与纵向直线，全景图沿道路每 pano_spacing 米一个。
+    - qsdata 返回距查询坐标最近的道路上的全景图，距离超过 max_snap 米时返回无全景图。
+    - sdata 返回全景图所在道路(Roads/Panos)、相邻全景图(Links)以及多个年份的TimeLine。
+
+可配置各接口的响应延迟分布(对数正态)、随机错误率、速率上限(超过时返回429)、周期性的429突发以及图片大小。
+
+使用方法:
+    python benchmark/mock_server.py --port 8765 --latency qsdata=30,sdata=40,pr3d=80,pdata=60
+    MAPSV0_URL=http://127.0.0.1:8765/ python main.py ...
+"""
+
+import argparse
+import io
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from PIL import Image
+
+ENDPOINTS = ['qsdata', 'sdata', 'pr3d', 'pdata']
+
+
+def parse_endpoint_values(value, default):
+    """解析 'qsdata=30,sdata=40' 或单个数值形式的按接口配置"""
+    values = dict.fromkeys(ENDPOINTS, default)
+    if value is None or value == '':
+        return values
+    if '=' not in str(value):
+        return dict.fromkeys(ENDPOINTS, float(value))
+    for item in str(value).split(','):
+        endpoint, number = item.split('=')
+        values[endpoint.strip()] = float(number)
+    return values
+
+
+class MockWorld:
+    """模拟的街景路网与图片数据"""
+
+    def __init__(self, road_spacing=100, pano_spacing=10, max_snap=60, road_span=10, years=(2015, 2019, 2021),
+                 empty_rate=0.0, tile_size=512, image_noise=0.3, seed=0):
+        self.road_spacing = road_spacing
+        self.pano_spacing = pano_spacing
+        self.step = max(1, int(round(road_spacing / pano_spacing)))
+        self.max_snap = max_snap
+        self.road_span = road_span
+        self.years = sorted(years)
+        self.empty_rate = empty_rate
+        self.tile_size = tile_size
+        self.image_noise = image_noise
+        self.seed = seed
+        self._images = {}
+        self._lock = threading.Lock()
+
+    # ---------- 路网 ----------
+
+    def _index(self, value):
+        return int(round(value / self.pano_spacing))
+
+    def nearest_pano(self, x, y):
+        """返回距离坐标最近的道路上的全景图网格坐标，超出吸附距离时返回None"""
+        road_x = round(x / self.road_spacing) * self.road_spacing
+        road_y = round(y / self.road_spacing) * self.road_spacing
+        if abs(x - road_x) <= abs(y - road_y):
+            ix, iy = self._index(road_x), self._index(y)
+            distance = abs(x - road_x)
+        else:
+            ix, iy = self._index(x), self._index(road_y)
+            distance = abs(y - road_y)
+
+        if distance > self.max_snap:
+            return None
+        if self.empty_rate and random.Random(hash((ix, iy, self.seed))).random() < self.empty_rate:
+            return None
+        return ix, iy
+
+    def pano_id(self, ix, iy, year=None):
+        base = f"MOCK{ix:+08d}{iy:+08d}".replace('+', 'P').replace('-', 'N')
+        if year is None or year == self.years[-1]:
+            return base
+        return f"{base}Y{year}"
+
+    def parse_pano_id(self, sid):
+        """解析全景图ID，返回(ix, iy, year)"""
+        if not sid.startswith('MOCK') or len(sid) < 20:
+            return None
+        try:
+            ix = int(sid[4:12].replace('P', '+').replace('N', '-'))
+            iy = int(sid[12:20].replace('P', '+').replace('N', '-'))
+        except ValueError:
+            return None
+        year = int(sid[21:]) if len(sid) > 20 and sid[20] == 'Y' else self.years[-1]
+        return ix, iy, year
+
+    def is_pano(self, ix, iy):
+        return ix % self.step == 0 or iy % self.step == 0
+
+    def _pano_entry(self, ix, iy, year, order, direction):
+        return {
+            'PID': self.pano_id(ix, iy, year),
+            'X': int(ix * self.pano_spacing * 100),
+            'Y': int(iy * self.pano_spacing * 100),
+            'Order': order,
+            'DIR': direction
+        }
+
+    def _road(self, ix, iy, year, horizontal, current):
+        """生成经过全景图的一段道路"""
+        panos = []
+        for order, offset in enumerate(range(-self.road_span, self.road_span + 1)):
+            px, py = (ix + offset, iy) if horizontal else (ix, iy + offset)
+            panos.append(self._pano_entry(px, py, year, order, 90 if horizontal else 0))
+        road_index = iy // self.step if horizontal else ix // self.step
+        return {
+            'ID': f"{'H' if horizontal else 'V'}{road_index}",
+            'IsCurrent': 1 if current else 0,
+            'Name': f"{'横' if horizontal else '纵'}{road_index}路",
+            'Width': 2000,
+            'Panos': panos
+        }
+
+    def sdata(self, sid):
+        """生成全景图的sdata元数据"""
+        parsed = self.parse_pano_id(sid)
+        if parsed is None:
+            return None
+        ix, iy, year = parsed
+        if not self.is_pano(ix, iy):
+            return None
+
+        horizontal = iy % self.step == 0
+        vertical = ix % self.step == 0
+        roads = []
+        if horizontal:
+            roads.append(self._road(ix, iy, year, True, True))
+        if vertical:
+            roads.append(self._road(ix, iy, year, False, not horizontal))
+
+        # 道路两端的全景图通过Links连接到路网中更远的全景图
+        links = []
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            if (dy == 0 and horizontal) or (dx == 0 and vertical):
+                lx, ly = ix + dx * (self.road_span + 1), iy + dy * (self.road_span + 1)
+                links.append({
+                    'PID': self.pano_id(lx, ly, year),
+                    'X': int(lx * self.pano_spacing * 100),
+                    'Y': int(ly * self.pano_spacing * 100),
+                    'DIR': 90 if dy == 0 else 0,
+                    'RID': roads[0]['ID']
+                })
+
+        move_dir = 90.0 if horizontal else 0.0
+        timeline = [{
+            'ID': self.pano_id(ix, iy, item_year),
+            'Year': str(item_year),
+            'TimeLine': f"{item_year}07",
+            'IsCurrent': 1 if item_year == self.years[-1] else 0
+        } for item_year in reversed(self.years)]
+
+        return {
+            'ID': sid,
+            'X': int(ix * self.pano_spacing * 100),
+            'Y': int(iy * self.pano_spacing * 100),
+            'Z': 3000,
+            'MoveDir': move_dir,
+            'Heading': move_dir,
+            'Date': f"{year}0715",
+            'Rname': roads[0]['Name'],
+            'Roads': roads,
+            'Links': links,
+            'TimeLine': timeline
+        }
+
+    # ---------- 图片 ----------
+
+    def image(self, width, height):
+        """返回指定尺寸的JPEG图片(按尺寸缓存，noise越大图片越大)"""
+        key = (width, height)
+        with self._lock:
+            data = self._images.get(key)
+            if data is None:
+                rng = np.random.default_rng(self.seed)
+                gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+                pixels = np.broadcast_to(gradient, (height, width, 3)).copy()
+                pixels += rng.normal(0, 255 * self.image_noise, pixels.shape)
+                buffer = io.BytesIO()
+                Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=90)
+                data = self._images[key] = buffer.getvalue()
+        return data
+
+
+class EndpointBehaviour:
+    """单个接口的延迟、错误与限流行为"""
+
+    def __init__(self, latency_ms, sigma, error_rate, max_rate, burst_period, burst_duration):
+        self.latency = latency_ms / 1000.0
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.burst_period = burst_period
+        self.burst_duration = burst_duration
+        self.started = time.monotonic()
+        self._window = []
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.latency), self.sigma) if self.sigma else self.latency
+
+    def throttled(self):
+        """判断本次请求是否应返回429"""
+        now = time.monotonic()
+        if self.burst_period and (now - self.started) % self.burst_period < self.burst_duration:
+            return True
+        if not self.max_rate:
+            return False
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_rate:
+                return True
+            self._window.append(now)
+        return False
+
+    def failed(self):
+        return self.error_rate and random.random() < self.error_rate
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, world, behaviours, jsonp=True):
+        super().__init__(address, MockHandler)
+        self.world = world
+        self.behaviours = behaviours
+        self.jsonp = jsonp
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def record(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体分开发送，关闭Nagle算法避免额外的40ms延迟确认等待
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, params):
+        text = json.dumps(data, ensure_ascii=False)
+        callback = params.get('cb') or ('cb' if self.server.jsonp else None)
+        if callback:
+            text = f"/**/jsonp.{callback} && jsonp.{callback}({text})"
+            self._send(200, text.encode('utf-8'), 'application/javascript; charset=utf-8')
+        else:
+            self._send(200, text.encode('utf-8'), 'application/json; charset=utf-8')
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stats':
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+            self._send(200, json.dumps(stats).encode('utf-8'), 'application/json')
+            return
+
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        qt = params.get('qt')
+        behaviour = self.server.behaviours.get(qt)
+        if behaviour is None:
+            self._send(404)
+            return
+
+        self.server.record(qt)
+        if behaviour.throttled():
+            self.server.record(f"{qt}_429")
+            self._send(429, headers={'Retry-After': '1'})
+            return
+
+        time.sleep(behaviour.delay())
+        if behaviour.failed():
+            self.server.record(f"{qt}_500")
+            self._send(500)
+            return
+
+        world = self.server.world
+        try:
+            if qt == 'qsdata':
+                pano = world.nearest_pano(float(params['x']), float(params['y']))
+                if pano is None:
+                    self._send_json({'result': {'error': 0}, 'content': {}}, params)
+                else:
+                    self._send_json({'result': {'error': 0}, 'content': {'id': world.pano_id(*pano)}}, params)
+            elif qt == 'sdata':
+                content = world.sdata(params.get('sid', ''))
+                self._send_json({'result': {'error': 0}, 'content': [content] if content else []}, params)
+            elif qt == 'pr3d':
+                size = (int(params.get('width', 500)), int(params.get('height', 500)))
+                self._send(200, world.image(*size), 'image/jpeg')
+            elif qt == 'pdata':
+                self._send(200, world.image(world.tile_size, world.tile_size), 'image/jpeg')
+        except (KeyError, ValueError):
+            self._send(400)
+
+
+def build_server(args):
+    """根据命令行参数创建模拟服务器"""
+    latency = parse_endpoint_values(args.latency, 50)
+    error_rate = parse_endpoint_values(args.error_rate, 0.0)
+    max_rate = parse_endpoint_values(args.max_rate, 0.0)
+
+    behaviours = {
+        endpoint: EndpointBehaviour(
+            latency[endpoint], args.latency_sigma, error_rate[endpoint], max_rate[endpoint],
+            args.burst_period, args.burst_duration
+        )
+        for endpoint in ENDPOINTS
+    }
+    world = MockWorld(
+        road_spacing=args.road_spacing,
+        pano_spacing=args.pano_spacing,
+        max_snap=args.max_snap,
+        years=[int(year) for year in args.years.split(',')],
+        empty_rate=args.empty_rate,
+        tile_size=args.tile_size,
+        image_noise=args.image_noise,
+        seed=args.seed
+    )
+    return MockServer((args.host, args.port), world, behaviours, jsonp=not args.no_jsonp)
+
+
+def add_server_arguments(parser):
+    """添加模拟服务器的命令行参数(benchmark/run_benchmark.py共用)"""
+    parser.add_argument('--latency', type=str, default='qsdata=30,sdata=40,pr3d=80,pdata=60',
+                        help='各接口响应延迟的中位数(毫秒)，如 qsdata=30,sdata=40 或单个数值')
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help='延迟对数正态分布的sigma，0表示固定延迟')
+    parser.add_argument('--error-rate', type=str, default='0',
+                        help='各接口返回500的概率，如 pdata=0.01 或单个数值')
+    parser.add_argument('--max-rate', type=str, default='0',
+                        help='各接口每秒请求上限，超过时返回429，0表示不限')
+    parser.add_argument('--burst-period', type=float, default=0,
+                        help='周期性429突发的周期(秒)，0表示不启用')
+    parser.add_argument('--burst-duration', type=float, default=2,
+                        help='每次429突发的持续时间(秒)')
+    parser.add_argument('--road-spacing', type=float, default=100, help='模拟路网的道路间距(米)')
+    parser.add_argument('--pano-spacing', type=float, default=10, help='道路上全景图的间距(米)')
+    parser.add_argument('--max-snap', type=float, default=60, help='qsdata吸附到道路的最大距离(米)')
+    parser.add_argument('--empty-rate', type=float, default=0.0, help='无全景图的位置比例')
+    parser.add_argument('--years', type=str, default='2015,2019,2021', help='TimeLine中的年份')
+    parser.add_argument('--tile-size', type=int, default=512, help='pdata瓦片边长(像素)')
+    parser.add_argument('--image-noise', type=float, default=0.3,
+                        help='图片噪声强度(0-1)，越大JPEG体积越大')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--no-jsonp', action='store_true', help='qsdata/sdata返回纯JSON而不是JSONP')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的百度街景接口')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = build_server(args)
+    print(f"Mock mapsv0 server listening on http://{args.host}:{server.server_address[1]}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""端到端爬取基准测试
+
+启动本地模拟接口(benchmark/mock_server.py)，在临时工作目录中以 directional 与 panoramic 模式运行 main.py，
+统计采样点吞吐量、请求吞吐量、各接口延迟分位数与峰值内存，并将结果保存为JSON以便比较不同版本。
+
+使用方法:
+    python benchmark/run_benchmark.py --points 500 --label baseline
+    python benchmark/run_benchmark.py --points 500 --label async -- --engine async --concurrency 32
+    python benchmark/run_benchmark.py --compare benchmark/results/a.json benchmark/results/b.json
+
+'--' 之后的参数原样传给 main.py。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+sys.path.append(str(Path(__file__).parent))
+from mock_server import add_server_arguments
+
+ROOT_DIR = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / 'results'
+# 复制到临时工作目录的代码
+CODE_ITEMS = ['main.py', 'config', 'core', 'utils']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(args):
+    """在子进程中启动模拟接口，避免与爬虫争用GIL"""
+    port = free_port()
+    command = [sys.executable, str(Path(__file__).parent / 'mock_server.py'), '--port', str(port)]
+    for name in ['latency', 'latency_sigma', 'error_rate', 'max_rate', 'burst_period', 'burst_duration',
+                 'road_spacing', 'pano_spacing', 'max_snap', 'empty_rate', 'years', 'tile_size',
+                 'image_noise', 'seed']:
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    if args.no_jsonp:
+        command.append('--no-jsonp')
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    url = f"http://127.0.0.1:{port}/"
+    for _ in range(50):
+        try:
+            urllib.request.urlopen(url + '__stats', timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Mock server failed to start')
+
+
+def server_stats(url):
+    with urllib.request.urlopen(url + '__stats', timeout=5) as response:
+        return json.loads(response.read())
+
+
+def prepare_workspace(workspace, points, bbox, seed):
+    """复制代码到临时目录，并生成随机采样点"""
+    for item in CODE_ITEMS:
+        source = ROOT_DIR / item
+        if source.is_dir():
+            shutil.copytree(source, workspace / item, ignore=shutil.ignore_patterns('__pycache__'))
+        else:
+            shutil.copy2(source, workspace / item)
+
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    input_dir = workspace / 'data' / 'input'
+    input_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        'PID': np.arange(1, points + 1),
+        'Lon': rng.uniform(min_lon, max_lon, points),
+        'Lat': rng.uniform(min_lat, max_lat, points)
+    }).to_csv(input_dir / 'benchmark.csv', index=False)
+
+
+def histogram_quantile(histogram, q):
+    """根据导出的直方图估计分位数"""
+    buckets = [(float('inf') if bound == '+Inf' else float(bound), count)
+               for bound, count in histogram['buckets'].items()]
+    total = sum(count for _, count in buckets)
+    if not total:
+        return 0.0
+    target = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in buckets:
+        if count and cumulative + count >= target:
+            upper = bound if bound != float('inf') else lower
+            return lower + (upper - lower) * (target - cumulative) / count
+        cumulative += count
+        lower = bound if bound != float('inf') else lower
+    return lower
+
+
+def run_mode(mode, args, url, extra_args):
+    """在独立的临时工作目录中运行一次爬取"""
+    workspace = Path(tempfile.mkdtemp(prefix=f"street_view_bench_{mode}_"))
+    try:
+        prepare_workspace(workspace, args.points, args.bbox, args.seed)
+        command = [sys.executable, 'main.py', '--input', 'benchmark.csv', '--output', 'benchmark.csv',
+                   '--mode', mode, '--metrics', 'json'] + extra_args
+        env = dict(os.environ, MAPSV0_URL=url)
+
+        before = server_stats(url)
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workspace, env=env,
+                                   stdout=subprocess.DEVNULL if not args.verbose else None,
+                                   stderr=subprocess.DEVNULL if not args.verbose else None)
+        if resource is not None:
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # Linux下ru_maxrss单位为KB，macOS下为字节
+            peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        else:
+            process.wait()
+            peak_rss_mb = None
+        elapsed = time.perf_counter() - start
+        after = server_stats(url)
+
+        if process.returncode != 0:
+            raise RuntimeError(f"main.py exited with code {process.returncode} in {mode} mode")
+
+        snapshot_path = workspace / 'data' / 'output' / 'metrics' / 'benchmark.json'
+        snapshot = json.loads(snapshot_path.read_text(encoding='utf-8')) if snapshot_path.exists() else {}
+
+        endpoints = {}
+        for entry in snapshot.get('histograms', []):
+            if entry['name'] == 'http_request_seconds':
+                endpoints[entry['labels']['endpoint']] = {
+                    'requests': entry['value']['count'],
+                    'p50': histogram_quantile(entry['value'], 0.5),
+                    'p99': histogram_quantile(entry['value'], 0.99)
+                }
+        points = sum(entry['value'] for entry in snapshot.get('counters', []) if entry['name'] == 'points_total')
+        server_requests = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+        total_requests = sum(value for key, value in server_requests.items() if '_' not in key)
+
+        return {
+            'mode': mode,
+            'points': points,
+            'elapsed': round(elapsed, 3),
+            'points_per_sec': round(points / elapsed, 3),
+            'requests_per_sec': round(total_requests / elapsed, 3),
+            'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+            'server_requests': server_requests,
+            'endpoints': endpoints
+        }
+    finally:
+        if args.keep_workspace:
+            print(f"Workspace kept at {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def print_result(result):
+    print(f"[{result['mode']}] {result['points']} points in {result['elapsed']:.1f}s: "
+          f"{result['points_per_sec']:.2f} points/s, {result['requests_per_sec']:.2f} requests/s, "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    for endpoint, stats in sorted(result['endpoints'].items()):
+        print(f"    {endpoint:<8} requests {stats['requests']:>7}  p50 {stats['p50'] * 1000:8.1f} ms  "
+              f"p99 {stats['p99'] * 1000:8.1f} ms")
+
+
+def compare(paths):
+    """比较多次基准测试结果"""
+    runs = [json.loads(Path(path).read_text(encoding='utf-8')) for path in paths]
+    print(f"{'run':<32}{'mode':<12}{'points/s':>10}{'requests/s':>12}{'peak RSS MB':>13}")
+    for run in runs:
+        for result in run['results']:
+            print(f"{run['label']:<32}{result['mode']:<12}{result['points_per_sec']:>10.2f}"
+                  f"{result['requests_per_sec']:>12.2f}{str(result['peak_rss_mb']):>13}")
+
+
+def main():
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        index = argv.index('--')
+        argv, extra_args = argv[:index], argv[index + 1:]
+
+    parser = argparse.ArgumentParser(description='街景爬虫端到端基准测试')
+    parser.add_argument('--points', type=int, default=200, help='采样点数量')
+    parser.add_argument('--modes', type=str, default='directional,panoramic', help='测试的爬取模式')
+    parser.add_argument('--bbox', type=float, nargs=4, default=[108.90, 34.20, 108.95, 34.25],
+                        metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'), help='采样点范围(WGS84)')
+    parser.add_argument('--label', type=str, default=None, help='结果标签，默认为当前时间')
+    parser.add_argument('--output-dir', type=str, default=str(RESULTS_DIR), help='结果保存目录')
+    parser.add_argument('--keep-workspace', action='store_true', help='保留临时工作目录')
+    parser.add_argument('--verbose', action='store_true', help='显示main.py的输出')
+    parser.add_argument('--compare', type=str, nargs='+', help='比较已保存的结果文件')
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    label = args.label or datetime.now().strftime('%Y%m%d%H%M%S')
+    process, url = start_mock_server(args)
+    try:
+        results = []
+        for mode in args.modes.split(','):
+            result = run_mode(mode.strip(), args, url, extra_args)
+            print_result(result)
+            results.append(result)
+    finally:
+        process.terminate()
+        process.wait()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"{label}.json"
+    run = {
+        'label': label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'points': args.points,
+        'main_args': extra_args,
+        'server': {key: value for key, value in vars(args).items()
+                   if key not in ('compare', 'output_dir', 'keep_workspace', 'verbose', 'label')},
+        'results': results
+    }
+    output_path.write_text(json.dumps(run, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"Saved benchmark results to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,23 +15,32 @@ DIRECTIONAL_IMAGE_DIR = IMAGE_OUTPUT_DIR / "directional"
 PANORAMIC_IMAGE_DIR = IMAGE_OUTPUT_DIR / "panoramic"
 LOG_DIR = OUTPUT_DIR / "logs"
 TEMP_DIR = DATA_DIR / "temp"
+CACHE_DIR = DATA_DIR / "cache"
 
 # 创建必要的目录
 for directory in [INPUT_DIR, CSV_OUTPUT_DIR, DIRECTIONAL_IMAGE_DIR,
-                  PANORAMIC_IMAGE_DIR, LOG_DIR, TEMP_DIR]:
+                  PANORAMIC_IMAGE_DIR, LOG_DIR, TEMP_DIR, CACHE_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
 
 # 文件配置
 INPUT_CSV_FILE = "采样点.csv"  # 输入文件名
 OUTPUT_CSV_FILE = "爬取结果.csv"       # 输出文件名
+OUTPUT_FORMAT = 'csv'                # 输出文件格式: csv 或 parquet(需安装pyarrow)
+METADATA_FORMAT = 'repr'             # 元数据输出方式: repr(BD_Content为字典字符串) 或 typed(类型化字段+压缩JSON)
 
 # CSV字段配置
 LON_FIELD = 'Lon'          # 经度字段
 LAT_FIELD = 'Lat'          # 纬度字段
 PID_FIELD = 'PID'          # 采样点ID字段
+PASSTHROUGH_FIELDS = None  # 原样写入结果的其他输入字段，None表示保留全部字段
+
+# 输入文件分块读取的行数，采样点文件较大时可控制内存占用
+INPUT_CHUNK_SIZE = 100000
 
 # 百度地图API配置
 BAIDU_API_KEY = ''  # 百度地图API密钥
+# 百度街景接口地址，可通过环境变量MAPSV0_URL指向本地模拟服务器(见benchmark/mock_server.py)
+MAPSV0_URL = os.environ.get('MAPSV0_URL', 'https://mapsv0.bdimg.com/')
 
 # 街景图请求配置
 STREET_VIEW_CONFIG = {
@@ -43,7 +52,22 @@ STREET_VIEW_CONFIG = {
     'pitch': 0,            # 俯仰角
     'width': 500,          # 图像宽度
     'height': 500,         # 图像高度
-    'panorama_zoom': 3     # 全景图缩放级别(1-5)
+    'panorama_zoom': 3,    # 全景图缩放级别(1-5)
+    'panorama_memmap': False,  # True: 全景图画布使用TEMP_DIR下的内存映射文件，适合高缩放级别并行下载多个全景图
+    'tile_retry_rounds': 1,  # 全景图下载完一轮后，只重新下载缺失瓦片的轮数
+    'tile_retry_delay': 2,   # 重新下载缺失瓦片前的等待时间(秒)
+    'max_snap_distance': None  # 采样点与匹配全景图的最大距离(米)，超过时不下载图片，None表示不限制
+}
+
+# 图片目录布局配置
+IMAGE_LAYOUT_CONFIG = {
+    'layout': 'flat',       # flat: 不分目录, hash: 按PID哈希分目录, pid: 按数值PID分桶, grid: 按经纬度网格分目录
+    'depth': 2,             # hash布局的子目录层数
+    'width': 2,             # hash布局每层子目录名的十六进制位数(2位即每层256个子目录)
+    'pid_bucket': 1000,     # pid布局每个子目录包含的PID数量
+    'grid_size': 0.01,      # grid布局的网格边长(度)
+    'manifest': True,       # 是否记录采样点图片清单(PID -> 图片键与路径)
+    'manifest_file': 'manifest.csv'  # 图片清单文件名(位于IMAGE_OUTPUT_DIR)
 }
 
 # HTTP请求配置
@@ -60,6 +84,87 @@ HTTP_CONFIG = {
     }
 }
 
+# 接口限速配置(按qt参数区分接口，并发数量上限见ENGINE_CONFIG['endpoint_limits'])
+RATE_LIMIT_CONFIG = {
+    'adaptive': True,       # True: 根据响应情况自动调整速率与并发(AIMD)，此时不再使用BATCH_DELAY; False: 只限制并发数量
+    'initial_rate': {       # 各接口的初始速率(请求/秒)
+        'qsdata': 10,
+        'sdata': 10,
+        'pr3d': 20,
+        'pdata': 40
+    },
+    'max_rate': {           # 各接口的速率上限(请求/秒)
+        'qsdata': 50,
+        'sdata': 50,
+        'pr3d': 100,
+        'pdata': 200
+    },
+    'min_rate': 0.5,        # 速率下限(请求/秒)
+    'increase_step': 2,     # 请求正常时每秒提高的速率(请求/秒)
+    'decrease_factor': 0.5, # 遇到429/5xx或超时时速率与并发上限的缩减系数
+    'backoff_max': 60       # 重试退避的最长等待时间(秒)
+}
+
+# 对冲请求配置(用于全景图瓦片与街景图片下载)
+HEDGE_CONFIG = {
+    'enabled': False,       # 请求耗时超过近期分位数时发送重复请求，先返回者胜出
+    'percentile': 0.95,     # 发送对冲请求的耗时分位数
+    'min_delay': 0.05,      # 发送对冲请求前的最短等待时间(秒)
+    'max_ratio': 0.05,      # 对冲请求占请求总数的比例上限
+    'burst': 10,            # 短时间内允许集中发送的对冲请求数量
+    'window': 1000,         # 统计耗时分位数的最近成功请求数量
+    'min_samples': 50       # 成功请求数量不足时不发送对冲请求
+}
+
 # 爬取批次配置
 BATCH_SIZE = 50             # 每批处理的采样点数量
-BATCH_DELAY = 5             # 批次之间的延迟(秒)
\ No newline at end of file
+BATCH_DELAY = 5             # 批次之间的延迟(秒)
+
+# 爬取引擎配置
+ENGINE_CONFIG = {
+    'engine': 'sync',       # sync: 逐点串行处理, async: 基于asyncio并发处理
+    'concurrency': 16,      # async引擎同时处理的采样点数量
+    'workers': 1,           # 工作进程数量，大于1时由多个进程处理采样点，主进程负责写入结果与进度
+    'worker_batch_size': 32, # 每次分发给工作进程的采样点数量
+    'download_workers': 32, # 全局图片/瓦片下载线程数(所有采样点共享)
+    'cpu_workers': 0,       # 全景图瓦片解码与JPEG编码进程数，0: 在下载线程内处理, None: 使用全部CPU核心
+    'cpu_max_pending': 64,  # CPU进程池中未完成任务的上限，超过时下载线程等待
+    'endpoint_limits': {    # 各接口同时进行的请求数量上限
+        'qsdata': 8,
+        'sdata': 8,
+        'pr3d': 16,
+        'pdata': 32
+    }
+}
+
+# 本地缓存配置
+CACHE_CONFIG = {
+    'enabled': True,                    # 是否启用本地缓存
+    'pano_id_db': 'pano_id.sqlite',     # 全景图ID缓存文件名(位于CACHE_DIR)
+    'grid_size': 5,                     # 全景图ID缓存的网格边长(百度墨卡托米)
+    'pano_id_ttl': 90 * 24 * 3600,      # 全景图ID缓存有效期(秒)
+    'negative_ttl': 7 * 24 * 3600,      # "无全景图"结果的缓存有效期(秒)
+    'metadata_db': 'metadata.sqlite',   # 全景图元数据缓存文件名(位于CACHE_DIR)
+    'metadata_ttl': 30 * 24 * 3600,     # 全景图元数据缓存有效期(秒)
+    'metadata_max_mb': 1024,            # 全景图元数据缓存大小上限(MB)，超出后淘汰最早写入的记录
+    'image_dedup': True,                # 是否对相同全景图ID与请求参数的图片去重(不再重复下载)
+    'image_db': 'images.sqlite',        # 图片存储索引文件名(位于CACHE_DIR)
+    'image_link_mode': 'hardlink',      # hardlink: 为新采样点创建硬链接(失败时引用已有图片), reference: 直接引用已有图片路径
+    'tile_db': 'tiles.sqlite'           # 不完整全景图的瓦片存储文件名(位于CACHE_DIR)
+}
+
+# 运行指标配置
+METRICS_CONFIG = {
+    'enabled': True,        # 是否统计各接口与各处理阶段的耗时、请求数、错误数与下载字节数
+    'export': None,         # 定期导出格式: None(不导出), 'prometheus'(文本文件，供node_exporter textfile采集) 或 'json'
+    'export_dir': OUTPUT_DIR / "metrics",  # 导出目录
+    'interval': 15          # 导出间隔(秒)
+}
+
+# 分布式爬取配置(--queue)
+DISTRIBUTED_CONFIG = {
+    'queue_batch_size': 500,    # 工作队列中每个批次的采样点数量
+    'lease_seconds': 600,       # 批次租约时长(秒)，节点宕机后租约过期的批次会被其他节点重新领取
+    'heartbeat_interval': 60,   # 节点为已领取批次续租的间隔(秒)
+    'poll_interval': 5          # 其他节点填充工作队列时，检查填充是否完成的间隔(秒)
+}
\ No newline at end of file
@@ -1,6 +1,8 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
 from utils.logger import logger, log_exception
 from .CoordinatesConverterPro import wgs84tobd09ll, bd09lltobd09mc
+from . import coordinate_vectorized
 
 def wgs2bd09mc(wgs_x, wgs_y):
     """将WGS84坐标转换为百度墨卡托坐标
@@ -22,33 +24,112 @@ def wgs2bd09mc(wgs_x, wgs_y):
         log_exception(e, "Failed to convert coordinates")
         return None, None
 
-def batch_convert_coordinates(coordinate_pairs, max_workers=10):
+def bd09mc2wgs(mc_x, mc_y):
+    """将百度墨卡托坐标转换为WGS84坐标
+
+    Args:
+        mc_x: 百度墨卡托x坐标
+        mc_y: 百度墨卡托y坐标
+
+    Returns:
+        tuple: (WGS84经度, WGS84纬度) 或 (None, None)
+    """
+    try:
+        lon, lat = batch_bd09mc2wgs([mc_x], [mc_y])
+        if np.isnan(lon[0]) or np.isnan(lat[0]):
+            return None, None
+        return float(lon[0]), float(lat[0])
+    except Exception as e:
+        log_exception(e, "Failed to convert coordinates")
+        return None, None
+
+def batch_wgs2bd09mc(wgs_x, wgs_y):
+    """批量将WGS84坐标转换为百度墨卡托坐标
+
+    Args:
+        wgs_x: WGS84经度数组(或DataFrame列)
+        wgs_y: WGS84纬度数组(或DataFrame列)
+
+    Returns:
+        tuple: (百度墨卡托x坐标数组, 百度墨卡托y坐标数组)，无效坐标对应位置为NaN
+    """
+    wgs_x = np.asarray(wgs_x, dtype=float)
+    wgs_y = np.asarray(wgs_y, dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        mc_x, mc_y = coordinate_vectorized.wgs84tobd09mc(wgs_x, wgs_y)
+
+    invalid = ~(np.isfinite(wgs_x) & np.isfinite(wgs_y))
+    if invalid.any():
+        logger.warning(f"{int(invalid.sum())} coordinates are invalid and cannot be converted")
+        mc_x[invalid] = np.nan
+        mc_y[invalid] = np.nan
+
+    return mc_x, mc_y
+
+
+def batch_bd09mc2wgs(mc_x, mc_y):
+    """批量将百度墨卡托坐标转换为WGS84坐标(迭代求精的逆变换)
+
+    Args:
+        mc_x: 百度墨卡托x坐标数组
+        mc_y: 百度墨卡托y坐标数组
+
+    Returns:
+        tuple: (WGS84经度数组, WGS84纬度数组)，无效坐标对应位置为NaN
+    """
+    mc_x = np.asarray(mc_x, dtype=float)
+    mc_y = np.asarray(mc_y, dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        return coordinate_vectorized.bd09mctowgs84(mc_x, mc_y)
+
+
+def batch_mc_distance(mc_x1, mc_y1, mc_x2, mc_y2):
+    """批量计算两组百度墨卡托坐标之间的地面距离
+
+    Args:
+        mc_x1: 起点百度墨卡托x坐标数组
+        mc_y1: 起点百度墨卡托y坐标数组
+        mc_x2: 终点百度墨卡托x坐标数组
+        mc_y2: 终点百度墨卡托y坐标数组
+
+    Returns:
+        numpy.ndarray: 距离数组(米)，无效坐标对应位置为NaN
+    """
+    # 两组坐标同在BD09坐标系中，BD09与WGS84之间的偏移在局部近似为常量，不影响距离
+    with np.errstate(invalid='ignore'):
+        lng1, lat1 = coordinate_vectorized.bd09mctobd09ll(mc_x1, mc_y1)
+        lng2, lat2 = coordinate_vectorized.bd09mctobd09ll(mc_x2, mc_y2)
+        return coordinate_vectorized.haversine(lng1, lat1, lng2, lat2)
+
+
+def batch_convert_coordinates(coordinate_pairs, max_workers=None):
     """批量转换坐标
 
     Args:
         coordinate_pairs: 包含(wgs_x, wgs_y)坐标对的列表
-        max_workers: 最大并行工作线程数
+        max_workers: 已弃用，向量化转换无需线程池，保留该参数以兼容旧调用
 
     Returns:
         dict: 映射原始坐标对到转换后的坐标 {(wgs_x, wgs_y): (bd_x, bd_y)}
     """
+    coordinate_pairs = list(coordinate_pairs)
+    if not coordinate_pairs:
+        return {}
+
+    try:
+        wgs_x, wgs_y = zip(*coordinate_pairs)
+        mc_x, mc_y = batch_wgs2bd09mc(wgs_x, wgs_y)
+    except Exception as e:
+        log_exception(e, "Failed to convert coordinates in batch")
+        return {coords: (None, None) for coords in coordinate_pairs}
+
     results = {}
+    for coords, bd_x, bd_y in zip(coordinate_pairs, mc_x.tolist(), mc_y.tolist()):
+        if np.isnan(bd_x) or np.isnan(bd_y):
+            results[coords] = (None, None)
+        else:
+            results[coords] = (bd_x, bd_y)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_coords = {
-            executor.submit(wgs2bd09mc, wgs_x, wgs_y): (wgs_x, wgs_y)
-            for wgs_x, wgs_y in coordinate_pairs
-        }
-
-        # 收集结果
-        for future in as_completed(future_to_coords):
-            coords = future_to_coords[future]
-            try:
-                bd_x, bd_y = future.result()
-                results[coords] = (bd_x, bd_y)
-            except Exception as e:
-                log_exception(e, f"Error processing coordinates {coords}")
-                results[coords] = (None, None)
-
-    return results
\ No newline at end of file
+    return results
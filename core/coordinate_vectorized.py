@@ -0,0 +1,246 @@
+"""坐标转换向量化模块
+
+本模块提供CoordinatesConverterPro中坐标转换函数的NumPy数组版本，可一次性转换整列坐标。
+
+说明:
+    - 各函数的计算过程与CoordinatesConverterPro中的标量函数一一对应，结果在浮点误差范围内一致。
+    - 坐标转换属于CPU密集型计算，向量化后无需再使用线程池并行处理。
+"""
+
+import numpy as np
+
+from .CoordinatesConverterPro import x_pi, pi, a, ee, LLBAND, LL2MC, MCBAND, MC2LL
+
+LL2MC_ARRAY = np.array(LL2MC)
+MC2LL_ARRAY = np.array(MC2LL)
+# 计算距离使用的地球半径(米)，与CalDistance一致
+EARTH_RADIUS = 6378137.0
+
+
+def _as_float_arrays(lng, lat):
+    """将输入转换为一维浮点数组"""
+    lng = np.atleast_1d(np.asarray(lng, dtype=float))
+    lat = np.atleast_1d(np.asarray(lat, dtype=float))
+    return lng, lat
+
+
+def transformlat(lng, lat):
+    ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + \
+        0.1 * lng * lat + 0.2 * np.sqrt(np.fabs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * pi) + 20.0 *
+            np.sin(2.0 * lng * pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lat * pi) + 40.0 *
+            np.sin(lat / 3.0 * pi)) * 2.0 / 3.0
+    ret += (160.0 * np.sin(lat / 12.0 * pi) + 320 *
+            np.sin(lat * pi / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+def transformlng(lng, lat):
+    ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + \
+        0.1 * lng * lat + 0.1 * np.sqrt(np.fabs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * pi) + 20.0 *
+            np.sin(2.0 * lng * pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lng * pi) + 40.0 *
+            np.sin(lng / 3.0 * pi)) * 2.0 / 3.0
+    ret += (150.0 * np.sin(lng / 12.0 * pi) + 300.0 *
+            np.sin(lng / 30.0 * pi)) * 2.0 / 3.0
+    return ret
+
+
+def out_of_china(lng, lat):
+    """
+    判断是否在国内，不在国内不做偏移
+    :param lng:经度数组
+    :param lat:纬度数组
+    :return:布尔数组，True表示在国外
+    """
+    return (lng < 72.004) | (lng > 137.8347) | (lat < 0.8293) | (lat > 55.8271)
+
+
+def wgs84togcj02(lng, lat):
+    """
+    大地坐标系转火星坐标系
+    :param lng:WGS84坐标系经度数组
+    :param lat:WGS84坐标系纬度数组
+    :return:火星坐标系经度数组, 纬度数组
+    """
+    lng, lat = _as_float_arrays(lng, lat)
+    dlat = transformlat(lng - 105.0, lat - 35.0)
+    dlng = transformlng(lng - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * pi
+    magic = np.sin(radlat)
+    magic = 1 - ee * magic * magic
+    sqrtmagic = np.sqrt(magic)
+    dlat = (dlat * 180.0) / ((a * (1 - ee)) / (magic * sqrtmagic) * pi)
+    dlng = (dlng * 180.0) / (a / sqrtmagic * np.cos(radlat) * pi)
+
+    # 国外坐标不做偏移
+    outside = out_of_china(lng, lat)
+    mglng = np.where(outside, lng, lng + dlng)
+    mglat = np.where(outside, lat, lat + dlat)
+    return mglng, mglat
+
+
+def gcj02tobd09ll(lng, lat):
+    """
+    火星坐标系转百度经纬度坐标系
+    :param lng:火星坐标经度数组
+    :param lat:火星坐标纬度数组
+    :return:百度经纬度坐标经度数组, 纬度数组
+    """
+    lng, lat = _as_float_arrays(lng, lat)
+    z = np.sqrt(lng * lng + lat * lat) + 0.00002 * np.sin(lat * x_pi)
+    theta = np.arctan2(lat, lng) + 0.000003 * np.cos(lng * x_pi)
+    bd_lng = z * np.cos(theta) + 0.0065
+    bd_lat = z * np.sin(theta) + 0.006
+    return bd_lng, bd_lat
+
+
+def wgs84tobd09ll(lng, lat):
+    lng, lat = wgs84togcj02(lng, lat)
+    return gcj02tobd09ll(lng, lat)
+
+
+def bd09lltogcj02(bd_lng, bd_lat):
+    """
+    百度经纬度坐标系转火星坐标系
+    :param bd_lng:百度经纬度坐标经度数组
+    :param bd_lat:百度经纬度坐标纬度数组
+    :return:火星坐标系经度数组, 纬度数组
+    """
+    bd_lng, bd_lat = _as_float_arrays(bd_lng, bd_lat)
+    x = bd_lng - 0.0065
+    y = bd_lat - 0.006
+    z = np.sqrt(x * x + y * y) - 0.00002 * np.sin(y * x_pi)
+    theta = np.arctan2(y, x) - 0.000003 * np.cos(x * x_pi)
+    return z * np.cos(theta), z * np.sin(theta)
+
+
+def gcj02towgs84(lng, lat):
+    """
+    火星坐标系转大地坐标系(单步近似逆变换，与标量版本一致)
+    :param lng:火星坐标系经度数组
+    :param lat:火星坐标系纬度数组
+    :return:WGS84坐标系经度数组, 纬度数组
+    """
+    lng, lat = _as_float_arrays(lng, lat)
+    mglng, mglat = wgs84togcj02(lng, lat)
+    return lng * 2 - mglng, lat * 2 - mglat
+
+
+def bd09lltobd09mc(lng, lat):
+    """
+    百度坐标系(bd09ll)转百度墨卡托米制坐标系(bd09mc)
+    :param lng: 百度坐标系经度数组
+    :param lat: 百度坐标系纬度数组
+    :return: 转换后的墨卡托坐标数组(x, y)
+    """
+    lng, lat = _as_float_arrays(lng, lat)
+
+    # 寻找对应的分带参数：取第一个满足 lat >= LLBAND[i] 的分带，均不满足时使用最后一个分带
+    band_index = np.full(lat.shape, len(LLBAND) - 1)
+    for i in reversed(range(len(LLBAND))):
+        band_index[lat >= LLBAND[i]] = i
+    cF = LL2MC_ARRAY[band_index]
+
+    # 计算x坐标
+    x_temp = cF[:, 0] + cF[:, 1] * np.abs(lng)
+    x = np.where(lng < 0, -x_temp, x_temp)
+
+    # 计算y坐标
+    cC = np.abs(lat) / cF[:, 9]
+    y_temp = cF[:, 2] + cF[:, 3] * cC + cF[:, 4] * (cC ** 2) + cF[:, 5] * (cC ** 3) + \
+        cF[:, 6] * (cC ** 4) + cF[:, 7] * (cC ** 5) + cF[:, 8] * (cC ** 6)
+    y = np.where(lat < 0, -y_temp, y_temp)
+
+    return x, y
+
+
+def wgs84tobd09mc(lng, lat):
+    """
+    WGS84坐标系转百度墨卡托米制坐标系(WGS84 -> GCJ02 -> BD09LL -> BD09MC)
+    :param lng: WGS84经度数组
+    :param lat: WGS84纬度数组
+    :return: 百度墨卡托坐标数组(x, y)
+    """
+    bd_lng, bd_lat = wgs84tobd09ll(lng, lat)
+    return bd09lltobd09mc(bd_lng, bd_lat)
+
+
+def bd09mctobd09ll(x, y):
+    """
+    百度墨卡托米制坐标系(bd09mc)转百度坐标系(bd09ll)
+    :param x: 百度墨卡托x坐标数组
+    :param y: 百度墨卡托y坐标数组
+    :return: 百度坐标系经度数组, 纬度数组
+    """
+    x, y = _as_float_arrays(x, y)
+
+    # 寻找对应的分带参数：取第一个满足 |y| > MCBAND[i] 的分带，均不满足时使用最后一个分带
+    abs_y = np.abs(y)
+    band_index = np.full(y.shape, len(MCBAND) - 1)
+    for i in reversed(range(len(MCBAND))):
+        band_index[abs_y > MCBAND[i]] = i
+    cF = MC2LL_ARRAY[band_index]
+
+    # 计算经度
+    lng_temp = cF[:, 0] + cF[:, 1] * np.abs(x)
+    lng = np.where(x < 0, -lng_temp, lng_temp)
+
+    # 计算纬度
+    cC = abs_y / cF[:, 9]
+    lat_temp = cF[:, 2] + cF[:, 3] * cC + cF[:, 4] * (cC ** 2) + cF[:, 5] * (cC ** 3) + \
+        cF[:, 6] * (cC ** 4) + cF[:, 7] * (cC ** 5) + cF[:, 8] * (cC ** 6)
+    lat = np.where(y < 0, -lat_temp, lat_temp)
+
+    return lng, lat
+
+
+def haversine(lng1, lat1, lng2, lat2):
+    """
+    计算两组经纬度之间的球面距离(CalDistance的数组版本)
+    :param lng1: 起点经度数组
+    :param lat1: 起点纬度数组
+    :param lng2: 终点经度数组
+    :param lat2: 终点纬度数组
+    :return: 距离数组(米)
+    """
+    lng1, lat1 = _as_float_arrays(lng1, lat1)
+    lng2, lat2 = _as_float_arrays(lng2, lat2)
+    rad_lat1 = np.radians(lat1)
+    rad_lat2 = np.radians(lat2)
+    dlat = rad_lat1 - rad_lat2
+    dlng = np.radians(lng1) - np.radians(lng2)
+    h = np.sin(dlat / 2) ** 2 + np.cos(rad_lat1) * np.cos(rad_lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def bd09mctowgs84(x, y, tolerance=1e-3, max_iterations=10):
+    """
+    百度墨卡托米制坐标系转大地坐标系(迭代求精的逆变换)
+    以单步近似结果(BD09MC -> BD09LL -> GCJ02 -> WGS84)为初值，在墨卡托坐标中用正向变换的残差修正，
+    同时消除MC2LL拟合多项式与GCJ02单步逆变换的误差，只对尚未收敛的坐标继续迭代。
+    :param x: 百度墨卡托x坐标数组
+    :param y: 百度墨卡托y坐标数组
+    :param tolerance: 收敛阈值(米)
+    :param max_iterations: 最大迭代次数
+    :return: WGS84坐标系经度数组, 纬度数组
+    """
+    x, y = _as_float_arrays(x, y)
+    lng, lat = gcj02towgs84(*bd09lltogcj02(*bd09mctobd09ll(x, y)))
+
+    # 无效坐标(NaN)与正向变换分带范围(纬度75度)以外的坐标不参与迭代，保留单步近似结果
+    active = np.flatnonzero(np.isfinite(lng) & (np.abs(lat) < LLBAND[0]))
+    for _ in range(max_iterations):
+        if not active.size:
+            break
+        forward_x, forward_y = wgs84tobd09mc(lng[active], lat[active])
+        dx = forward_x - x[active]
+        dy = forward_y - y[active]
+        # 百度墨卡托坐标每度经度约111320.7米，每度纬度约111320.7/cos(lat)米
+        lng[active] -= dx / LL2MC_ARRAY[0, 1]
+        lat[active] -= dy * np.cos(np.radians(lat[active])) / LL2MC_ARRAY[0, 1]
+        active = active[np.fmax(np.abs(dx), np.abs(dy)) > tolerance]
+
+    return lng, lat
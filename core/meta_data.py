@@ -1,12 +1,17 @@
 # core/meta_data.py
+import base64
 import json
+import zlib
 from urllib.parse import quote
 
-from config.config import STREET_VIEW_CONFIG
+from config.config import STREET_VIEW_CONFIG, MAPSV0_URL
 from utils.http_client import http_client
+from utils.cache import pano_id_cache, metadata_cache
 from utils.logger import logger, log_exception
+from utils.metrics import metrics
 
 
+@metrics.timed('pano_id')
 def get_panorama_id(bd_x, bd_y):
     """获取全景图ID
 
@@ -21,8 +26,14 @@ def get_panorama_id(bd_x, bd_y):
         logger.warning("Cannot get panorama ID for None coordinates")
         return None
 
+    # 优先查询本地网格缓存
+    cached, panorama_id = pano_id_cache.get(bd_x, bd_y)
+    if cached:
+        logger.debug(f"Panorama ID cache hit for coordinates ({bd_x}, {bd_y}): {panorama_id}")
+        return panorama_id
+
     # 请求接口1
-    url = 'https://mapsv0.bdimg.com/'
+    url = MAPSV0_URL
     params = {
         'qt': 'qsdata',
         'x': bd_x,
@@ -40,44 +51,163 @@ def get_panorama_id(bd_x, bd_y):
 
         if not panorama_id:
             logger.warning(f"No panorama ID found for coordinates ({bd_x}, {bd_y})")
+            pano_id_cache.put(bd_x, bd_y, None)
             return None
 
         logger.debug(f"Found panorama ID: {panorama_id}")
+        pano_id_cache.put(bd_x, bd_y, panorama_id)
         return panorama_id
     except Exception as e:
         log_exception(e, f"Failed to get panorama ID for coordinates ({bd_x}, {bd_y})")
         return None
 
 
-def get_panorama_metadata(panorama_id, target_year=None):
-    """获取全景图元数据
+@metrics.timed('metadata')
+def fetch_panorama_content(panorama_id):
+    """获取全景图的sdata元数据内容，优先使用本地缓存
 
     Args:
         panorama_id: 全景图ID
-        target_year: 目标年份，如果指定则尝试获取该年份的全景图ID
 
     Returns:
-        tuple: (新的全景图ID, 移动方向, 元数据内容) 或 (None, None, None)
+        dict: 元数据内容 或 None
     """
-    if not panorama_id:
-        return None, None, None
+    content = metadata_cache.get(panorama_id)
+    if content is not None:
+        logger.debug(f"Metadata cache hit for ID {panorama_id}")
+        return content
 
     # 请求接口2
-    url = 'https://mapsv0.bdimg.com/'
+    url = MAPSV0_URL
     params = {
         'qt': 'sdata',
         'sid': panorama_id,
         'pc': 1
     }
 
+    response = http_client.get_json(url, params)
+    if not response or 'content' not in response or not response['content']:
+        return None
+
+    content = response['content'][0]
+    metadata_cache.put(panorama_id, content)
+    return content
+
+
+def get_panorama_position(item):
+    """获取sdata中全景图(或Roads/Links中全景图条目)的百度墨卡托坐标
+
+    Args:
+        item: 元数据内容或全景图条目，X、Y为百度墨卡托坐标的100倍
+
+    Returns:
+        tuple: (百度墨卡托x坐标, 百度墨卡托y坐标) 或 (None, None)
+    """
     try:
-        response = http_client.get_json(url, params)
-        if not response or 'content' not in response or not response['content']:
+        return float(item['X']) / 100, float(item['Y']) / 100
+    except (KeyError, TypeError, ValueError):
+        return None, None
+
+
+# typed元数据输出模式中提取的字段及其类型
+METADATA_DTYPES = {
+    'BD_Date': 'datetime64[ns]',
+    'BD_Year': 'Int16',
+    'BD_RoadName': 'string',
+    'BD_X': 'float64',
+    'BD_Y': 'float64',
+    'BD_MoveDir': 'float64',
+    'BD_Heading': 'float64',
+    'BD_TimeLineCount': 'Int16'
+}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_metadata_fields(content):
+    """从sdata元数据中提取类型化字段
+
+    Args:
+        content: 元数据内容
+
+    Returns:
+        dict: 字段名与值，字段见METADATA_DTYPES，缺失的字段为None
+    """
+    if not content:
+        return dict.fromkeys(METADATA_DTYPES)
+
+    # Date形如20210715
+    date = str(content.get('Date') or '')
+    valid_date = len(date) >= 8 and date[:8].isdigit()
+    pano_x, pano_y = get_panorama_position(content)
+    return {
+        'BD_Date': f"{date[:4]}-{date[4:6]}-{date[6:8]}" if valid_date else None,
+        'BD_Year': int(date[:4]) if valid_date else None,
+        'BD_RoadName': content.get('Rname') or None,
+        'BD_X': pano_x,
+        'BD_Y': pano_y,
+        'BD_MoveDir': _to_float(content.get('MoveDir')),
+        'BD_Heading': _to_float(content.get('Heading')),
+        'BD_TimeLineCount': len(content.get('TimeLine') or [])
+    }
+
+
+def encode_content(content, binary=True):
+    """将元数据压缩为zlib压缩的JSON
+
+    Args:
+        content: 元数据内容
+        binary: True返回bytes(用于Parquet)，False返回base64字符串(用于CSV)
+
+    Returns:
+        bytes或str: 压缩后的元数据，content为空时返回None
+    """
+    if not content:
+        return None
+    data = zlib.compress(json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    return data if binary else base64.b64encode(data).decode('ascii')
+
+
+def decode_content(value):
+    """解压encode_content压缩的元数据
+
+    Args:
+        value: bytes(Parquet)或base64字符串(CSV)
+
+    Returns:
+        dict: 元数据内容 或 None
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, str):
+        value = base64.b64decode(value)
+    return json.loads(zlib.decompress(value).decode('utf-8'))
+
+
+def get_panorama_metadata(panorama_id, target_year=None):
+    """获取全景图元数据
+
+    Args:
+        panorama_id: 全景图ID
+        target_year: 目标年份，如果指定则尝试获取该年份的全景图ID
+
+    Returns:
+        tuple: (新的全景图ID, 移动方向, 元数据内容) 或 (None, None, None)
+    """
+    if not panorama_id:
+        return None, None, None
+
+    try:
+        content = fetch_panorama_content(panorama_id)
+        if not content:
             logger.warning(f"No content found in panorama metadata for ID {panorama_id}")
             return None, None, None
 
-        content = response['content'][0]
-
         # 如果指定了目标年份，查找匹配的年份
         if target_year:
             timeline = content.get('TimeLine', [])
@@ -88,7 +218,7 @@ def get_panorama_metadata(panorama_id, target_year=None):
                     matched_id = item.get('ID')
                     logger.debug(f"Found matching year {target_year}, new ID: {matched_id}")
 
-                    # 如果找到匹配的年份，递归获取该年份的元数据
+                    # 如果找到匹配的年份，获取该年份的元数据(已缓存时不再发起请求)
                     if matched_id and matched_id != panorama_id:
                         return get_panorama_metadata(matched_id)
                     break
@@ -103,4 +233,65 @@ def get_panorama_metadata(panorama_id, target_year=None):
         return panorama_id, move_dir, content
     except Exception as e:
         log_exception(e, f"Failed to get panorama metadata for ID {panorama_id}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+
+def get_panorama_captures(panorama_id, target_years='all'):
+    """遍历全景图的TimeLine，获取多个年份的街景采集
+
+    基础元数据只请求一次，各年份采集的元数据通过fetch_panorama_content获取(已缓存时不再发起请求)。
+
+    Args:
+        panorama_id: 全景图ID
+        target_years: 目标年份列表，'all'表示TimeLine中的全部年份
+
+    Returns:
+        list: 采集信息字典列表，包含year、timeline、id、move_dir、content；
+              获取基础元数据失败时返回None
+    """
+    if not panorama_id:
+        return None
+
+    try:
+        base_content = fetch_panorama_content(panorama_id)
+        if not base_content:
+            logger.warning(f"No content found in panorama metadata for ID {panorama_id}")
+            return None
+
+        timeline = base_content.get('TimeLine') or [{
+            'ID': panorama_id,
+            'Year': str(base_content.get('Date', ''))[:4],
+            'TimeLine': base_content.get('Time')
+        }]
+        years = None if target_years == 'all' else {str(year) for year in target_years}
+
+        captures = []
+        seen_ids = set()
+        for item in timeline:
+            capture_id = item.get('ID')
+            year = item.get('Year')
+            if not capture_id or capture_id in seen_ids:
+                continue
+            if years is not None and year not in years:
+                continue
+            seen_ids.add(capture_id)
+
+            try:
+                content = base_content if capture_id == panorama_id else fetch_panorama_content(capture_id)
+            except Exception as e:
+                log_exception(e, f"Failed to get panorama metadata for ID {capture_id}")
+                content = None
+
+            captures.append({
+                'year': year,
+                'timeline': item.get('TimeLine') or year,
+                'id': capture_id,
+                'move_dir': content.get('MoveDir') if content else None,
+                'content': content
+            })
+
+        logger.debug(f"Found {len(captures)} captures in TimeLine of {panorama_id}")
+        return captures
+    except Exception as e:
+        log_exception(e, f"Failed to get panorama captures for ID {panorama_id}")
+        return None
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""多进程爬取引擎
+
+本模块启动多个工作进程处理采样点，避免单个进程中JSONP解析、图片处理与日志等工作争用GIL。
+
+说明:
+    - 主进程按批向工作进程分发采样点，只有主进程写入结果与进度，结果按输入顺序回调。
+    - 每个工作进程有独立的HttpClient连接池与限速器，各接口的速率与并发上限按进程数平分，合计不超过配置值。
+    - 工作进程内部按所选引擎(sync/async)处理一批采样点，处理完成后将指标与缓存命中统计汇总到主进程。
+"""
+
+import os
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from config.config import ENGINE_CONFIG, HEDGE_CONFIG
+from core.async_engine import run_async_engine
+from utils.cache import pano_id_cache, metadata_cache, image_store
+from utils.executor import safe_mp_context
+from utils.http_client import http_client
+from utils.image_layout import existing_images
+from utils.logger import logger
+from utils.metrics import metrics
+
+_CACHES = {'pano_id': pano_id_cache, 'metadata': metadata_cache, 'image': image_store}
+
+# 各工作进程最近一次上报的限速状态 {进程ID: {接口: 状态}}
+_worker_rate_stats = {}
+
+
+def _init_worker(engine_config, hedge_config, rate_share, existing_paths):
+    """工作进程初始化: 同步引擎配置与已有图片索引，重建HTTP连接池与限速器"""
+    # 中断由主进程处理，工作进程只需处理完当前批次
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    ENGINE_CONFIG.update(engine_config)
+    HEDGE_CONFIG.update(hedge_config)
+    # 多进程已经占用了CPU核心，工作进程内不再创建CPU进程池
+    ENGINE_CONFIG['cpu_workers'] = 0
+    http_client.reset(rate_share)
+    existing_images.restore(existing_paths)
+
+
+def _process_batch(rows, process_fn, engine, concurrency):
+    """在工作进程中处理一批采样点
+
+    Returns:
+        tuple: (按输入顺序排列的处理结果列表, 指标与统计)
+    """
+    if engine == 'async':
+        results = []
+        run_async_engine(enumerate(rows), process_fn, min(concurrency, len(rows)),
+                         lambda row, result: results.append(result))
+    else:
+        results = [process_fn(row) for row in rows]
+
+    stats = {
+        'pid': os.getpid(),
+        'metrics': metrics.drain(),
+        'caches': {name: cache.drain_stats() for name, cache in _CACHES.items()},
+        'existing_images': existing_images.drain_stats(),
+        'rate_stats': http_client.rate_stats()
+    }
+    return results, stats
+
+
+def _merge_stats(stats):
+    """将工作进程的指标与统计合并到主进程"""
+    metrics.merge(stats['metrics'])
+    for name, (hits, misses) in stats['caches'].items():
+        _CACHES[name].merge_stats(hits, misses)
+    existing_images.merge_stats(*stats['existing_images'])
+    _worker_rate_stats[stats['pid']] = stats['rate_stats']
+
+
+def worker_rate_stats():
+    """返回所有工作进程合计的限速状态(速率与并发为各进程之和)"""
+    totals = {}
+    for endpoints in _worker_rate_stats.values():
+        for endpoint, stats in endpoints.items():
+            total = totals.setdefault(endpoint, {'rate': 0, 'concurrency': 0, 'in_flight': 0,
+                                                 'successes': 0, 'throttles': 0})
+            for key, value in stats.items():
+                if key == 'rate' and (value is None or total['rate'] is None):
+                    total['rate'] = None
+                else:
+                    total[key] += value
+    for total in totals.values():
+        if total['rate'] is not None:
+            total['rate'] = round(total['rate'], 2)
+    return totals
+
+
+def run_multiprocess_engine(rows, process_fn, workers, batch_size, engine, concurrency, on_result):
+    """使用多个工作进程处理采样点
+
+    Args:
+        rows: 可迭代的采样点数据(通常为DataFrame.iterrows())
+        process_fn: 处理单个采样点的函数，参数为row，返回处理结果(需可被pickle)
+        workers: 工作进程数量
+        batch_size: 每次分发给工作进程的采样点数量
+        engine: 工作进程内的引擎，sync或async
+        concurrency: async引擎在每个工作进程内同时处理的采样点数量
+        on_result: 结果回调函数，参数为(row, result)
+    """
+    logger.info(f"Multiprocess engine started with {workers} workers ({engine} engine, batch size {batch_size})")
+    _worker_rate_stats.clear()
+    rows = (row for _, row in rows)
+    # 已分发但尚未回调的批次上限，保证每个工作进程处理时都有下一批在排队
+    max_pending = workers * 2
+    pending = deque()
+
+    def emit_head():
+        batch, future = pending.popleft()
+        results, stats = future.result()
+        _merge_stats(stats)
+        for row, result in zip(batch, results):
+            on_result(row, result)
+
+    # 主进程中已经运行着日志、指标导出与心跳等线程，fork可能复制其他线程持有的锁而死锁
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=safe_mp_context(), initializer=_init_worker,
+                                   initargs=(dict(ENGINE_CONFIG), dict(HEDGE_CONFIG), 1 / workers,
+                                             existing_images.snapshot()))
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            if len(pending) >= max_pending:
+                emit_head()
+
+            pending.append((batch, executor.submit(_process_batch, batch, process_fn, engine, concurrency)))
+
+            # 尽早回调已经完成的批次
+            while pending and pending[0][1].done():
+                emit_head()
+
+        while pending:
+            emit_head()
+    except BaseException:
+        # 中断时取消尚未开始的批次，已完成批次的结果已经回调
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
@@ -1,13 +1,17 @@
 # core/panorama.py
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from pathlib import Path
 
-from config.config import STREET_VIEW_CONFIG, PANORAMIC_IMAGE_DIR
+from config.config import STREET_VIEW_CONFIG, PANORAMIC_IMAGE_DIR, TEMP_DIR, MAPSV0_URL
+from utils.cache import image_store, tile_store
+from utils.executor import get_download_executor, get_cpu_executor
 from utils.http_client import http_client
-from utils.image_utils import save_image, stitch_tiles
+from utils.image_layout import image_layout, image_manifest, existing_images
+from utils.image_utils import TileCanvas
 from utils.logger import logger, log_exception
+from utils.metrics import metrics
 
 
 def calculate_tile_info(zoom_level):
@@ -47,7 +51,7 @@ def download_panorama_tile(panorama_id, row, col, zoom_level):
         tuple: ((row, col), 瓦片数据) 或 ((row, col), None)
     """
     # 请求接口4
-    url = 'https://mapsv0.bdimg.com/'
+    url = MAPSV0_URL
     params = {
         'qt': 'pdata',
         'sid': panorama_id,
@@ -57,15 +61,44 @@ def download_panorama_tile(panorama_id, row, col, zoom_level):
     }
 
     try:
-        image_data = http_client.get_image(url, params)
+        image_data = http_client.get_image(url, params, hedge=True)
         return (row, col), image_data
     except Exception as e:
         log_exception(e, f"Failed to download panorama tile ({row}, {col}) for ID {panorama_id}")
         return (row, col), None
 
 
-def download_panorama(panorama_id, pid, lon, lat, zoom_level=3):
-    """下载并拼接全景图
+def download_tile_to_canvas(panorama_id, row, col, zoom_level, canvas, image_key=None):
+    """下载全景图瓦片并立即拼接到画布，瓦片数据拼接后即释放
+
+    Args:
+        panorama_id: 全景图ID
+        row: 行索引
+        col: 列索引
+        zoom_level: 缩放级别
+        canvas: TileCanvas画布
+        image_key: 图片键，不为None时将瓦片写入TileStore，全景图不完整时之后只需下载缺失的瓦片
+
+    Returns:
+        tuple: ((row, col), 是否成功)
+    """
+    position, tile_data = download_panorama_tile(panorama_id, row, col, zoom_level)
+    if not tile_data:
+        return position, False
+
+    if image_key:
+        tile_store.add(image_key, position, tile_data)
+    try:
+        canvas.paste(row, col, tile_data)
+        return position, True
+    except Exception as e:
+        log_exception(e, f"Failed to decode panorama tile ({row}, {col}) for ID {panorama_id}")
+        return position, False
+
+
+@metrics.timed('panorama')
+def download_panorama(panorama_id, pid, lon, lat, zoom_level=3, tag=None):
+    """下载并拼接全景图，相同全景图ID与缩放级别的全景图只下载一次
 
     Args:
         panorama_id: 全景图ID
@@ -73,66 +106,137 @@ def download_panorama(panorama_id, pid, lon, lat, zoom_level=3):
         lon: 经度
         lat: 纬度
         zoom_level: 缩放级别
+        tag: 文件名标记(如采集时间)，用于区分同一采样点的多个年份
 
     Returns:
-        str: 保存的图片文件路径 或 None
+        tuple: (保存的图片文件路径 或 None, 是否为不完整全景图(部分瓦片重试后仍下载失败))
     """
     if not panorama_id:
         logger.warning(f"Cannot download panorama for None panorama_id")
-        return None
+        return None, False
+
+    if tag:
+        file_name = f"{pid}_{tag}_{lon}_{lat}.jpg"
+    else:
+        file_name = f"{pid}_{lon}_{lat}.jpg"
+    file_path = image_layout.image_path(PANORAMIC_IMAGE_DIR, file_name, pid, lon, lat)
+    image_key = f"pdata:{panorama_id}:{zoom_level}"
+
+    # 断点续传时上次运行已完整保存的全景图无需再次下载
+    if existing_images.lookup(file_path):
+        logger.info(f"Skipped existing panorama image: {file_name}")
+        image_path = image_layout.result_path(file_path)
+        image_manifest.record(pid, tag, image_key, image_path)
+        return image_path, False
+
+    status, value = image_store.reserve(image_key)
+    while status == 'wait':
+        # 其他采样点正在下载同一全景图，对方下载失败时重新占用下载权并自行下载
+        value = image_store.wait(image_key, value)
+        status, value = ('hit', value) if value else image_store.reserve(image_key)
+    incomplete = False
+    if status == 'hit':
+        logger.info(f"Reused panorama image for {file_name}")
+        saved_path = image_store.materialize(value, file_path)
+    else:
+        saved_path, incomplete = stitch_panorama(panorama_id, file_path, zoom_level, image_key)
+        if saved_path:
+            image_store.put(image_key, saved_path)
+        else:
+            # 不完整的全景图留给后续采样点，只下载缺失的瓦片
+            image_store.release(image_key)
 
-    # 创建保存图片的目录
-    os.makedirs(PANORAMIC_IMAGE_DIR, exist_ok=True)
+    if not saved_path:
+        return None, incomplete
 
-    # 计算瓦片行列数
-    rows, cols = calculate_tile_info(zoom_level)
+    image_path = image_layout.result_path(saved_path)
+    image_manifest.record(pid, tag, image_key, image_path)
+    return image_path, False
 
-    # 下载所有瓦片
-    tiles = {}
-    futures = []
-
-    with ThreadPoolExecutor(max_workers=rows * cols) as executor:
-        # 提交下载任务
-        for row in range(rows):
-            for col in range(cols):
-                future = executor.submit(
-                    download_panorama_tile,
-                    panorama_id,
-                    row,
-                    col,
-                    zoom_level
-                )
-                futures.append(future)
-
-        # 收集结果
-        for future in as_completed(futures):
-            try:
-                position, tile_data = future.result()
-                if tile_data:
-                    tiles[position] = tile_data
-            except Exception as e:
-                log_exception(e, "Error processing panorama tile")
-
-    # 检查是否所有瓦片都下载成功
-    if len(tiles) != rows * cols:
-        logger.warning(f"Not all tiles downloaded ({len(tiles)}/{rows * cols})")
 
-    try:
-        # 拼接瓦片
-        if tiles:
-            panorama = stitch_tiles(tiles, rows, cols)
+def stitch_panorama(panorama_id, file_path, zoom_level=3, image_key=None):
+    """下载全景图瓦片并拼接保存
+
+    先恢复TileStore中已保存的瓦片，再下载其余瓦片；一轮下载后只重新下载缺失的瓦片。
+    下载的瓦片逐块写入TileStore，内存中不保留瓦片数据。重试后仍有瓦片缺失时不保存全景图，
+    而是在TileStore中记录缺失的瓦片，之后只需下载缺失的瓦片；全景图完整保存后删除其瓦片。
+
+    Args:
+        panorama_id: 全景图ID
+        file_path: 保存路径
+        zoom_level: 缩放级别
+        image_key: 图片键，用于保存与恢复瓦片，None时不保存瓦片
 
-            # 保存拼接后的全景图
-            file_name = f"{pid}_{lon}_{lat}.jpg"
-            file_path = PANORAMIC_IMAGE_DIR / file_name
+    Returns:
+        tuple: (保存的图片文件路径 或 None, 是否为不完整全景图)
+    """
+    # 计算瓦片行列数
+    rows, cols = calculate_tile_info(zoom_level)
 
-            panorama.save(file_path, "JPEG", quality=95)
-            logger.info(f"Saved panorama image: {file_name}")
+    # 下载所有瓦片，每块瓦片下载后立即拼接到画布
+    memmap_dir = TEMP_DIR if STREET_VIEW_CONFIG['panorama_memmap'] else None
+    canvas = TileCanvas(rows, cols, memmap_dir=memmap_dir, processes=get_cpu_executor() is not None)
+    executor = get_download_executor()
 
-            return str(file_path)
-        else:
+    restored = tile_store.load(image_key) if image_key else None
+    try:
+        if restored:
+            logger.info(f"Restored {len(restored)}/{rows * cols} tiles for panorama ID {panorama_id}")
+            for (row, col), tile_data in restored.items():
+                try:
+                    canvas.paste(row, col, tile_data)
+                except Exception as e:
+                    log_exception(e, f"Failed to decode stored tile ({row}, {col}) for ID {panorama_id}")
+            canvas.wait()
+
+        positions = canvas.missing()
+        for attempt in range(STREET_VIEW_CONFIG['tile_retry_rounds'] + 1):
+            if not positions:
+                break
+            if attempt:
+                logger.info(f"Retrying {len(positions)} missing tiles for panorama ID {panorama_id}")
+                metrics.inc('tile_retries_total', len(positions))
+                time.sleep(STREET_VIEW_CONFIG['tile_retry_delay'])
+
+            # 提交下载任务
+            futures = [
+                executor.submit(download_tile_to_canvas, panorama_id, row, col, zoom_level, canvas, image_key)
+                for row, col in positions
+            ]
+
+            # 等待全部瓦片完成
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    log_exception(e, "Error processing panorama tile")
+
+            # 等待进程池中的瓦片解码完成
+            canvas.wait()
+            positions = canvas.missing()
+
+        tile_count = len(canvas.filled)
+        if not tile_count:
             logger.warning(f"No tiles downloaded for panorama ID {panorama_id}")
-            return None
+            if image_key:
+                tile_store.complete(image_key)
+            return None, False
+
+        if positions:
+            logger.warning(f"Panorama ID {panorama_id} is incomplete, missing tiles: {positions}")
+            if image_key:
+                tile_store.mark_incomplete(image_key, positions)
+            return None, True
+
+        # 保存拼接后的全景图
+        canvas.save(file_path, quality=95)
+        logger.info(f"Saved panorama image: {file_path.name}")
+        if image_key:
+            tile_store.complete(image_key)
+
+        return str(file_path), False
     except Exception as e:
         log_exception(e, f"Failed to stitch and save panorama for ID {panorama_id}")
-        return None
\ No newline at end of file
+        return None, False
+    finally:
+        canvas.close()
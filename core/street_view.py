@@ -1,13 +1,16 @@
 # core/street_view.py
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from config.config import STREET_VIEW_CONFIG, DIRECTIONAL_IMAGE_DIR
+from config.config import STREET_VIEW_CONFIG, DIRECTIONAL_IMAGE_DIR, MAPSV0_URL
+from utils.cache import image_store
+from utils.executor import get_download_executor
 from utils.http_client import http_client
+from utils.image_layout import image_layout, image_manifest, existing_images
 from utils.image_utils import save_image
 from utils.logger import logger, log_exception
+from utils.metrics import metrics
 
 
 def calculate_headings(move_dir, use_move_dir=True):
@@ -57,7 +60,7 @@ def download_street_view_image(panorama_id, heading, pitch=0, fovy=90, quality=1
         bytes: 图片数据 或 None
     """
     # 请求接口3
-    url = 'https://mapsv0.bdimg.com/'
+    url = MAPSV0_URL
     params = {
         'qt': 'pr3d',
         'fovy': fovy,
@@ -71,14 +74,15 @@ def download_street_view_image(panorama_id, heading, pitch=0, fovy=90, quality=1
     }
 
     try:
-        image_data = http_client.get_image(url, params)
+        image_data = http_client.get_image(url, params, hedge=True)
         return image_data
     except Exception as e:
         log_exception(e, f"Failed to download street view image for ID {panorama_id}, heading {heading}")
         return None
 
 
-def download_directional_images(panorama_id, move_dir, pid, lon, lat, use_move_dir=True):
+@metrics.timed('directional_images')
+def download_directional_images(panorama_id, move_dir, pid, lon, lat, use_move_dir=True, tag=None):
     """下载四个方向的街景图片
 
     Args:
@@ -88,6 +92,7 @@ def download_directional_images(panorama_id, move_dir, pid, lon, lat, use_move_d
         lon: 经度
         lat: 纬度
         use_move_dir: 是否根据移动方向计算heading
+        tag: 文件名标记(如采集时间)，用于区分同一采样点的多个年份
 
     Returns:
         list: 成功下载的图片文件路径
@@ -99,41 +104,103 @@ def download_directional_images(panorama_id, move_dir, pid, lon, lat, use_move_d
     # 计算四个方向的heading
     headings = calculate_headings(move_dir, use_move_dir)
 
-    # 创建保存图片的目录
-    os.makedirs(DIRECTIONAL_IMAGE_DIR, exist_ok=True)
+    pitch = STREET_VIEW_CONFIG['pitch']
+    fovy = STREET_VIEW_CONFIG['fovy']
+    quality = STREET_VIEW_CONFIG['quality']
+    width = STREET_VIEW_CONFIG['width']
+    height = STREET_VIEW_CONFIG['height']
 
-    downloaded_files = []
+    saved_paths = {}
+    image_keys = {}
     futures = []
-
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        # 提交下载任务
-        for heading in headings:
-            future = executor.submit(
-                download_street_view_image,
-                panorama_id,
-                heading,
-                STREET_VIEW_CONFIG['pitch'],
-                STREET_VIEW_CONFIG['fovy'],
-                STREET_VIEW_CONFIG['quality'],
-                STREET_VIEW_CONFIG['width'],
-                STREET_VIEW_CONFIG['height']
-            )
-            futures.append((future, heading))
-
-        # 处理结果
-        for future, heading in futures:
-            try:
-                image_data = future.result()
-                if image_data:
-                    file_name = f"{pid}_{heading:.1f}_{lon}_{lat}.jpg"
-                    file_path = DIRECTIONAL_IMAGE_DIR / file_name
-
-                    if save_image(image_data, file_path):
-                        downloaded_files.append(str(file_path))
-                        logger.info(f"Downloaded street view image: {file_name}")
-                    else:
-                        logger.warning(f"Failed to save street view image: {file_name}")
-            except Exception as e:
-                log_exception(e, f"Error processing image for heading {heading}")
-
-    return downloaded_files
\ No newline at end of file
+    waiting = []
+    executor = get_download_executor()
+
+    # 提交下载任务，已下载过的图片直接复用
+    for heading in headings:
+        if tag:
+            file_name = f"{pid}_{tag}_{heading:.1f}_{lon}_{lat}.jpg"
+        else:
+            file_name = f"{pid}_{heading:.1f}_{lon}_{lat}.jpg"
+        file_path = image_layout.image_path(DIRECTIONAL_IMAGE_DIR, file_name, pid, lon, lat)
+        image_key = f"pr3d:{panorama_id}:{heading:.1f}:{pitch}:{fovy}:{quality}:{width}x{height}"
+        image_keys[heading] = image_key
+
+        # 断点续传时上次运行已完整保存的图片无需再次下载
+        if existing_images.lookup(file_path):
+            saved_paths[heading] = str(file_path)
+            logger.info(f"Skipped existing street view image: {file_name}")
+            continue
+
+        status, value = image_store.reserve(image_key)
+        if status == 'hit':
+            saved_paths[heading] = image_store.materialize(value, file_path)
+            logger.info(f"Reused street view image for {file_name}")
+            continue
+        if status == 'wait':
+            waiting.append((heading, image_key, value, file_path))
+            continue
+
+        future = executor.submit(
+            download_street_view_image,
+            panorama_id,
+            heading,
+            pitch,
+            fovy,
+            quality,
+            width,
+            height
+        )
+        futures.append((future, heading, image_key, file_path))
+
+    # 处理结果
+    for future, heading, image_key, file_path in futures:
+        saved = False
+        try:
+            image_data = future.result()
+            if image_data:
+                if save_image(image_data, file_path):
+                    saved = True
+                    saved_paths[heading] = str(file_path)
+                    logger.info(f"Downloaded street view image: {file_path.name}")
+                else:
+                    logger.warning(f"Failed to save street view image: {file_path.name}")
+        except Exception as e:
+            log_exception(e, f"Error processing image for heading {heading}")
+        finally:
+            if saved:
+                image_store.put(image_key, file_path)
+            else:
+                image_store.release(image_key)
+
+    # 等待其他采样点正在下载的相同图片，对方下载失败时重新占用下载权并自行下载
+    for heading, image_key, event, file_path in waiting:
+        status, value = 'wait', event
+        while status == 'wait':
+            value = image_store.wait(image_key, value)
+            status, value = ('hit', value) if value else image_store.reserve(image_key)
+        if status == 'hit':
+            saved_paths[heading] = image_store.materialize(value, file_path)
+            logger.info(f"Reused street view image for {file_path.name}")
+            continue
+
+        saved = False
+        try:
+            image_data = download_street_view_image(panorama_id, heading, pitch, fovy, quality, width, height)
+            if image_data and save_image(image_data, file_path):
+                saved = True
+                saved_paths[heading] = str(file_path)
+                logger.info(f"Downloaded street view image: {file_path.name}")
+        finally:
+            if saved:
+                image_store.put(image_key, file_path)
+            else:
+                image_store.release(image_key)
+
+    image_paths = []
+    for heading in headings:
+        if heading in saved_paths:
+            image_path = image_layout.result_path(saved_paths[heading])
+            image_manifest.record(pid, tag, image_keys[heading], image_path)
+            image_paths.append(image_path)
+    return image_paths
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""路网遍历模块
+
+本模块从种子采样点出发，沿sdata元数据中的道路(Roads/Panos)与连接(Links)关系广度优先遍历全景图，
+只保留位于指定范围(矩形或多边形)内的全景图，并按全景图ID去重。
+
+说明:
+    - 只有种子采样点需要qsdata查询全景图ID，其余全景图直接由相邻全景图的sdata得到。
+    - sdata中的X、Y为百度墨卡托坐标的100倍，范围判断在百度墨卡托坐标系中进行。
+    - 同一层的全景图并发获取元数据，各接口的并发请求上限由HttpClient统一控制。
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from core.coordinate import batch_wgs2bd09mc
+from core.meta_data import get_panorama_id, fetch_panorama_content, get_panorama_position
+from utils.logger import logger, log_exception
+
+
+def _ring_contains(ring, x, y):
+    """射线法判断点是否在多边形环内"""
+    xs, ys = ring[:, 0], ring[:, 1]
+    xs_next, ys_next = np.roll(xs, -1), np.roll(ys, -1)
+    crosses = (ys > y) != (ys_next > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intersect_x = xs + (y - ys) * (xs_next - xs) / (ys_next - ys)
+    return bool(np.count_nonzero(crosses & (x < intersect_x)) % 2)
+
+
+class TraverseArea:
+    """遍历范围(百度墨卡托坐标系中的一个或多个多边形)"""
+
+    def __init__(self, polygons):
+        """
+        Args:
+            polygons: 多边形列表，每个多边形为WGS84坐标环的列表(第一个为外环，其余为内环)
+        """
+        self.polygons = []
+        for rings in polygons:
+            converted = []
+            for ring in rings:
+                ring = np.asarray(ring, dtype=float)
+                mc_x, mc_y = batch_wgs2bd09mc(ring[:, 0], ring[:, 1])
+                converted.append(np.column_stack([mc_x, mc_y]))
+            self.polygons.append(converted)
+
+        outer = np.vstack([rings[0] for rings in self.polygons])
+        self.min_x, self.min_y = outer.min(axis=0)
+        self.max_x, self.max_y = outer.max(axis=0)
+
+    @classmethod
+    def from_bbox(cls, min_lon, min_lat, max_lon, max_lat):
+        """由WGS84经纬度矩形创建范围"""
+        ring = [(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]
+        return cls([[ring]])
+
+    @classmethod
+    def from_geojson(cls, file_path):
+        """由GeoJSON文件(Polygon/MultiPolygon，或包含它们的Feature/FeatureCollection)创建范围"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        geometries = []
+        if data.get('type') == 'FeatureCollection':
+            geometries = [feature.get('geometry') for feature in data.get('features', [])]
+        elif data.get('type') == 'Feature':
+            geometries = [data.get('geometry')]
+        else:
+            geometries = [data]
+
+        polygons = []
+        for geometry in geometries:
+            if not geometry:
+                continue
+            if geometry.get('type') == 'Polygon':
+                polygons.append(geometry['coordinates'])
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons.extend(geometry['coordinates'])
+
+        if not polygons:
+            raise ValueError(f"No Polygon or MultiPolygon found in {file_path}")
+        return cls(polygons)
+
+    def contains(self, x, y):
+        """判断百度墨卡托坐标是否在范围内"""
+        if x is None or y is None or not (self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y):
+            return False
+        for rings in self.polygons:
+            if _ring_contains(rings[0], x, y) and not any(_ring_contains(hole, x, y) for hole in rings[1:]):
+                return True
+        return False
+
+
+def panorama_neighbours(content):
+    """从sdata元数据中提取相邻全景图
+
+    Args:
+        content: sdata元数据内容
+
+    Returns:
+        list: [(全景图ID, 百度墨卡托x坐标, 百度墨卡托y坐标)]
+    """
+    neighbours = []
+    for road in content.get('Roads') or []:
+        for pano in road.get('Panos') or []:
+            if pano.get('PID'):
+                neighbours.append((pano['PID'], *get_panorama_position(pano)))
+    for link in content.get('Links') or []:
+        if link.get('PID'):
+            neighbours.append((link['PID'], *get_panorama_position(link)))
+    return neighbours
+
+
+def _fetch_content(panorama_id):
+    try:
+        return fetch_panorama_content(panorama_id)
+    except Exception as e:
+        log_exception(e, f"Failed to get panorama metadata for ID {panorama_id}")
+        return None
+
+
+def traverse_panoramas(seeds, area, concurrency=8, max_panoramas=None, skip_ids=None, seed_batch_size=1000):
+    """从种子采样点出发广度优先遍历范围内的全景图
+
+    种子按批读取，一批种子出发的全景图遍历完成后再读取下一批，内存占用与种子数量无关。
+
+    Args:
+        seeds: 种子采样点的迭代器，元素为(种子PID, 百度墨卡托x坐标, 百度墨卡托y坐标)
+        area: TraverseArea遍历范围
+        concurrency: 同时获取元数据的全景图数量
+        max_panoramas: 最多产出的全景图数量，None表示不限制
+        skip_ids: 不再产出的全景图ID(断点续传时已处理的全景图)，这些全景图仍会用于继续遍历
+        seed_batch_size: 每批读取的种子数量
+
+    Yields:
+        dict: 全景图信息 {id, x, y, seed, depth, content}
+    """
+    skip_ids = skip_ids or set()
+    visited = set()
+    produced = 0
+    seeds = iter(seeds)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='traverse') as executor:
+        while True:
+            batch = list(islice(seeds, seed_batch_size))
+            if not batch:
+                break
+
+            # 查询种子采样点的全景图ID，之前的种子已经遍历到的全景图不再作为新的起点
+            batch = [(seed_pid, x, y) for seed_pid, x, y in batch if x is not None and y is not None]
+            seed_ids = executor.map(lambda seed: get_panorama_id(seed[1], seed[2]), batch)
+            frontier = []
+            for (seed_pid, _, _), panorama_id in zip(batch, seed_ids):
+                if panorama_id and panorama_id not in visited:
+                    visited.add(panorama_id)
+                    frontier.append((panorama_id, seed_pid))
+            logger.info(f"Traversal started from {len(frontier)} seed panoramas")
+
+            depth = 0
+            while frontier:
+                next_frontier = []
+                contents = executor.map(_fetch_content, [panorama_id for panorama_id, _ in frontier])
+                for (panorama_id, seed_pid), content in zip(frontier, contents):
+                    if not content:
+                        logger.warning(f"No metadata for panorama {panorama_id}, cannot expand it")
+                        continue
+
+                    x, y = get_panorama_position(content)
+                    inside = area.contains(x, y)
+                    # 种子全景图在范围外时仍沿其相邻全景图进入范围，但不产出
+                    if inside and panorama_id not in skip_ids:
+                        yield {'id': panorama_id, 'x': x, 'y': y, 'seed': seed_pid, 'depth': depth, 'content': content}
+                        produced += 1
+                        if max_panoramas and produced >= max_panoramas:
+                            logger.info(f"Reached the limit of {max_panoramas} panoramas, traversal stopped")
+                            return
+
+                    for neighbour_id, nx, ny in panorama_neighbours(content):
+                        if neighbour_id not in visited and area.contains(nx, ny):
+                            visited.add(neighbour_id)
+                            next_frontier.append((neighbour_id, seed_pid))
+
+                depth += 1
+                frontier = next_frontier
+                logger.info(f"Traversal depth {depth}: {len(frontier)} panoramas in frontier, {len(visited)} discovered")
@@ -2,7 +2,15 @@
 import os
 import sys
 import time
+import unicodedata
+import signal
 import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
@@ -11,15 +19,79 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from config.config import (
-    INPUT_DIR, CSV_OUTPUT_DIR, TEMP_DIR, INPUT_CSV_FILE, OUTPUT_CSV_FILE,
-    LON_FIELD, LAT_FIELD, PID_FIELD, STREET_VIEW_CONFIG, BATCH_SIZE, BATCH_DELAY
+    INPUT_DIR, CSV_OUTPUT_DIR, TEMP_DIR, INPUT_CSV_FILE, OUTPUT_CSV_FILE, OUTPUT_FORMAT, METADATA_FORMAT,
+    LON_FIELD, LAT_FIELD, PID_FIELD, PASSTHROUGH_FIELDS, INPUT_CHUNK_SIZE,
+    STREET_VIEW_CONFIG, BATCH_SIZE, BATCH_DELAY, ENGINE_CONFIG, RATE_LIMIT_CONFIG, HEDGE_CONFIG, METRICS_CONFIG,
+    DISTRIBUTED_CONFIG
 )
 from utils.logger import logger, log_exception
-from utils.file_io import read_csv, save_csv, load_progress, save_progress
-from core.coordinate import wgs2bd09mc
-from core.meta_data import get_panorama_id, get_panorama_metadata
+from utils.file_io import read_csv, read_input_columns, iter_input_chunks, ProgressJournal
+from utils.result_writer import PartitionedResultWriter, merge_result_files
+from utils.work_queue import WorkQueue, shard_mask
+from core.coordinate import wgs2bd09mc, batch_wgs2bd09mc, bd09mc2wgs, batch_bd09mc2wgs, batch_mc_distance
+from core.meta_data import (
+    get_panorama_id, get_panorama_metadata, get_panorama_captures, get_panorama_position,
+    extract_metadata_fields, encode_content, METADATA_DTYPES
+)
 from core.street_view import download_directional_images
 from core.panorama import download_panorama
+from core.async_engine import run_async_engine
+from core.multiprocess_engine import run_multiprocess_engine, worker_rate_stats
+from core.traverse import TraverseArea, traverse_panoramas
+from utils.cache import pano_id_cache, metadata_cache, image_store, tile_store
+from utils.http_client import http_client
+from utils.image_layout import image_manifest, existing_images
+from utils.executor import shutdown_download_executor, shutdown_cpu_executor, shutdown_hedge_executor
+from utils.metrics import metrics, MetricsExporter
+
+# 预先批量转换的百度墨卡托坐标列，仅供内部处理使用，不写入结果
+COORD_COLUMNS = ['_bd_x', '_bd_y']
+# 处理过程中附加的内部字段，不写入结果
+INTERNAL_COLUMNS = COORD_COLUMNS + ['_pid_str', '_panorama_id', '_queue_batch']
+
+
+def parse_fields(value):
+    """解析逗号分隔的字段列表"""
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+
+def parse_years(value):
+    """解析--years参数
+
+    Args:
+        value: 'all' 或逗号分隔的年份，如 '2015,2018,2021'
+
+    Returns:
+        'all' 或 年份字符串列表
+    """
+    if value.strip().lower() == 'all':
+        return 'all'
+
+    years = [year.strip() for year in value.split(',') if year.strip()]
+    for year in years:
+        if not (year.isdigit() and len(year) == 4):
+            raise argparse.ArgumentTypeError(f"无效的年份: {year}")
+    if not years:
+        raise argparse.ArgumentTypeError("未指定任何年份")
+    return years
+
+
+def parse_shard(value):
+    """解析--shard参数
+
+    Args:
+        value: i/n 形式的分片，如 '0/4' 表示4个分片中的第0个
+
+    Returns:
+        tuple: (分片序号, 分片数量)
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的分片: {value}，格式应为 i/n，如 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"无效的分片: {value}，分片序号应在 0 到 {count - 1} 之间")
+    return index, count
 
 
 def parse_args():
@@ -29,15 +101,40 @@ def parse_args():
     parser.add_argument('--input', type=str, default=INPUT_CSV_FILE,
                         help=f'输入CSV文件名 (默认: {INPUT_CSV_FILE})')
 
+    parser.add_argument('--passthrough', type=parse_fields, default=PASSTHROUGH_FIELDS,
+                        help='原样写入结果的其他输入字段，逗号分隔 (默认: 全部字段)')
+
     parser.add_argument('--output', type=str, default=OUTPUT_CSV_FILE,
                         help=f'输出CSV文件名 (默认: {OUTPUT_CSV_FILE})')
 
-    parser.add_argument('--year', type=str, default=STREET_VIEW_CONFIG['year'],
-                        help='指定街景年份 (默认: 最新)')
+    year_group = parser.add_mutually_exclusive_group()
+    year_group.add_argument('--year', type=str, default=STREET_VIEW_CONFIG['year'],
+                            help='指定街景年份 (默认: 最新)')
+
+    year_group.add_argument('--years', type=parse_years, default=None,
+                            help='多年份模式: all(全部年份) 或逗号分隔的年份，如 2015,2018,2021')
+
+    parser.add_argument('--mode', type=str, choices=['directional', 'panoramic', 'traverse'],
+                        default='directional' if STREET_VIEW_CONFIG['use_directional'] else 'panoramic',
+                        help='图片下载模式: directional(四方向街景)、panoramic(全景图) 或 '
+                             'traverse(以输入采样点为种子遍历范围内的全部全景图)')
 
-    parser.add_argument('--mode', type=str, choices=['directional', 'panoramic'],
+    parser.add_argument('--traverse-image', type=str, choices=['directional', 'panoramic'],
                         default='directional' if STREET_VIEW_CONFIG['use_directional'] else 'panoramic',
-                        help='图片下载模式: directional(四方向街景) 或 panoramic(全景图)')
+                        help='traverse模式下载的图片类型')
+
+    area_group = parser.add_mutually_exclusive_group()
+    area_group.add_argument('--bbox', type=float, nargs=4, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+                            help='traverse模式的遍历范围(WGS84经纬度矩形)')
+
+    area_group.add_argument('--polygon', type=str,
+                            help='traverse模式的遍历范围: GeoJSON多边形文件(位于输入目录或完整路径)')
+
+    parser.add_argument('--max-panoramas', type=int, default=None,
+                        help='traverse模式最多处理的全景图数量 (默认: 不限制)')
+
+    parser.add_argument('--max-snap-distance', type=float, default=STREET_VIEW_CONFIG['max_snap_distance'],
+                        help='采样点与匹配全景图的最大距离(米)，超过时不下载图片 (默认: 不限制)')
 
     parser.add_argument('--heading', type=str, choices=['movedir', 'absolute'],
                         default='movedir' if STREET_VIEW_CONFIG['use_move_dir'] else 'absolute',
@@ -49,10 +146,92 @@ def parse_args():
     parser.add_argument('--resume', action='store_true',
                         help='从上次中断处继续爬取')
 
+    parser.add_argument('--format', type=str, choices=['csv', 'parquet'], default=OUTPUT_FORMAT,
+                        help=f'结果文件格式 (默认: {OUTPUT_FORMAT})')
+
+    parser.add_argument('--metadata', type=str, choices=['repr', 'typed'], default=METADATA_FORMAT,
+                        help='元数据输出方式: repr(BD_Content为字典字符串) 或 '
+                             'typed(提取日期、道路名等类型化字段，BD_Content为压缩JSON)')
+
+    parser.add_argument('--merge', action='store_true',
+                        help='只将上次运行遗留的结果分片合并为输出文件，然后退出')
+
+    parser.add_argument('--repair', action='store_true',
+                        help='只为输出文件中状态为incomplete_panorama的采样点下载缺失的全景图瓦片并更新结果，然后退出')
+
+    node_group = parser.add_mutually_exclusive_group()
+    node_group.add_argument('--shard', type=parse_shard, default=None,
+                            help='只处理按采样点ID哈希划分的第i个分片(共n个)，格式为 i/n，如 0/4')
+
+    node_group.add_argument('--queue', type=str, default=None,
+                            help='从共享的SQLite工作队列领取采样点批次(第一个节点负责将输入文件写入队列)')
+
+    parser.add_argument('--worker-id', type=str, default=None,
+                        help='工作队列中的节点ID (默认: 主机名-进程ID)')
+
+    parser.add_argument('--merge-nodes', action='store_true',
+                        help='将各分片/节点的结果(包括未合并的结果分片)去重合并为输出文件，然后退出')
+
+    parser.add_argument('--engine', type=str, choices=['sync', 'async'], default=ENGINE_CONFIG['engine'],
+                        help='爬取引擎: sync(逐点串行) 或 async(asyncio并发)')
+
+    parser.add_argument('--concurrency', type=int, default=ENGINE_CONFIG['concurrency'],
+                        help=f"async引擎同时处理的采样点数量 (默认: {ENGINE_CONFIG['concurrency']})")
+
+    parser.add_argument('--workers', type=int, default=ENGINE_CONFIG['workers'],
+                        help='工作进程数量，大于1时多个进程同时处理采样点，每个进程内使用--engine所选引擎 '
+                             f"(默认: {ENGINE_CONFIG['workers']})")
+
+    parser.add_argument('--cpu-workers', type=int, default=ENGINE_CONFIG['cpu_workers'],
+                        help='全景图瓦片解码与JPEG编码进程数，0表示在下载线程内处理 '
+                             f"(默认: {ENGINE_CONFIG['cpu_workers']})")
+
+    parser.add_argument('--hedge', action='store_true', default=HEDGE_CONFIG['enabled'],
+                        help='图片与瓦片请求耗时超过近期分位数时发送对冲请求，先返回者胜出(分位数与比例上限见HEDGE_CONFIG)')
+
+    parser.add_argument('--metrics', type=str, choices=['prometheus', 'json'], default=METRICS_CONFIG['export'],
+                        help='定期将运行指标导出到 data/output/metrics/ (prometheus文本文件 或 json快照)')
+
     return parser.parse_args()
 
 
-def process_sample_point(row, use_directional=True, use_move_dir=True, target_year=None):
+def download_images(panorama_id, move_dir, pid, lon, lat, use_directional=True, use_move_dir=True, tag=None):
+    """下载全景图对应的街景图片
+
+    Args:
+        panorama_id: 全景图ID
+        move_dir: 移动方向
+        pid: 采样点ID
+        lon: 经度
+        lat: 纬度
+        use_directional: 是否使用四方向街景图
+        use_move_dir: 是否根据移动方向计算heading
+        tag: 文件名标记(如采集时间)
+
+    Returns:
+        tuple: (成功保存的图片文件路径列表, 处理状态)
+    """
+    image_paths = []
+    incomplete = False
+    if use_directional:
+        # 下载四方向街景图
+        image_paths = download_directional_images(panorama_id, move_dir, pid, lon, lat, use_move_dir, tag=tag)
+    else:
+        # 下载全景图
+        panorama_path, incomplete = download_panorama(
+            panorama_id, pid, lon, lat, STREET_VIEW_CONFIG['panorama_zoom'], tag=tag)
+        if panorama_path:
+            image_paths = [panorama_path]
+
+    if image_paths:
+        return image_paths, 'success'
+    # 部分瓦片重试后仍下载失败的全景图，已下载的瓦片保存在TileStore中，可使用 --repair 补全
+    return image_paths, 'incomplete_panorama' if incomplete else 'image_failure'
+
+
+@metrics.timed('point')
+def process_sample_point(row, use_directional=True, use_move_dir=True, target_year=None, target_years=None,
+                         max_snap_distance=None):
     """处理单个采样点
 
     Args:
@@ -60,12 +239,12 @@ def process_sample_point(row, use_directional=True, use_move_dir=True, target_ye
         use_directional: 是否使用四方向街景图
         use_move_dir: 是否根据移动方向计算heading
         target_year: 目标年份
+        target_years: 多年份模式的目标年份列表，'all'表示TimeLine中的全部年份
+        max_snap_distance: 采样点与匹配全景图的最大距离(米)，None表示不限制
 
     Returns:
-        dict: 处理结果数据
+        list: 处理结果数据，多年份模式下每个街景采集对应一条结果，否则只有一条
     """
-    result = {}
-
     try:
         pid = row[PID_FIELD]
         lon = row[LON_FIELD]
@@ -73,8 +252,18 @@ def process_sample_point(row, use_directional=True, use_move_dir=True, target_ye
 
         logger.info(f"Processing sample point {pid}: ({lon}, {lat})")
 
-        # 转换坐标
-        bd_x, bd_y = wgs2bd09mc(lon, lat)
+        # traverse模式的全景图已知ID，无需查询
+        known_id = row.get('_panorama_id')
+        if isinstance(known_id, str) and known_id:
+            return process_panorama(known_id, pid, lon, lat, use_directional, use_move_dir, target_year, target_years)
+
+        # 转换坐标(优先使用预先批量转换的结果)
+        if '_bd_x' in row:
+            bd_x, bd_y = row['_bd_x'], row['_bd_y']
+            if pd.isna(bd_x) or pd.isna(bd_y):
+                bd_x, bd_y = None, None
+        else:
+            bd_x, bd_y = wgs2bd09mc(lon, lat)
 
         if bd_x is None or bd_y is None:
             logger.warning(f"Coordinate conversion failed for {pid}")
@@ -84,7 +273,7 @@ def process_sample_point(row, use_directional=True, use_move_dir=True, target_ye
                 'BD_Content': None,
                 'process_status': 'coordinate_failure'
             }
-            return result
+            return [result]
 
         # 获取全景图ID
         panorama_id = get_panorama_id(bd_x, bd_y)
@@ -97,51 +286,499 @@ def process_sample_point(row, use_directional=True, use_move_dir=True, target_ye
                 'BD_Content': None,
                 'process_status': 'no_panorama'
             }
-            return result
+            return [result]
 
-        # 获取全景图元数据
-        new_id, move_dir, content = get_panorama_metadata(panorama_id, target_year)
+        return process_panorama(panorama_id, pid, lon, lat, use_directional, use_move_dir, target_year, target_years,
+                                sample_mc=(bd_x, bd_y), max_snap_distance=max_snap_distance)
+    except Exception as e:
+        log_exception(e, f"Error processing sample point {row.get(PID_FIELD, 'unknown')}")
+        result = {
+            'BD_ID': None,
+            'BD_MoveDir': None,
+            'BD_Content': None,
+            'process_status': f'error: {str(e)[:100]}'
+        }
+        return [result]
 
-        if not new_id or not content:
-            logger.warning(f"Failed to get metadata for {pid}")
-            result = {
-                'BD_ID': panorama_id,
-                'BD_MoveDir': None,
-                'BD_Content': None,
-                'process_status': 'metadata_failure'
-            }
-            return result
 
-        # 下载图片
-        image_paths = []
-        if use_directional:
-            # 下载四方向街景图
-            image_paths = download_directional_images(new_id, move_dir, pid, lon, lat, use_move_dir)
-        else:
-            # 下载全景图
-            panorama_path = download_panorama(new_id, pid, lon, lat, STREET_VIEW_CONFIG['panorama_zoom'])
-            if panorama_path:
-                image_paths = [panorama_path]
+def process_panorama(panorama_id, pid, lon, lat, use_directional, use_move_dir, target_year, target_years,
+                     sample_mc=None, max_snap_distance=None):
+    """获取全景图元数据并下载图片
+
+    Args:
+        panorama_id: 全景图ID
+        pid: 采样点ID
+        lon: 经度
+        lat: 纬度
+        use_directional: 是否使用四方向街景图
+        use_move_dir: 是否根据移动方向计算heading
+        target_year: 目标年份
+        target_years: 多年份模式的目标年份列表
+        sample_mc: 采样点的百度墨卡托坐标(x, y)，用于计算与全景图的距离
+        max_snap_distance: 采样点与全景图的最大距离(米)
+
+    Returns:
+        list: 处理结果数据
+    """
+    if target_years:
+        return process_captures(panorama_id, pid, lon, lat, use_directional, use_move_dir, target_years,
+                                sample_mc, max_snap_distance)
 
-        # 准备结果
+    # 获取全景图元数据
+    new_id, move_dir, content = get_panorama_metadata(panorama_id, target_year)
+
+    if not new_id or not content:
+        logger.warning(f"Failed to get metadata for {pid}")
         result = {
+            'BD_ID': panorama_id,
+            'BD_MoveDir': None,
+            'BD_Content': None,
+            'process_status': 'metadata_failure'
+        }
+        return [result]
+
+    # 匹配的全景图距离过远时不下载图片
+    distance = snap_distances(sample_mc, [content])[0]
+    if is_too_far(distance, max_snap_distance):
+        logger.warning(f"Panorama {new_id} is {distance} m away from {pid}, skipped")
+        return [{
             'BD_ID': new_id,
+            'BD_Distance': distance,
             'BD_MoveDir': move_dir,
-            'BD_Content': str(content),
-            'BD_ImagePaths': ','.join(image_paths) if image_paths else '',
-            'process_status': 'success' if image_paths else 'image_failure'
-        }
+            'BD_Content': content,
+            'process_status': 'too_far',
+            **panorama_mc_fields(content)
+        }]
 
-        return result
-    except Exception as e:
-        log_exception(e, f"Error processing sample point {row.get(PID_FIELD, 'unknown')}")
-        result = {
-            'BD_ID': None,
+    # 下载图片
+    image_paths, image_status = download_images(new_id, move_dir, pid, lon, lat, use_directional, use_move_dir)
+
+    # 准备结果
+    result = {
+        'BD_ID': new_id,
+        'BD_Distance': distance,
+        'BD_MoveDir': move_dir,
+        'BD_Content': content,
+        'BD_ImagePaths': ','.join(image_paths) if image_paths else '',
+        'process_status': image_status,
+        **panorama_mc_fields(content)
+    }
+
+    return [result]
+
+
+def snap_distances(sample_mc, contents):
+    """批量计算采样点与各全景图之间的距离
+
+    Args:
+        sample_mc: 采样点的百度墨卡托坐标(x, y)，None表示不计算
+        contents: 全景图元数据内容列表
+
+    Returns:
+        list: 距离(米，保留一位小数)列表，无法计算时为None
+    """
+    if sample_mc is None:
+        return [None] * len(contents)
+
+    positions = [get_panorama_position(content) if content else (None, None) for content in contents]
+    pano_x = np.array([np.nan if x is None else x for x, _ in positions], dtype=float)
+    pano_y = np.array([np.nan if y is None else y for _, y in positions], dtype=float)
+    distances = batch_mc_distance(sample_mc[0], sample_mc[1], pano_x, pano_y)
+    return [None if np.isnan(distance) else round(float(distance), 1) for distance in distances]
+
+
+def panorama_mc_fields(content):
+    """返回记录全景图百度墨卡托坐标的内部字段，写入结果前由add_panorama_coordinates批量转换"""
+    pano_x, pano_y = get_panorama_position(content)
+    return {'_pano_x': pano_x, '_pano_y': pano_y}
+
+
+def add_panorama_coordinates(records):
+    """批量将结果中全景图的百度墨卡托坐标转换为WGS84坐标(Pano_Lon、Pano_Lat字段)
+
+    Args:
+        records: 结果字典列表，原地修改
+    """
+    pano_x = np.array([_nan_if_none(record.pop('_pano_x', None)) for record in records], dtype=float)
+    pano_y = np.array([_nan_if_none(record.pop('_pano_y', None)) for record in records], dtype=float)
+    if not np.isfinite(pano_x).any():
+        return
+
+    pano_lon, pano_lat = batch_bd09mc2wgs(pano_x, pano_y)
+    for record, lon, lat in zip(records, pano_lon.tolist(), pano_lat.tolist()):
+        # 处理状态保持为最后一列
+        status = record.pop('process_status', None)
+        record['Pano_Lon'] = None if np.isnan(lon) else round(lon, 8)
+        record['Pano_Lat'] = None if np.isnan(lat) else round(lat, 8)
+        record['process_status'] = status
+
+
+def format_metadata(records, metadata_format, fmt):
+    """将结果中的元数据内容转换为输出格式
+
+    Args:
+        records: 结果字典列表，原地修改
+        metadata_format: repr(BD_Content为元数据的字典字符串) 或 typed(提取类型化字段，BD_Content为压缩JSON)
+        fmt: 结果文件格式，typed模式下Parquet中保存二进制，CSV中保存base64字符串
+    """
+    for index, record in enumerate(records):
+        content = record.get('BD_Content')
+        if metadata_format != 'typed':
+            record['BD_Content'] = str(content) if content is not None else None
+            continue
+
+        # 类型化字段放在BD_Content之前，同名字段(BD_MoveDir、BD_Year)以元数据中的值为准
+        fields = extract_metadata_fields(content)
+        formatted = {}
+        for key, value in record.items():
+            if key == 'BD_Content':
+                formatted.update(fields)
+                formatted[key] = encode_content(content, binary=fmt == 'parquet')
+            elif key not in fields:
+                formatted[key] = value
+        records[index] = formatted
+
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+
+def is_too_far(distance, max_snap_distance):
+    """判断全景图与采样点的距离是否超过限制"""
+    return max_snap_distance is not None and distance is not None and distance > max_snap_distance
+
+
+def process_captures(panorama_id, pid, lon, lat, use_directional, use_move_dir, target_years,
+                     sample_mc=None, max_snap_distance=None):
+    """多年份模式：遍历一次TimeLine，为每个目标年份的街景采集下载图片
+
+    Args:
+        panorama_id: 采样点对应的全景图ID
+        pid: 采样点ID
+        lon: 经度
+        lat: 纬度
+        use_directional: 是否使用四方向街景图
+        use_move_dir: 是否根据移动方向计算heading
+        target_years: 目标年份列表，'all'表示全部年份
+        sample_mc: 采样点的百度墨卡托坐标(x, y)，用于计算与全景图的距离
+        max_snap_distance: 采样点与全景图的最大距离(米)
+
+    Returns:
+        list: 每个街景采集对应一条处理结果
+    """
+    captures = get_panorama_captures(panorama_id, target_years)
+
+    if captures is None:
+        logger.warning(f"Failed to get metadata for {pid}")
+        return [{
+            'BD_ID': panorama_id,
+            'BD_Year': None,
+            'BD_TimeLine': None,
             'BD_MoveDir': None,
             'BD_Content': None,
-            'process_status': f'error: {str(e)[:100]}'
-        }
-        return result
+            'process_status': 'metadata_failure'
+        }]
+
+    if not captures:
+        logger.warning(f"No panorama found for years {target_years} at {pid}")
+        return [{
+            'BD_ID': panorama_id,
+            'BD_Year': None,
+            'BD_TimeLine': None,
+            'BD_MoveDir': None,
+            'BD_Content': None,
+            'process_status': 'no_matching_year'
+        }]
+
+    # 一次计算全部街景采集与采样点的距离
+    distances = snap_distances(sample_mc, [capture['content'] for capture in captures])
+
+    results = []
+    for capture, distance in zip(captures, distances):
+        if not capture['content']:
+            results.append({
+                'BD_ID': capture['id'],
+                'BD_Year': capture['year'],
+                'BD_TimeLine': capture['timeline'],
+                'BD_MoveDir': None,
+                'BD_Content': None,
+                'process_status': 'metadata_failure'
+            })
+            continue
+
+        if is_too_far(distance, max_snap_distance):
+            logger.warning(f"Panorama {capture['id']} is {distance} m away from {pid}, skipped")
+            results.append({
+                'BD_ID': capture['id'],
+                'BD_Year': capture['year'],
+                'BD_TimeLine': capture['timeline'],
+                'BD_Distance': distance,
+                'BD_MoveDir': capture['move_dir'],
+                'BD_Content': capture['content'],
+                'process_status': 'too_far',
+                **panorama_mc_fields(capture['content'])
+            })
+            continue
+
+        image_paths, image_status = download_images(
+            capture['id'], capture['move_dir'], pid, lon, lat,
+            use_directional, use_move_dir, tag=capture['timeline']
+        )
+        results.append({
+            'BD_ID': capture['id'],
+            'BD_Year': capture['year'],
+            'BD_TimeLine': capture['timeline'],
+            'BD_Distance': distance,
+            'BD_MoveDir': capture['move_dir'],
+            'BD_Content': capture['content'],
+            'BD_ImagePaths': ','.join(image_paths) if image_paths else '',
+            'process_status': image_status,
+            **panorama_mc_fields(capture['content'])
+        })
+
+    return results
+
+
+def iter_sample_points(chunks):
+    """逐块转换坐标并逐行产出采样点
+
+    Args:
+        chunks: 采样点数据块的迭代器
+
+    Yields:
+        tuple: (索引, 采样点数据Series)，与DataFrame.iterrows()一致
+    """
+    for chunk in chunks:
+        # 批量转换整块采样点的坐标
+        mc_x, mc_y = batch_wgs2bd09mc(chunk[LON_FIELD], chunk[LAT_FIELD])
+        chunk = chunk.assign(_bd_x=mc_x, _bd_y=mc_y)
+        yield from chunk.iterrows()
+
+
+def iter_traverse_points(chunks, area, concurrency, max_panoramas=None, skip_ids=None):
+    """traverse模式：以输入采样点为种子遍历范围内的全景图，每个全景图作为一个采样点产出
+
+    Args:
+        chunks: 种子采样点数据块的迭代器
+        area: TraverseArea遍历范围
+        concurrency: 同时获取元数据的全景图数量
+        max_panoramas: 最多产出的全景图数量
+        skip_ids: 已处理的全景图ID
+
+    Yields:
+        tuple: (序号, 全景图数据Series)，PID为全景图ID，经纬度为全景图的WGS84坐标
+    """
+    def seeds():
+        for chunk in chunks:
+            mc_x, mc_y = batch_wgs2bd09mc(chunk[LON_FIELD], chunk[LAT_FIELD])
+            for pid, x, y in zip(chunk[PID_FIELD], mc_x.tolist(), mc_y.tolist()):
+                yield pid, (None if pd.isna(x) else x), (None if pd.isna(y) else y)
+
+    panoramas = traverse_panoramas(seeds(), area, concurrency, max_panoramas, skip_ids)
+    for index, panorama in enumerate(panoramas):
+        lon, lat = bd09mc2wgs(panorama['x'], panorama['y'])
+        yield index, pd.Series({
+            PID_FIELD: panorama['id'],
+            LON_FIELD: lon,
+            LAT_FIELD: lat,
+            'Seed_PID': panorama['seed'],
+            'Traverse_Depth': panorama['depth'],
+            '_panorama_id': panorama['id'],
+            '_pid_str': panorama['id']
+        })
+
+
+def load_processed_pids(path, fmt='csv'):
+    """从结果文件中读取已处理的采样点ID
+
+    Args:
+        path: 结果文件(或结果分片)路径
+        fmt: 文件格式，csv 或 parquet
+
+    Returns:
+        set: 已处理的采样点ID，结果文件中没有ID字段时返回None
+    """
+    # 只读取ID字段，避免解析体积较大的元数据字段
+    try:
+        if fmt == 'parquet':
+            processed_df = pd.read_parquet(path, columns=[PID_FIELD])
+        else:
+            processed_df = read_csv(path, usecols=[PID_FIELD], encoding='utf-8-sig')
+    except (KeyError, ValueError):
+        return None
+
+    return set(processed_df[PID_FIELD].astype(str))
+
+
+def log_rate_stats(rate_stats=None):
+    """输出各接口当前的请求速率与并发上限
+
+    Args:
+        rate_stats: 各接口的限速状态，默认为当前进程HttpClient的状态
+    """
+    parts = []
+    for endpoint, stats in (rate_stats or http_client.rate_stats()).items():
+        rate = f"{stats['rate']}/s" if stats['rate'] is not None else '不限'
+        parts.append(f"{endpoint}(速率 {rate}, 并发 {stats['concurrency']}, 限流 {stats['throttles']} 次)")
+    logger.info("接口限速状态: " + ", ".join(parts))
+
+
+def _format_row(values, widths):
+    """按显示宽度对齐表格的一行(中文字符占两个字符宽度)，第一列左对齐，其余列右对齐"""
+    cells = []
+    for i, (value, width) in enumerate(zip(values, widths)):
+        text = str(value)
+        padding = ' ' * max(0, width - sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text))
+        cells.append(text + padding if i == 0 else padding + text)
+    return '  ' + ''.join(cells)
+
+
+def log_metrics_summary():
+    """输出各接口与各处理阶段的耗时、吞吐与错误率汇总表"""
+    endpoints, stages = metrics.summary_rows()
+    elapsed = max(time.time() - metrics.started_at, 1e-9)
+
+    if endpoints:
+        widths = [10, 10, 10, 10, 10, 14, 12, 10, 10]
+        logger.info("接口统计:")
+        logger.info(_format_row(
+            ['接口', '请求数', '错误率', 'p50(s)', 'p95(s)', '限速等待(s)', '下载(MB)', '请求/秒', '对冲'], widths))
+        for row in endpoints:
+            logger.info(_format_row([
+                row['endpoint'], row['requests'], f"{row['error_rate']:.1%}", f"{row['p50']:.3f}",
+                f"{row['p95']:.3f}", f"{row['wait']:.1f}", f"{row['bytes'] / 1024 / 1024:.2f}",
+                f"{row['requests'] / elapsed:.2f}", row['hedges']
+            ], widths))
+
+    if stages:
+        widths = [20, 10, 12, 10, 10]
+        logger.info("阶段耗时:")
+        logger.info(_format_row(['阶段', '次数', '总耗时(s)', '平均(s)', 'p95(s)'], widths))
+        for row in stages:
+            logger.info(_format_row([
+                row['stage'], row['count'], f"{row['total']:.2f}", f"{row['mean']:.3f}", f"{row['p95']:.3f}"
+            ], widths))
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    """将终止信号转换为KeyboardInterrupt，以便统一保存进度后退出"""
+    raise KeyboardInterrupt(f"Received signal {signum}")
+
+
+@contextmanager
+def defer_interrupts():
+    """代码块执行期间推迟处理SIGINT/SIGTERM，代码块结束后再抛出KeyboardInterrupt
+
+    用于写入结果与进度日志，避免中断发生在两者之间导致结果重复写入或进度丢失。
+    signal只能在主线程中设置，其他线程中不做处理。
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    received = []
+    previous = {sig: signal.signal(sig, lambda signum, frame: received.append(signum))
+                for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        yield
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    if received:
+        raise KeyboardInterrupt(f"Received signal {received[0]}")
+
+
+def node_output_name(output, node):
+    """返回分片或工作节点的输出文件名，如 爬取结果.shard-0-of-4.csv"""
+    path = Path(output)
+    return f"{path.stem}.{node}{path.suffix}"
+
+
+def merge_node_outputs(output_path, fmt):
+    """将各分片/节点的输出文件与未合并的结果分片去重合并为最终输出文件
+
+    Args:
+        output_path: 最终输出文件路径
+        fmt: 文件格式
+    """
+    # 节点输出文件 <输出文件名>.<节点>.<后缀>，以及节点中断后遗留的 <节点输出文件名>.parts/
+    node_paths = set()
+    for path in output_path.parent.glob(f"{output_path.stem}.*{output_path.suffix}*"):
+        name = path.name[:-len('.parts')] if path.is_dir() and path.name.endswith('.parts') else path.name
+        if name.endswith(output_path.suffix):
+            node_paths.add(output_path.parent / name)
+
+    sources = []
+    for node_path in sorted(node_paths):
+        if node_path.exists():
+            sources.append(node_path)
+        sources.extend(PartitionedResultWriter(node_path, fmt).part_files())
+
+    if not sources:
+        logger.error(f"没有找到 {output_path.name} 的分片/节点结果")
+        return
+
+    logger.info(f"合并 {len(node_paths)} 个分片/节点的 {len(sources)} 个结果文件")
+    merge_result_files(sources, output_path, fmt, dedup_field=PID_FIELD)
+
+
+def repair_incomplete_panoramas(output_path, fmt):
+    """为结果文件中的不完整全景图下载缺失的瓦片，并更新其图片路径与处理状态
+
+    已下载的瓦片保存在TileStore中，每个全景图只需下载缺失的瓦片。缩放级别需与原来的运行一致。
+
+    Args:
+        output_path: 结果文件路径
+        fmt: 文件格式
+    """
+    if not output_path.exists():
+        logger.error(f"结果文件 {output_path} 不存在，请先完成爬取或使用 --merge 合并结果分片")
+        return
+
+    if fmt == 'parquet':
+        results = pd.read_parquet(output_path)
+    else:
+        # 按字符串读取，原样写回未修改的字段
+        results = read_csv(output_path, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+    incomplete = results.index[results['process_status'] == 'incomplete_panorama']
+    if not len(incomplete):
+        logger.info("没有不完整的全景图需要修复")
+        return
+
+    panoramas, missing_tiles = tile_store.summary()
+    logger.info(f"修复 {len(incomplete)} 条不完整全景图结果，瓦片存储中共有 {panoramas} 个全景图缺失 {missing_tiles} 块瓦片")
+
+    status_counts = Counter()
+    for index in tqdm(incomplete, desc="修复进度"):
+        row = results.loc[index]
+        lon, lat = float(row[LON_FIELD]), float(row[LAT_FIELD])
+        # 多年份模式的文件名中带有采集时间
+        tag = row.get('BD_TimeLine')
+        tag = tag if isinstance(tag, str) and tag else None
+
+        image_paths, status = download_images(row['BD_ID'], None, row[PID_FIELD], lon, lat,
+                                              use_directional=False, tag=tag)
+        results.loc[index, 'BD_ImagePaths'] = ','.join(image_paths)
+        results.loc[index, 'process_status'] = status
+        status_counts[status] += 1
+
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    if fmt == 'parquet':
+        results.to_parquet(tmp_path, index=False)
+    else:
+        results.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    os.replace(tmp_path, output_path)
+
+    shutdown_download_executor()
+    shutdown_hedge_executor()
+    shutdown_cpu_executor()
+    image_manifest.close()
+
+    logger.info(f"已更新结果文件 {output_path}")
+    for status, count in status_counts.most_common():
+        logger.info(f"  {status}: {count}")
+    log_metrics_summary()
 
 
 def main():
@@ -152,120 +789,350 @@ def main():
     logger.info(f"输入文件: {args.input}")
     logger.info(f"输出文件: {args.output}")
     logger.info(f"模式: {args.mode}")
+    # traverse模式按--traverse-image下载图片
+    image_mode = args.traverse_image if args.mode == 'traverse' else args.mode
+    if args.mode == 'traverse':
+        logger.info(f"遍历图片类型: {image_mode}")
     logger.info(f"Heading计算: {args.heading}")
-    logger.info(f"目标年份: {args.year if args.year else '最新'}")
+    if args.max_snap_distance is not None:
+        logger.info(f"全景图最大匹配距离: {args.max_snap_distance} 米")
+    if args.years:
+        logger.info(f"多年份模式: {args.years if args.years == 'all' else ','.join(args.years)}")
+    else:
+        logger.info(f"目标年份: {args.year if args.year else '最新'}")
+    logger.info(f"爬取引擎: {args.engine}")
+    if args.workers > 1:
+        logger.info(f"工作进程数: {args.workers}")
+    logger.info(f"元数据输出方式: {args.metadata}")
 
-    try:
-        # 读取输入CSV文件
-        input_path = INPUT_DIR / args.input
-        df = read_csv(input_path)
+    HEDGE_CONFIG['enabled'] = args.hedge
+    if args.hedge:
+        logger.info(f"对冲请求: 耗时超过p{HEDGE_CONFIG['percentile'] * 100:g}时发送，"
+                    f"不超过请求数的{HEDGE_CONFIG['max_ratio']:.0%}")
 
-        # 检查必要的字段
-        for field in [PID_FIELD, LON_FIELD, LAT_FIELD]:
-            if field not in df.columns:
-                logger.error(f"Required field '{field}' not found in input file")
-                return
+    # 全景图的CPU进程池按配置懒加载创建
+    ENGINE_CONFIG['cpu_workers'] = args.cpu_workers
+    if image_mode == 'panoramic' and args.cpu_workers != 0:
+        logger.info(f"全景图解码与编码进程数: {args.cpu_workers or os.cpu_count()}")
 
+    try:
         # 准备输出文件
         output_path = CSV_OUTPUT_DIR / args.output
-        progress_path = TEMP_DIR / f"{args.output}.progress"
+        if args.format == 'parquet':
+            output_path = output_path.with_suffix('.parquet')
+
+        if args.merge_nodes:
+            merge_node_outputs(output_path, args.format)
+            return
+
+        if args.mode == 'traverse' and (args.shard or args.queue):
+            logger.error("traverse模式按全景图ID去重，不支持 --shard 与 --queue")
+            return
+
+        # 分片或工作队列节点写入各自的输出文件，之后使用 --merge-nodes 合并
+        queue = None
+        node = None
+        if args.shard:
+            node = f"shard-{args.shard[0]}-of-{args.shard[1]}"
+            logger.info(f"分片: {args.shard[0]}/{args.shard[1]}")
+        elif args.queue:
+            queue = WorkQueue(Path(args.queue), args.worker_id,
+                              DISTRIBUTED_CONFIG['lease_seconds'], DISTRIBUTED_CONFIG['heartbeat_interval'],
+                              DISTRIBUTED_CONFIG['poll_interval'])
+            node = f"worker-{queue.worker_id}"
+            logger.info(f"工作队列: {args.queue}，节点ID: {queue.worker_id}")
+        if node:
+            output_path = output_path.with_name(node_output_name(output_path.name, node))
+            logger.info(f"节点输出文件: {output_path.name}")
+
+        progress_path = TEMP_DIR / f"{node_output_name(args.output, node) if node else args.output}.progress"
+        writer = PartitionedResultWriter(output_path, args.format,
+                                         METADATA_DTYPES if args.metadata == 'typed' else None)
+
+        if args.merge:
+            writer.merge(include_existing=True)
+            return
+
+        if args.repair:
+            repair_incomplete_panoramas(output_path, args.format)
+            return
+
+        # 检查输入文件的必要字段(工作队列已由其他节点填充时无需读取输入文件)
+        input_path = INPUT_DIR / args.input
+        read_columns = None
+        if queue is None or not queue.is_populated():
+            input_columns = read_input_columns(input_path)
+            for field in [PID_FIELD, LON_FIELD, LAT_FIELD]:
+                if field not in input_columns:
+                    logger.error(f"Required field '{field}' not found in input file")
+                    return
+
+            # 确定需要读取的字段
+            if args.passthrough is None:
+                read_columns = None
+            else:
+                missing = [field for field in args.passthrough if field not in input_columns]
+                if missing:
+                    logger.error(f"Passthrough fields {missing} not found in input file")
+                    return
+                read_columns = [field for field in input_columns
+                                if field in [PID_FIELD, LON_FIELD, LAT_FIELD] + args.passthrough]
+
+        # traverse模式的遍历范围
+        area = None
+        if args.mode == 'traverse':
+            if args.polygon:
+                polygon_path = Path(args.polygon)
+                if not polygon_path.exists():
+                    polygon_path = INPUT_DIR / args.polygon
+                area = TraverseArea.from_geojson(polygon_path)
+                logger.info(f"遍历范围: {polygon_path}")
+            elif args.bbox:
+                area = TraverseArea.from_bbox(*args.bbox)
+                logger.info(f"遍历范围: {args.bbox}")
+            else:
+                logger.error("traverse模式需要使用 --bbox 或 --polygon 指定遍历范围")
+                return
+            # 输入采样点只作为种子，不写入结果
+            read_columns = [PID_FIELD, LON_FIELD, LAT_FIELD]
 
         # 如果继续上次爬取，加载进度
+        journal = ProgressJournal(progress_path)
         processed_pids = set()
-        if args.resume and os.path.exists(output_path):
+        if queue is not None:
+            # 工作队列记录各批次的完成状态，未完成的批次会被重新领取。
+            # 已完成批次的结果只保存在本节点的分片与输出文件中，节点重启时不能清除；
+            # 进度日志中的采样点已写入结果，重新领取的批次中跳过这些采样点
+            if args.resume:
+                logger.info("工作队列模式下由队列记录进度，忽略 --resume")
+            if journal.exists():
+                processed_pids = journal.load()
+                logger.info(f"节点已处理 {len(processed_pids)} 个采样点")
+        elif args.resume and journal.exists():
             logger.info("继续上次爬取任务")
-            # 读取已处理的记录
-            processed_df = read_csv(output_path)
-            if PID_FIELD in processed_df.columns:
-                processed_pids = set(processed_df[PID_FIELD].astype(str))
-            else:
-                processed_pids = load_progress(progress_path)
-
+            processed_pids = journal.load()
             logger.info(f"已处理 {len(processed_pids)} 个采样点")
+        elif args.resume and (output_path.exists() or writer.part_files()):
+            logger.info("继续上次爬取任务(未找到进度日志，从结果文件中读取已处理的采样点)")
+            result_files = ([output_path] if output_path.exists() else []) + writer.part_files()
+            for result_file in result_files:
+                pids = load_processed_pids(result_file, args.format)
+                if pids is None:
+                    logger.warning(f"结果文件 {result_file} 中没有字段 {PID_FIELD}，无法读取进度")
+                    continue
+                processed_pids.update(pids)
 
-        # 筛选未处理的记录
-        df['_pid_str'] = df[PID_FIELD].astype(str)
-        if processed_pids:
-            unprocessed_df = df[~df['_pid_str'].isin(processed_pids)]
-        else:
-            unprocessed_df = df
-
-        total_points = len(unprocessed_df)
-        logger.info(f"需要处理 {total_points} 个采样点")
+            logger.info(f"已处理 {len(processed_pids)} 个采样点")
+        elif not args.resume:
+            # 重新爬取时清除上次遗留的结果与进度
+            writer.reset()
+            journal.reset()
+            if output_path.exists():
+                os.remove(output_path)
 
-        if total_points == 0:
-            logger.info("没有需要处理的采样点，退出程序")
-            return
+        # 续传时建立已有图片的索引，中断前已下载的图片不再重复下载
+        if args.resume or queue is not None:
+            logger.info(f"已有图片: {existing_images.scan()} 张")
 
-        # 初始化结果DataFrame
-        if args.resume and os.path.exists(output_path):
-            result_df = read_csv(output_path)
+        # 分块读取未处理的采样点
+        chunks = iter_input_chunks(
+            input_path, PID_FIELD,
+            columns=read_columns,
+            chunksize=INPUT_CHUNK_SIZE,
+            skip_pids=processed_pids if area is None and queue is None else None
+        )
+        if args.shard:
+            chunks = (chunk[shard_mask(chunk['_pid_str'], *args.shard)] for chunk in chunks)
+        elif queue is not None:
+            # 第一个节点将输入文件写入队列，之后各节点从队列领取批次
+            batches = queue.populate(chunks, DISTRIBUTED_CONFIG['queue_batch_size'])
+            if batches:
+                logger.info(f"已将输入文件写入工作队列，共 {batches} 个批次")
+            chunks = queue.iter_chunks(PID_FIELD, processed_pids)
+        if area is None:
+            rows = iter_sample_points(chunks)
         else:
-            result_df = pd.DataFrame()
+            # 遍历时跳过已处理的全景图(进度中记录的是全景图ID)
+            rows = iter_traverse_points(chunks, area, args.concurrency, args.max_panoramas, processed_pids)
 
         # 设置处理参数
-        use_directional = args.mode == 'directional'
+        use_directional = image_mode == 'directional'
         use_move_dir = args.heading == 'movedir'
+        process_fn = partial(
+            process_sample_point,
+            use_directional=use_directional,
+            use_move_dir=use_move_dir,
+            target_year=args.year,
+            target_years=args.years,
+            max_snap_distance=args.max_snap_distance
+        )
 
-        # 分批处理
-        for i in range(0, total_points, args.batch):
-            batch_df = unprocessed_df.iloc[i:i + args.batch]
-            logger.info(
-                f"处理批次 {i // args.batch + 1}/{(total_points - 1) // args.batch + 1}，共 {len(batch_df)} 条记录")
+        batch_results = []
+        batch_pids = []
+        batch_queue_ids = []
+        status_counts = Counter()
+        processed_points = 0
+
+        def flush_results():
+            """将当前批次结果写入新的结果分片，并记录进度"""
+            # 写入期间推迟中断，并先取出当前批次，中断处理中不会再次写入同一批次
+            with defer_interrupts():
+                results, pids, queue_ids = list(batch_results), list(batch_pids), list(batch_queue_ids)
+                batch_results.clear()
+                batch_pids.clear()
+                batch_queue_ids.clear()
 
-            batch_results = []
+                add_panorama_coordinates(results)
+                format_metadata(results, args.metadata, args.format)
+                writer.write(results)
+                status_counts.update(result['process_status'] for result in results)
+                for result in results:
+                    metrics.inc('results_total', status=result['process_status'])
+                metrics.inc('points_total', len(pids))
 
-            # 使用tqdm显示进度
-            for _, row in tqdm(batch_df.iterrows(), total=len(batch_df), desc="处理进度"):
-                # 处理单个采样点
-                result = process_sample_point(
-                    row,
-                    use_directional=use_directional,
-                    use_move_dir=use_move_dir,
-                    target_year=args.year
-                )
+                # 结果写入后再记录已处理的ID，保证进度日志中的采样点都已有结果
+                journal.append(dict.fromkeys(pids))
+                if queue is not None:
+                    queue.mark_done(queue_ids)
 
-                # 将原始数据与新结果合并
-                row_result = {**row.to_dict(), **result}
-                batch_results.append(row_result)
+            log_rate_stats(worker_rate_stats() if args.workers > 1 else None)
 
-                # 记录已处理的ID
-                processed_pids.add(row['_pid_str'])
+        def record_result(row, results):
+            """合并原始数据与处理结果"""
+            # 将原始数据与新结果合并
+            batch_pids.append(row['_pid_str'])
+            batch_queue_ids.append(row.get('_queue_batch'))
+            row_data = row.drop(INTERNAL_COLUMNS, errors='ignore').to_dict()
+            batch_results.extend([{**row_data, **result} for result in results])
 
-                # 保存进度
-                save_progress(processed_pids, progress_path)
+        # 收到SIGTERM时与Ctrl+C一样中断爬取，保存已完成的结果与进度后退出
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
 
-            # 合并批次结果
-            batch_result_df = pd.DataFrame(batch_results)
+        # 定期导出运行指标
+        exporter = None
+        if args.metrics:
+            suffix = 'json' if args.metrics == 'json' else 'prom'
+            metrics_path = METRICS_CONFIG['export_dir'] / f"{Path(args.output).stem}.{suffix}"
+            exporter = MetricsExporter(metrics, metrics_path, args.metrics, METRICS_CONFIG['interval'])
+            exporter.start()
 
-            # 添加到总结果
-            if result_df.empty:
-                result_df = batch_result_df
+        try:
+            if args.engine == 'async' or args.workers > 1:
+                if args.workers > 1:
+                    logger.info(f"使用 {args.workers} 个工作进程，进程内引擎 {args.engine}")
+                else:
+                    logger.info(f"使用async引擎，并发数 {args.concurrency}")
+
+                with tqdm(desc="处理进度") as progress_bar:
+                    def on_result(row, results):
+                        nonlocal processed_points
+                        record_result(row, results)
+                        processed_points += 1
+                        progress_bar.update(1)
+
+                        # 每满一批保存一次结果
+                        if len(batch_results) >= args.batch:
+                            flush_results()
+
+                    if args.workers > 1:
+                        run_multiprocess_engine(rows, process_fn, args.workers, ENGINE_CONFIG['worker_batch_size'],
+                                                args.engine, args.concurrency, on_result)
+                    else:
+                        run_async_engine(rows, process_fn, args.concurrency, on_result)
+
+                if batch_pids:
+                    flush_results()
             else:
-                result_df = pd.concat([result_df, batch_result_df], ignore_index=True)
+                # 分批处理
+                batch_index = 0
+                while True:
+                    batch = list(islice(rows, args.batch))
+                    if not batch:
+                        break
+
+                    # 批次间延迟(启用自适应限速时由限速器控制请求速率)
+                    if batch_index > 0 and not RATE_LIMIT_CONFIG['adaptive']:
+                        logger.info(f"批次间延迟 {BATCH_DELAY} 秒...")
+                        time.sleep(BATCH_DELAY)
+
+                    batch_index += 1
+                    logger.info(f"处理批次 {batch_index}，共 {len(batch)} 条记录")
+
+                    # 使用tqdm显示进度
+                    for _, row in tqdm(batch, total=len(batch), desc="处理进度"):
+                        # 处理单个采样点
+                        results = process_fn(row)
+                        record_result(row, results)
+                        processed_points += 1
+
+                    flush_results()
+        except KeyboardInterrupt:
+            logger.warning("爬取被中断，正在保存已完成的结果与进度...")
+            if batch_pids:
+                flush_results()
+            journal.close()
+            if queue is not None:
+                queue.release()
+                queue.close()
+            if exporter:
+                exporter.stop()
+            logger.warning("已保存进度，可使用 --resume 继续爬取")
+            sys.exit(130)
 
-            # 保存当前结果
-            save_csv(result_df, output_path)
-            logger.info(f"已保存 {len(result_df)} 条结果到 {output_path}")
+        journal.close()
+        if queue is not None:
+            queue_stats = queue.stats()
+            queue.close()
+            logger.info("工作队列状态: " + ", ".join(
+                f"{status} {stats['batches']} 批/{stats['points']} 个采样点" for status, stats in queue_stats.items()))
+        shutdown_download_executor()
+        shutdown_hedge_executor()
+        shutdown_cpu_executor()
+        image_manifest.close()
 
-            # 批次间延迟
-            if i + args.batch < total_points:
-                logger.info(f"批次间延迟 {BATCH_DELAY} 秒...")
-                time.sleep(BATCH_DELAY)
+        if processed_points == 0:
+            logger.info("没有需要处理的采样点")
+
+        # 合并结果分片
+        # 工作队列节点的输出文件中保存着之前已完成批次的结果，始终一起合并
+        total_rows = writer.merge(include_existing=args.resume or queue is not None)
+        if total_rows is not None:
+            logger.info(f"已保存 {total_rows} 条结果到 {output_path}")
 
         # 处理完成，删除临时进度文件
-        if os.path.exists(progress_path):
-            os.remove(progress_path)
+        journal.reset()
 
         logger.info(f"=== 百度街景爬虫运行完成 ===")
-        logger.info(f"总共处理了 {len(result_df)} 条记录")
+        logger.info(f"本次共处理了 {processed_points} 个采样点，{sum(status_counts.values())} 条记录")
 
         # 统计处理状态
-        if 'process_status' in result_df.columns:
-            status_counts = result_df['process_status'].value_counts()
-            logger.info("处理状态统计:")
-            for status, count in status_counts.items():
-                logger.info(f"  {status}: {count}")
+        logger.info("处理状态统计:")
+        for status, count in status_counts.most_common():
+            logger.info(f"  {status}: {count}")
+
+        log_rate_stats(worker_rate_stats() if args.workers > 1 else None)
+
+        # 统计缓存命中情况
+        for cache_name, cache in [('全景图ID缓存', pano_id_cache), ('元数据缓存', metadata_cache),
+                                  ('图片去重', image_store)]:
+            cache_stats = cache.stats()
+            logger.info(
+                f"{cache_name}: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，"
+                f"命中率 {cache_stats['hit_rate']:.1%}")
+
+        if existing_images.reused or existing_images.rejected:
+            logger.info(f"已有图片: 复用 {existing_images.reused} 张，"
+                        f"{existing_images.rejected} 张不完整已重新下载")
+
+        if status_counts['incomplete_panorama']:
+            panoramas, missing_tiles = tile_store.summary()
+            logger.warning(f"{panoramas} 个全景图缺失 {missing_tiles} 块瓦片，已下载的瓦片已保存，"
+                           f"可使用 --repair 只下载缺失的瓦片")
+
+        # 输出运行指标汇总
+        if exporter:
+            exporter.stop()
+        log_metrics_summary()
 
     except Exception as e:
         log_exception(e, "程序执行过程中发生错误")
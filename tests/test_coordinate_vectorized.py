@@ -0,0 +1,34 @@
+import numpy as np
+
+from core import coordinate_vectorized
+from core.CoordinatesConverterPro import wgs84tobd09ll, bd09lltobd09mc, bd09mctobd09ll
+
+
+def _grid():
+    """覆盖国内各纬度分带以及国外(不做偏移)区域的经纬度网格"""
+    lng, lat = np.meshgrid(np.linspace(60.0, 140.0, 41), np.linspace(-10.0, 60.0, 36))
+    return lng.ravel(), lat.ravel()
+
+
+def test_wgs84tobd09mc_matches_scalar():
+    lng, lat = _grid()
+    expected = np.array([bd09lltobd09mc(*wgs84tobd09ll(x, y)) for x, y in zip(lng, lat)])
+
+    mc_x, mc_y = coordinate_vectorized.wgs84tobd09mc(lng, lat)
+
+    assert np.allclose(mc_x, expected[:, 0], rtol=1e-12, atol=1e-6)
+    assert np.allclose(mc_y, expected[:, 1], rtol=1e-12, atol=1e-6)
+
+
+def test_bd09mctobd09ll_matches_scalar():
+    lng, lat = _grid()
+    mc_x, mc_y = coordinate_vectorized.wgs84tobd09mc(lng, lat)
+    # 标量版本只处理北半球的分带
+    north = mc_y > 0
+    mc_x, mc_y = mc_x[north], mc_y[north]
+    expected = np.array([bd09mctobd09ll(x, y) for x, y in zip(mc_x, mc_y)])
+
+    bd_lng, bd_lat = coordinate_vectorized.bd09mctobd09ll(mc_x, mc_y)
+
+    assert np.allclose(bd_lng, expected[:, 0], rtol=0, atol=1e-9)
+    assert np.allclose(bd_lat, expected[:, 1], rtol=0, atol=1e-9)
@@ -0,0 +1,44 @@
+from utils.file_io import ProgressJournal
+
+
+def test_resume_loads_ids_appended_by_previous_run(tmp_path):
+    progress_file = tmp_path / 'result.csv.progress'
+    journal = ProgressJournal(progress_file, fsync_every=2)
+    assert not journal.exists()
+    assert journal.load() == set()
+
+    journal.append(['1', '2', '3'])
+    journal.append([])
+    # 未关闭的日志中每批记录也已写入，进程被强制结束后可以读取
+    assert ProgressJournal(progress_file).load() == {'1', '2', '3'}
+    journal.close()
+
+    resumed = ProgressJournal(progress_file)
+    resumed.append([4])
+    resumed.close()
+    assert resumed.load() == {'1', '2', '3', '4'}
+
+
+def test_load_ignores_truncated_last_line(tmp_path):
+    progress_file = tmp_path / 'result.csv.progress'
+    progress_file.write_text('1\n2\n\n3', encoding='utf-8')
+
+    journal = ProgressJournal(progress_file)
+    assert journal.load() == {'1', '2'}
+
+    # 续写时截掉不完整的记录，不会与新记录连成一行
+    journal.append(['4'])
+    journal.close()
+    assert journal.load() == {'1', '2', '4'}
+
+
+def test_reset_removes_journal(tmp_path):
+    progress_file = tmp_path / 'result.csv.progress'
+    journal = ProgressJournal(progress_file)
+    journal.append(['1'])
+    journal.reset()
+    assert not journal.exists()
+
+    journal.append(['2'])
+    journal.close()
+    assert journal.load() == {'2'}
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from utils.result_writer import PartitionedResultWriter, merge_result_files
+
+
+def _records(pids, **extra):
+    return [{'PID': pid, 'status': 'success', **extra} for pid in pids]
+
+
+def test_restarted_writer_continues_part_index(tmp_path):
+    output_path = tmp_path / 'result.csv'
+    writer = PartitionedResultWriter(output_path)
+    writer.write(_records([1, 2]))
+    writer.write(_records([3]))
+    assert writer.write([]) is None
+
+    # 中断后重新运行，新分片接在上次运行遗留的分片之后
+    restarted = PartitionedResultWriter(output_path)
+    assert restarted.write(_records([4])).name == 'part-000003.csv'
+    assert [path.name for path in restarted.part_files()] == ['part-000001.csv', 'part-000002.csv',
+                                                              'part-000003.csv']
+
+
+def test_merge_appends_parts_to_existing_output(tmp_path):
+    output_path = tmp_path / 'result.csv'
+    pd.DataFrame(_records([1, 2])).to_csv(output_path, index=False)
+
+    writer = PartitionedResultWriter(output_path)
+    writer.write(_records([3, 4]))
+    # 后续批次多出的列与之前的结果按列名对齐
+    writer.write(_records([5], panorama_id='P5'))
+
+    assert writer.merge(include_existing=True) == 5
+    assert not writer.parts_dir.exists()
+    merged = pd.read_csv(output_path)
+    assert merged['PID'].tolist() == [1, 2, 3, 4, 5]
+    assert merged['panorama_id'].tolist()[-1] == 'P5'
+    assert merged['panorama_id'].isna().sum() == 4
+
+    # 合并后分片序号从头开始
+    assert writer.write(_records([6])).name == 'part-000001.csv'
+
+
+def test_merge_without_existing_output_replaces_it(tmp_path):
+    output_path = tmp_path / 'result.csv'
+    pd.DataFrame(_records([1, 2])).to_csv(output_path, index=False)
+
+    writer = PartitionedResultWriter(output_path)
+    writer.write(_records([3]))
+
+    assert writer.merge() == 1
+    assert pd.read_csv(output_path)['PID'].tolist() == [3]
+    assert writer.merge() is None
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_merge_result_files_keeps_first_source_for_duplicate_ids(tmp_path, fmt):
+    sources = []
+    for name, records in [('node0', _records([1, 2], year=2019)),
+                          ('node1', _records([2, 3], year=2020) + [{'PID': 3, 'status': 'success', 'year': 2021}])]:
+        path = tmp_path / f"{name}.{fmt}"
+        df = pd.DataFrame(records)
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+        sources.append(path)
+
+    target = tmp_path / f"merged.{fmt}"
+    assert merge_result_files(sources, target, fmt, dedup_field='PID') == 4
+
+    merged = pd.read_parquet(target) if fmt == 'parquet' else pd.read_csv(target)
+    # 采样点2只保留node0的结果，node1中采样点3的多个年份全部保留
+    assert merged[['PID', 'year']].values.tolist() == [[1, 2019], [2, 2019], [3, 2020], [3, 2021]]
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from utils.work_queue import WorkQueue
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _chunks(count, chunksize=10):
+    """模拟iter_input_chunks产出的采样点数据块"""
+    for start in range(0, count, chunksize):
+        chunk = pd.DataFrame({'PID': range(start, min(count, start + chunksize))})
+        chunk['Lon'] = 108.9
+        chunk['Lat'] = 34.2
+        chunk['_pid_str'] = chunk['PID'].astype(str)
+        yield chunk
+
+
+def _drain(queue, skip_pids=None):
+    """像爬虫主循环一样处理节点领取到的全部批次，返回处理的采样点ID"""
+    pids = []
+    for chunk in queue.iter_chunks('PID', skip_pids):
+        pids.extend(chunk['PID'].tolist())
+        queue.mark_done(chunk['_queue_batch'].tolist())
+    return pids
+
+
+def test_populate_and_process_all_batches(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.sqlite', 'A', poll_interval=0.1)
+    assert queue.populate(_chunks(25), batch_size=10) == 3
+    # 已填充的队列不会重复写入
+    assert queue.populate(_chunks(25), batch_size=10) == 0
+
+    assert sorted(_drain(queue)) == list(range(25))
+    assert queue.stats() == {'done': {'batches': 3, 'points': 25}}
+    queue.close()
+
+
+def test_other_node_reclaims_batch_of_killed_node(tmp_path):
+    db_path = tmp_path / 'queue.sqlite'
+    queue = WorkQueue(db_path, 'B', lease_seconds=1, poll_interval=0.1)
+    queue.populate(_chunks(30), batch_size=10)
+
+    # 节点A领取一个批次后被强制结束，不会释放租约
+    script = (
+        "import sys, time\n"
+        "from utils.work_queue import WorkQueue\n"
+        "queue = WorkQueue(sys.argv[1], 'A', lease_seconds=1, heartbeat_interval=60)\n"
+        "batch_id, chunk = queue.claim()\n"
+        "print(batch_id, flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    node = subprocess.Popen([sys.executable, '-c', script, str(db_path)], cwd=ROOT,
+                            env={**os.environ, 'PYTHONPATH': str(ROOT)}, stdout=subprocess.PIPE, text=True)
+    try:
+        claimed_by_a = int(node.stdout.readline())
+    finally:
+        node.kill()
+        node.wait()
+        node.stdout.close()
+
+    # 节点B处理完其余批次后等待A的租约过期，再重新领取A的批次
+    assert sorted(_drain(queue)) == list(range(30))
+    assert queue.stats() == {'done': {'batches': 3, 'points': 30}}
+    attempts = queue._execute('SELECT attempts FROM batches WHERE id = ?', (claimed_by_a,)).fetchone()[0]
+    assert attempts == 2
+    queue.close()
+
+
+def test_node_waits_for_batches_leased_by_live_node(tmp_path):
+    db_path = tmp_path / 'queue.sqlite'
+    node_a = WorkQueue(db_path, 'A', lease_seconds=60, poll_interval=0.1)
+    node_a.populate(_chunks(20), batch_size=10)
+    chunks_a = node_a.iter_chunks('PID')
+    chunk_a = next(chunks_a)
+
+    finished_a = []
+
+    def finish_a():
+        time.sleep(0.5)
+        node_a.mark_done(chunk_a['_queue_batch'].tolist())
+        finished_a.append(time.monotonic())
+
+    thread = threading.Thread(target=finish_a)
+    thread.start()
+
+    node_b = WorkQueue(db_path, 'B', lease_seconds=60, poll_interval=0.1)
+    pids_b = _drain(node_b)
+    finished_b = time.monotonic()
+    thread.join()
+
+    # 节点B只处理了另一个批次，但要等A的批次完成后才结束
+    assert sorted(pids_b) == list(range(10, 20))
+    assert finished_b >= finished_a[0]
+    assert node_b.stats() == {'done': {'batches': 2, 'points': 20}}
+    node_a.close()
+    node_b.close()
+
+
+def test_restarted_node_skips_points_already_written(tmp_path):
+    db_path = tmp_path / 'queue.sqlite'
+    queue = WorkQueue(db_path, 'A', lease_seconds=0.5, poll_interval=0.1)
+    queue.populate(_chunks(20), batch_size=10)
+    first = queue.claim()[1]
+    second = queue.claim()[1]
+    queue.close()
+
+    # 重启前第一个批次已全部写入结果，第二个批次写入了前3个采样点
+    written = set(first['PID'].astype(str)) | set(second['PID'].astype(str)[:3])
+    time.sleep(0.6)
+    restarted = WorkQueue(db_path, 'A', lease_seconds=0.5, poll_interval=0.1)
+    assert sorted(_drain(restarted, written)) == second['PID'].tolist()[3:]
+    assert restarted.stats() == {'done': {'batches': 2, 'points': 20}}
+    restarted.close()
@@ -0,0 +1,537 @@
+# utils/cache.py
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from config.config import CACHE_DIR, CACHE_CONFIG
+from utils.logger import logger, log_exception
+
+
+class SqliteCache:
+    """基于SQLite的本地持久化缓存基类
+
+    连接按进程懒加载，多线程共享同一连接并通过锁串行访问。
+    """
+
+    schema = ''
+
+    def __init__(self, db_path, enabled=True):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connection(self):
+        """获取当前进程的数据库连接"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.schema)
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _record(self, hit):
+        """记录命中统计"""
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def drain_stats(self):
+        """取出并清空命中统计，用于多进程模式下子进程向主进程汇总
+
+        Returns:
+            tuple: (命中次数, 未命中次数)
+        """
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+        return hits, misses
+
+    def merge_stats(self, hits, misses):
+        """合并drain_stats()取出的命中统计"""
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class PanoramaIdCache(SqliteCache):
+    """qsdata全景图ID缓存
+
+    以量化后的百度墨卡托网格为键，保存网格对应的全景图ID。
+    "无全景图"的查询结果同样缓存，但使用单独(通常更短)的有效期。
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS pano_id (
+            cell_x INTEGER NOT NULL,
+            cell_y INTEGER NOT NULL,
+            panorama_id TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (cell_x, cell_y)
+        );
+    '''
+
+    def __init__(self, db_path, grid_size=5, ttl=None, negative_ttl=None, enabled=True):
+        super().__init__(db_path, enabled)
+        self.grid_size = grid_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def cell(self, bd_x, bd_y):
+        """计算坐标所在的网格"""
+        return math.floor(float(bd_x) / self.grid_size), math.floor(float(bd_y) / self.grid_size)
+
+    def get(self, bd_x, bd_y):
+        """查询网格缓存
+
+        Args:
+            bd_x: 百度墨卡托x坐标
+            bd_y: 百度墨卡托y坐标
+
+        Returns:
+            tuple: (是否命中, 全景图ID)，命中"无全景图"结果时全景图ID为None
+        """
+        if not self.enabled:
+            return False, None
+
+        cell_x, cell_y = self.cell(bd_x, bd_y)
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    'SELECT panorama_id, updated_at FROM pano_id WHERE cell_x = ? AND cell_y = ?',
+                    (cell_x, cell_y)
+                ).fetchone()
+        except Exception as e:
+            log_exception(e, f"Failed to read panorama ID cache for cell ({cell_x}, {cell_y})")
+            return False, None
+
+        if row is not None:
+            panorama_id, updated_at = row
+            ttl = self.ttl if panorama_id else self.negative_ttl
+            if ttl is None or time.time() - updated_at <= ttl:
+                self._record(True)
+                return True, panorama_id
+
+        self._record(False)
+        return False, None
+
+    def put(self, bd_x, bd_y, panorama_id):
+        """写入网格缓存，panorama_id为None表示该网格没有全景图"""
+        if not self.enabled:
+            return
+
+        cell_x, cell_y = self.cell(bd_x, bd_y)
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO pano_id (cell_x, cell_y, panorama_id, updated_at) VALUES (?, ?, ?, ?)',
+                    (cell_x, cell_y, panorama_id, time.time())
+                )
+                conn.commit()
+        except Exception as e:
+            log_exception(e, f"Failed to write panorama ID cache for cell ({cell_x}, {cell_y})")
+
+
+class MetadataCache(SqliteCache):
+    """sdata全景图元数据缓存
+
+    以全景图ID为键，保存压缩后的元数据JSON。超过有效期的记录视为未命中，
+    缓存总大小超过上限时按写入时间淘汰最早的记录。
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS metadata (
+            panorama_id TEXT PRIMARY KEY,
+            content BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_metadata_updated_at ON metadata (updated_at);
+    '''
+
+    # 每写入多少条记录检查一次缓存大小
+    evict_check_interval = 500
+
+    def __init__(self, db_path, ttl=None, max_bytes=None, enabled=True):
+        super().__init__(db_path, enabled)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._puts_since_check = 0
+
+    def get(self, panorama_id):
+        """查询元数据缓存
+
+        Args:
+            panorama_id: 全景图ID
+
+        Returns:
+            dict: 元数据内容 或 None
+        """
+        if not self.enabled or not panorama_id:
+            return None
+
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    'SELECT content, updated_at FROM metadata WHERE panorama_id = ?',
+                    (panorama_id,)
+                ).fetchone()
+            if row is not None and (self.ttl is None or time.time() - row[1] <= self.ttl):
+                content = json.loads(zlib.decompress(row[0]).decode('utf-8'))
+                self._record(True)
+                return content
+        except Exception as e:
+            log_exception(e, f"Failed to read metadata cache for ID {panorama_id}")
+
+        self._record(False)
+        return None
+
+    def put(self, panorama_id, content):
+        """写入元数据缓存"""
+        if not self.enabled or not panorama_id or not content:
+            return
+
+        try:
+            blob = zlib.compress(json.dumps(content, ensure_ascii=False).encode('utf-8'))
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO metadata (panorama_id, content, size, updated_at) VALUES (?, ?, ?, ?)',
+                    (panorama_id, blob, len(blob), time.time())
+                )
+                conn.commit()
+
+                self._puts_since_check += 1
+                if self._puts_since_check >= self.evict_check_interval:
+                    self._puts_since_check = 0
+                    self._evict(conn)
+        except Exception as e:
+            log_exception(e, f"Failed to write metadata cache for ID {panorama_id}")
+
+    def _evict(self, conn):
+        """缓存超过大小上限时淘汰最早写入的记录，直到降至上限的90%"""
+        if not self.max_bytes:
+            return
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = total - int(self.max_bytes * 0.9)
+        removed = 0
+        stale_ids = []
+        for panorama_id, size in conn.execute('SELECT panorama_id, size FROM metadata ORDER BY updated_at'):
+            stale_ids.append((panorama_id,))
+            removed += size
+            if removed >= target:
+                break
+
+        conn.executemany('DELETE FROM metadata WHERE panorama_id = ?', stale_ids)
+        conn.commit()
+        logger.info(f"Evicted {len(stale_ids)} entries ({removed} bytes) from metadata cache")
+
+
+class ImageStore(SqliteCache):
+    """按内容寻址的图片存储索引
+
+    以(全景图ID, 缩放级别)或(全景图ID, heading/pitch/fovy/尺寸等请求参数)为键，记录第一次下载保存的图片路径。
+    同一键再次出现时不再下载，而是为新的采样点创建指向已有文件的硬链接(或直接引用已有文件)。
+    同一进程内并发下载同一键时，只有第一个线程下载，其余线程等待其结果。
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS images (
+            image_key TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, db_path, link_mode='hardlink', enabled=True):
+        super().__init__(db_path, enabled)
+        self.link_mode = link_mode
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def get(self, image_key):
+        """查询已保存的图片路径，记录存在但文件已被删除时视为未命中"""
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    'SELECT path FROM images WHERE image_key = ?', (image_key,)
+                ).fetchone()
+        except Exception as e:
+            log_exception(e, f"Failed to read image store for key {image_key}")
+            return None
+
+        if row is not None and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def reserve(self, image_key):
+        """查询图片并在未命中时占用下载权
+
+        Args:
+            image_key: 图片键
+
+        Returns:
+            tuple: ('hit', 已有图片路径) / ('wait', threading.Event) / ('own', None)
+                   'own'表示调用方负责下载，完成后必须调用put或release
+        """
+        if not self.enabled:
+            return 'own', None
+
+        with self._in_flight_lock:
+            event = self._in_flight.get(image_key)
+            if event is None:
+                path = self.get(image_key)
+                if path is None:
+                    self._in_flight[image_key] = threading.Event()
+                    self._record(False)
+                    return 'own', None
+        if event is not None:
+            return 'wait', event
+
+        self._record(True)
+        return 'hit', path
+
+    def wait(self, image_key, event):
+        """等待其他线程下载同一图片，返回其保存路径，对方下载失败时返回None"""
+        event.wait()
+        path = self.get(image_key)
+        if path is not None:
+            self._record(True)
+        return path
+
+    def put(self, image_key, path):
+        """记录下载保存的图片，并唤醒等待同一图片的线程"""
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO images (image_key, path, updated_at) VALUES (?, ?, ?)',
+                    (image_key, str(path), time.time())
+                )
+                conn.commit()
+        except Exception as e:
+            log_exception(e, f"Failed to write image store for key {image_key}")
+        finally:
+            self.release(image_key)
+
+    def release(self, image_key):
+        """放弃下载权(下载失败时调用)，唤醒等待的线程"""
+        with self._in_flight_lock:
+            event = self._in_flight.pop(image_key, None)
+        if event is not None:
+            event.set()
+
+    def materialize(self, source, target):
+        """为新的采样点生成图片文件
+
+        Args:
+            source: 已保存的图片路径
+            target: 新采样点的图片路径
+
+        Returns:
+            str: 新采样点应记录的图片路径(硬链接失败或link_mode为reference时为已有图片路径)
+        """
+        source = str(source)
+        target = str(target)
+        if source == target or self.link_mode != 'hardlink':
+            return source
+
+        try:
+            if os.path.exists(target):
+                if os.path.samefile(source, target):
+                    return target
+                os.remove(target)
+            os.link(source, target)
+            return target
+        except OSError as e:
+            logger.debug(f"Failed to hardlink {source} to {target}, referencing existing image: {str(e)}")
+            return source
+
+
+class TileStore(SqliteCache):
+    """不完整全景图的瓦片存储
+
+    全景图的瓦片在下载后逐块保存，重试后仍缺少瓦片时记录缺失瓦片的位置。之后再次下载同一全景图时
+    (后续采样点或 --repair)先恢复已保存的瓦片，只请求缺失的瓦片，全景图完整保存后删除其瓦片记录。
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS tiles (
+            image_key TEXT NOT NULL,
+            tile_row INTEGER NOT NULL,
+            tile_col INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (image_key, tile_row, tile_col)
+        );
+        CREATE TABLE IF NOT EXISTS panoramas (
+            image_key TEXT PRIMARY KEY,
+            missing TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    '''
+
+    def load(self, image_key):
+        """读取全景图已保存的瓦片
+
+        Args:
+            image_key: 图片键
+
+        Returns:
+            dict: {(行, 列): 瓦片数据}，全景图没有不完整记录时返回None
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            with self._lock:
+                conn = self._connection()
+                if conn.execute('SELECT 1 FROM panoramas WHERE image_key = ?', (image_key,)).fetchone() is None:
+                    return None
+                rows = conn.execute(
+                    'SELECT tile_row, tile_col, data FROM tiles WHERE image_key = ?', (image_key,)
+                ).fetchall()
+        except Exception as e:
+            log_exception(e, f"Failed to read tile store for key {image_key}")
+            return None
+
+        return {(row, col): bytes(data) for row, col, data in rows}
+
+    def add(self, image_key, position, data):
+        """保存全景图的一块瓦片，已保存过的瓦片会被覆盖
+
+        瓦片在全景图标记为不完整(mark_incomplete)之前不会被load读取。
+
+        Args:
+            image_key: 图片键
+            position: 瓦片位置(行, 列)
+            data: 瓦片数据
+        """
+        if not self.enabled:
+            return
+
+        row, col = position
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO tiles (image_key, tile_row, tile_col, data) VALUES (?, ?, ?, ?)',
+                    (image_key, row, col, data)
+                )
+                conn.commit()
+        except Exception as e:
+            log_exception(e, f"Failed to write tile ({row}, {col}) for key {image_key}")
+
+    def mark_incomplete(self, image_key, missing):
+        """记录不完整全景图缺失的瓦片位置，之后load可读取其已保存的瓦片
+
+        Args:
+            image_key: 图片键
+            missing: 缺失瓦片的位置列表
+        """
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT INTO panoramas (image_key, missing, attempts, updated_at) VALUES (?, ?, 1, ?) '
+                    'ON CONFLICT(image_key) DO UPDATE SET missing = excluded.missing, '
+                    'attempts = attempts + 1, updated_at = excluded.updated_at',
+                    (image_key, json.dumps(sorted(missing)), time.time())
+                )
+                conn.commit()
+        except Exception as e:
+            log_exception(e, f"Failed to write tile store for key {image_key}")
+
+    def complete(self, image_key):
+        """全景图已完整保存，删除其瓦片与缺失记录"""
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute('DELETE FROM tiles WHERE image_key = ?', (image_key,))
+                conn.execute('DELETE FROM panoramas WHERE image_key = ?', (image_key,))
+                conn.commit()
+        except Exception as e:
+            log_exception(e, f"Failed to clear tile store for key {image_key}")
+
+    def summary(self):
+        """返回不完整全景图数量与缺失瓦片总数"""
+        if not self.enabled or not os.path.exists(self.db_path):
+            return 0, 0
+
+        try:
+            with self._lock:
+                rows = self._connection().execute('SELECT missing FROM panoramas').fetchall()
+        except Exception as e:
+            log_exception(e, "Failed to read tile store summary")
+            return 0, 0
+        return len(rows), sum(len(json.loads(missing)) for missing, in rows)
+
+
+# 创建全局缓存实例
+pano_id_cache = PanoramaIdCache(
+    CACHE_DIR / CACHE_CONFIG['pano_id_db'],
+    grid_size=CACHE_CONFIG['grid_size'],
+    ttl=CACHE_CONFIG['pano_id_ttl'],
+    negative_ttl=CACHE_CONFIG['negative_ttl'],
+    enabled=CACHE_CONFIG['enabled']
+)
+
+metadata_cache = MetadataCache(
+    CACHE_DIR / CACHE_CONFIG['metadata_db'],
+    ttl=CACHE_CONFIG['metadata_ttl'],
+    max_bytes=CACHE_CONFIG['metadata_max_mb'] * 1024 * 1024,
+    enabled=CACHE_CONFIG['enabled']
+)
+
+image_store = ImageStore(
+    CACHE_DIR / CACHE_CONFIG['image_db'],
+    link_mode=CACHE_CONFIG['image_link_mode'],
+    enabled=CACHE_CONFIG['enabled'] and CACHE_CONFIG['image_dedup']
+)
+
+tile_store = TileStore(
+    CACHE_DIR / CACHE_CONFIG['tile_db'],
+    enabled=CACHE_CONFIG['enabled']
+)
@@ -0,0 +1,139 @@
+# utils/executor.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config.config import ENGINE_CONFIG
+from utils.logger import logger
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_download_executor():
+    """获取进程内共享的下载线程池
+
+    所有采样点的图片与瓦片下载任务都提交到该线程池，避免在每个采样点上重复创建线程。
+    注意：不要在下载线程内再向该线程池提交任务并等待结果，否则线程池占满时会互相等待。
+    """
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            workers = ENGINE_CONFIG['download_workers']
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+            _executor_pid = os.getpid()
+            logger.debug(f"Created download executor with {workers} workers")
+        return _executor
+
+
+def shutdown_download_executor(wait=True):
+    """关闭共享的下载线程池"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=wait)
+        _executor = None
+
+
+_hedge_executor = None
+_hedge_executor_pid = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor():
+    """获取进程内共享的对冲请求线程池
+
+    启用对冲请求时，图片与瓦片请求及其对冲请求在该线程池中发送，调用线程等待先返回的结果。
+    线程数为下载线程数的两倍，使每个下载线程的原始请求与对冲请求都有空闲线程。
+    """
+    global _hedge_executor, _hedge_executor_pid
+
+    with _hedge_executor_lock:
+        if _hedge_executor is None or _hedge_executor_pid != os.getpid():
+            workers = ENGINE_CONFIG['download_workers'] * 2
+            _hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+            _hedge_executor_pid = os.getpid()
+            logger.debug(f"Created hedge executor with {workers} workers")
+        return _hedge_executor
+
+
+def shutdown_hedge_executor(wait=True):
+    """关闭共享的对冲请求线程池"""
+    global _hedge_executor
+
+    with _hedge_executor_lock:
+        if _hedge_executor is not None and _hedge_executor_pid == os.getpid():
+            _hedge_executor.shutdown(wait=wait)
+        _hedge_executor = None
+
+
+_cpu_executor = None
+_cpu_executor_pid = None
+_cpu_slots = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor():
+    """获取进程内共享的CPU进程池
+
+    全景图瓦片解码与JPEG编码提交到该进程池执行，避免在下载线程中占用GIL。
+    ENGINE_CONFIG['cpu_workers']为0时不使用进程池，返回None。
+    进程池创建时主进程中已经运行着下载线程与事件循环，fork可能复制其他线程持有的锁而死锁，
+    因此子进程使用forkserver(不支持时使用spawn)方式启动。
+    """
+    global _cpu_executor, _cpu_executor_pid, _cpu_slots
+
+    workers = ENGINE_CONFIG['cpu_workers']
+    if workers == 0:
+        return None
+
+    with _cpu_executor_lock:
+        if _cpu_executor is None or _cpu_executor_pid != os.getpid():
+            workers = workers or os.cpu_count() or 1
+            _cpu_executor = ProcessPoolExecutor(max_workers=workers, mp_context=safe_mp_context())
+            _cpu_executor_pid = os.getpid()
+            _cpu_slots = threading.BoundedSemaphore(ENGINE_CONFIG['cpu_max_pending'])
+            logger.info(f"Created CPU process pool with {workers} workers")
+        return _cpu_executor
+
+
+def safe_mp_context():
+    """主进程已有其他线程运行时创建进程池使用的进程启动方式(forkserver，不支持时使用spawn)"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def submit_cpu_task(fn, *args):
+    """向CPU进程池提交任务
+
+    进程池中未完成的任务达到ENGINE_CONFIG['cpu_max_pending']时阻塞调用线程，
+    使下载阶段在CPU阶段跟不上时自动放慢，而不是无限堆积待处理的瓦片。
+
+    Returns:
+        Future: 任务结果
+    """
+    executor = get_cpu_executor()
+    slots = _cpu_slots
+    slots.acquire()
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def shutdown_cpu_executor(wait=True):
+    """关闭共享的CPU进程池"""
+    global _cpu_executor
+
+    with _cpu_executor_lock:
+        if _cpu_executor is not None and _cpu_executor_pid == os.getpid():
+            _cpu_executor.shutdown(wait=wait)
+        _cpu_executor = None
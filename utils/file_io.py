@@ -2,16 +2,18 @@
 import csv
 import os
 import json
+import threading
+import time
 import pandas as pd
 from pathlib import Path
 
 from utils.logger import logger
 
 
-def read_csv(file_path, encoding='utf-8'):
+def read_csv(file_path, encoding='utf-8', **kwargs):
     """读取CSV文件"""
     try:
-        df = pd.read_csv(file_path, encoding=encoding)
+        df = pd.read_csv(file_path, encoding=encoding, **kwargs)
         logger.info(f"Successfully read CSV file: {file_path}, rows: {len(df)}")
         return df
     except Exception as e:
@@ -19,6 +21,51 @@ def read_csv(file_path, encoding='utf-8'):
         raise
 
 
+def read_input_columns(file_path, encoding='utf-8'):
+    """读取采样点文件(CSV或Parquet)的字段名，不加载数据"""
+    if str(file_path).lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(file_path).names
+    return list(pd.read_csv(file_path, encoding=encoding, nrows=0).columns)
+
+
+def iter_input_chunks(file_path, pid_field, columns=None, chunksize=100000, skip_pids=None, encoding='utf-8'):
+    """分块流式读取采样点文件(CSV或Parquet)
+
+    Args:
+        file_path: 采样点文件路径，后缀为.parquet时按Parquet读取，否则按CSV读取
+        pid_field: 采样点ID字段
+        columns: 需要读取的字段，None表示读取全部字段
+        chunksize: 每块读取的行数
+        skip_pids: 需要跳过的采样点ID集合(字符串形式)，用于断点续传
+        encoding: CSV文件编码
+
+    Yields:
+        DataFrame: 增加了'_pid_str'字段且已去除跳过采样点的数据块
+    """
+    try:
+        if str(file_path).lower().endswith('.parquet'):
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(file_path)
+            chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns))
+        else:
+            chunks = pd.read_csv(file_path, encoding=encoding, usecols=columns, chunksize=chunksize)
+
+        total_rows = 0
+        for chunk in chunks:
+            total_rows += len(chunk)
+            chunk['_pid_str'] = chunk[pid_field].astype(str)
+            if skip_pids:
+                chunk = chunk[~chunk['_pid_str'].isin(skip_pids)]
+            if not chunk.empty:
+                yield chunk
+
+        logger.info(f"Successfully read input file: {file_path}, rows: {total_rows}")
+    except Exception as e:
+        logger.error(f"Failed to read input file {file_path}: {str(e)}")
+        raise
+
+
 def save_csv(df, file_path, encoding='utf-8-sig'):
     """保存DataFrame到CSV文件"""
     try:
@@ -61,4 +108,102 @@ def save_progress(processed_ids, progress_file):
                 f.write(f"{pid}\n")
         logger.info(f"Successfully saved progress to {progress_file}")
     except Exception as e:
-        logger.error(f"Failed to save progress to {progress_file}: {str(e)}")
\ No newline at end of file
+        logger.error(f"Failed to save progress to {progress_file}: {str(e)}")
+
+
+class ProgressJournal:
+    """追加写入的断点续传进度日志
+
+    每行记录一个已处理的采样点ID，写入开销只与新增记录数有关；
+    fsync按条数或时间间隔批量执行，避免每个采样点都触发磁盘同步。
+    """
+
+    def __init__(self, progress_file, fsync_every=1000, fsync_interval=5.0):
+        self.progress_file = progress_file
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def exists(self):
+        """进度日志是否存在"""
+        return os.path.exists(self.progress_file)
+
+    def load(self):
+        """读取已处理的采样点ID
+
+        中断时最后一行可能未写完整，没有换行符结尾的记录会被忽略。
+        """
+        if not self.exists():
+            return set()
+
+        try:
+            with open(self.progress_file, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            return set(line.strip() for line in lines[:-1] if line.strip())
+        except Exception as e:
+            logger.error(f"Failed to load progress journal {self.progress_file}: {str(e)}")
+            return set()
+
+    def reset(self):
+        """清空进度日志"""
+        with self._lock:
+            self._close_file()
+            if os.path.exists(self.progress_file):
+                os.remove(self.progress_file)
+
+    def append(self, pids):
+        """追加已处理的采样点ID"""
+        pids = list(pids)
+        if not pids:
+            return
+
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._file = self._open_file()
+                self._file.write(''.join(f"{pid}\n" for pid in pids))
+                # 每批都写入操作系统缓冲区，进程被强制结束时也不会丢失；fsync仍按批次执行
+                self._file.flush()
+                self._unsynced += len(pids)
+
+                if (self._unsynced >= self.fsync_every or
+                        time.monotonic() - self._last_sync >= self.fsync_interval):
+                    self._sync()
+        except Exception as e:
+            logger.error(f"Failed to append progress to {self.progress_file}: {str(e)}")
+
+    def close(self):
+        """同步并关闭进度日志"""
+        with self._lock:
+            self._close_file()
+
+    def _open_file(self):
+        """以追加方式打开进度日志
+
+        上次运行中断时最后一行可能未写完整(load会忽略该记录)，先将其截掉，避免与新追加的记录连成一行。
+        """
+        if self.exists():
+            with open(self.progress_file, 'r+b') as f:
+                size = f.seek(0, os.SEEK_END)
+                tail_start = max(0, size - 4096)
+                f.seek(tail_start)
+                tail = f.read()
+                if tail and not tail.endswith(b'\n'):
+                    f.truncate(tail_start + tail.rfind(b'\n') + 1)
+        return open(self.progress_file, 'a', encoding='utf-8')
+
+    def _sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
\ No newline at end of file
@@ -0,0 +1,59 @@
+# utils/hedging.py
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    """对冲请求策略
+
+    按接口记录最近成功请求的耗时，请求超过该耗时的指定分位数仍未返回时允许发送一个重复请求(对冲请求)。
+    对冲请求按令牌桶限额: 每个请求积累max_ratio个令牌，每个对冲请求消耗一个令牌，
+    因此对冲请求不超过请求总数的max_ratio(另有burst个令牌应对短时集中的慢请求)。
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.05, max_ratio=0.05, burst=10, window=1000, min_samples=50):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._delays = {}
+        self._pending = {}
+        self._tokens = {}
+
+    def record(self, endpoint, seconds):
+        """记录一次成功请求的耗时"""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+            # 每积累一定数量的新样本重新计算一次分位数，避免每个请求都排序
+            self._pending[endpoint] = self._pending.get(endpoint, 0) + 1
+            if len(samples) >= self.min_samples and self._pending[endpoint] >= max(1, len(samples) // 20):
+                ordered = sorted(samples)
+                index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+                self._delays[endpoint] = max(self.min_delay, ordered[index])
+                self._pending[endpoint] = 0
+
+    def delay(self, endpoint):
+        """返回发送对冲请求前的等待时间，样本不足时返回None(不对冲)
+
+        每次调用视为一个新请求，为该接口积累对冲令牌。
+        """
+        with self._lock:
+            self._tokens[endpoint] = min(self.burst, self._tokens.get(endpoint, 0.0) + self.max_ratio)
+            return self._delays.get(endpoint)
+
+    def try_hedge(self, endpoint):
+        """消耗一个对冲令牌，令牌不足时返回False"""
+        with self._lock:
+            if self._tokens.get(endpoint, 0.0) < 1:
+                return False
+            self._tokens[endpoint] -= 1
+            return True
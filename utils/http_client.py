@@ -1,61 +1,319 @@
 # utils/http_client.py
 import time
+import threading
 import requests
 import random
 import json
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlparse, parse_qs
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, Timeout, ConnectionError
+from concurrent.futures import wait, FIRST_COMPLETED
 
-from config.config import HTTP_CONFIG
+from config.config import HTTP_CONFIG, ENGINE_CONFIG, RATE_LIMIT_CONFIG, HEDGE_CONFIG
+from utils.executor import get_hedge_executor
+from utils.hedging import HedgePolicy
 from utils.logger import logger, log_exception
+from utils.metrics import metrics
+from utils.rate_limiter import AdaptiveRateLimiter
+
+
+class RequestCancelled(RequestException):
+    """请求被取消(对冲请求中未胜出的一方)"""
 
 
 class HttpClient:
     """HTTP请求客户端"""
 
-    def __init__(self, max_retries=None, retry_delay=None, timeout=None, headers=None):
+    def __init__(self, max_retries=None, retry_delay=None, timeout=None, headers=None, endpoint_limits=None,
+                 pool_size=None):
         self.max_retries = max_retries or HTTP_CONFIG['max_retries']
         self.retry_delay = retry_delay or HTTP_CONFIG['retry_delay']
         self.timeout = timeout or HTTP_CONFIG['timeout']
         self.headers = headers or HTTP_CONFIG['headers'].copy()
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        self.backoff_max = RATE_LIMIT_CONFIG['backoff_max']
+        # 连接池在所有线程间共享，连接用尽时等待而不是新建临时连接。启用对冲请求时下载线程在对冲线程池
+        # (下载线程数的两倍)中发送请求并等待结果，因此大小按对冲线程数加上并发采样点数计算
+        self.pool_size = pool_size or ENGINE_CONFIG['download_workers'] * 2 + ENGINE_CONFIG['concurrency']
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, pool_block=True)
+        self._local = threading.local()
+        self.hedge_policy = self._create_hedge_policy()
+        self.set_endpoint_limits(endpoint_limits or ENGINE_CONFIG['endpoint_limits'])
+
+    @staticmethod
+    def _create_hedge_policy():
+        return HedgePolicy(
+            percentile=HEDGE_CONFIG['percentile'],
+            min_delay=HEDGE_CONFIG['min_delay'],
+            max_ratio=HEDGE_CONFIG['max_ratio'],
+            burst=HEDGE_CONFIG['burst'],
+            window=HEDGE_CONFIG['window'],
+            min_samples=HEDGE_CONFIG['min_samples']
+        )
+
+    @property
+    def session(self):
+        """当前线程的Session，各线程的Session共用同一个连接池"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+    def set_endpoint_limits(self, endpoint_limits, share=1.0):
+        """为各接口(按qt参数区分)创建限速器
+
+        Args:
+            endpoint_limits: 各接口的并发请求上限
+            share: 本进程分得的速率与并发比例，多进程模式下各进程合计不超过配置值
+        """
+        adaptive = RATE_LIMIT_CONFIG['adaptive']
+        self.limiters = {}
+        for endpoint, limit in endpoint_limits.items():
+            rate = RATE_LIMIT_CONFIG['initial_rate'].get(endpoint) if adaptive else None
+            limit = max(1, int(limit * share))
+            self.limiters[endpoint] = AdaptiveRateLimiter(
+                endpoint,
+                rate=rate * share if rate else rate,
+                min_rate=RATE_LIMIT_CONFIG['min_rate'],
+                max_rate=RATE_LIMIT_CONFIG['max_rate'].get(endpoint, limit) * share,
+                concurrency=max(1, limit // 2) if adaptive else limit,
+                max_concurrency=limit,
+                increase_step=RATE_LIMIT_CONFIG['increase_step'] * share,
+                decrease_factor=RATE_LIMIT_CONFIG['decrease_factor'],
+                adaptive=adaptive
+            )
+
+    def reset(self, share=1.0):
+        """为当前进程重建连接池、Session与限速器(多进程模式的子进程启动时调用)
+
+        Args:
+            share: 本进程分得的速率与并发比例
+        """
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, pool_block=True)
+        self._local = threading.local()
+        self.hedge_policy = self._create_hedge_policy()
+        self.set_endpoint_limits(ENGINE_CONFIG['endpoint_limits'], share)
+
+    def _limiter(self, params):
+        """获取请求对应接口的限速器，未配置的接口返回None"""
+        if not params:
+            return None
+        return self.limiters.get(params.get('qt'))
+
+    def rate_stats(self):
+        """返回各接口当前的限速状态"""
+        return {endpoint: limiter.stats() for endpoint, limiter in self.limiters.items()}
+
+    @staticmethod
+    def _parse_retry_after(response):
+        """解析Retry-After响应头(秒数或HTTP日期)，返回等待秒数"""
+        value = response.headers.get('Retry-After') if response.headers else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _backoff(self, retry_count, retry_after=None):
+        """计算带随机抖动的指数退避时间"""
+        cap = min(self.backoff_max, self.retry_delay * 2 ** (retry_count - 1))
+        # 增加随机延迟，避免被检测为爬虫，也避免并发请求同时重试
+        sleep_time = random.uniform(cap / 2, cap)
+        if retry_after:
+            sleep_time = max(sleep_time, min(retry_after, self.backoff_max))
+        return sleep_time
+
+    @staticmethod
+    def _read_content(response, cancel_event=None):
+        """读取响应体，cancel_event被设置时中止读取并关闭连接"""
+        if cancel_event is None:
+            return response.content
+        chunks = []
+        for chunk in response.iter_content(chunk_size=65536):
+            if cancel_event.is_set():
+                response.close()
+                raise RequestCancelled("Request cancelled")
+            chunks.append(chunk)
+        response._content = b''.join(chunks)
+        return response._content
+
+    def _send(self, url, params, headers, stream, limiter, endpoint, cancel_event=None):
+        """发送一次请求(调用前已获取限速器名额)，返回响应"""
+        if cancel_event is not None and cancel_event.is_set():
+            # 等待限速器期间已被取消，不再发送
+            if limiter:
+                limiter.release()
+            raise RequestCancelled(f"Request to {url} cancelled")
+
+        metrics.gauge_add('http_in_flight', 1, endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=self.timeout,
+                stream=stream
+            )
+            if response.status_code == 200:
+                # 在计时范围内读取响应体，使耗时包含数据传输时间
+                size = len(self._read_content(response, cancel_event))
+            else:
+                # 流式请求的错误响应不会读取响应体，需关闭响应才能将连接归还连接池
+                response.close()
+        except RequestException as e:
+            if isinstance(e, RequestCancelled):
+                status = 'cancelled'
+            else:
+                status = 'timeout' if isinstance(e, Timeout) else 'error'
+            metrics.inc('http_requests_total', endpoint=endpoint, status=status)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('http_request_seconds', elapsed, endpoint=endpoint)
+            metrics.gauge_add('http_in_flight', -1, endpoint=endpoint)
+            if limiter:
+                limiter.release()
 
-    def get(self, url, params=None, headers=None, stream=False):
-        """发送GET请求"""
+        metrics.inc('http_requests_total', endpoint=endpoint, status=str(response.status_code))
+        if response.status_code == 200:
+            metrics.inc('http_bytes_total', size, endpoint=endpoint)
+            self.hedge_policy.record(endpoint, elapsed)
+            if limiter:
+                limiter.on_success()
+        return response
+
+    def _on_request_error(self, error, retry_count, limiter, endpoint):
+        """记录请求异常，超时与连接错误视为服务器限流"""
+        if isinstance(error, (ConnectionError, Timeout)):
+            metrics.inc('http_throttled_total', endpoint=endpoint)
+            log_exception(error, f"Connection error on attempt {retry_count + 1}/{self.max_retries + 1}")
+            if limiter:
+                limiter.on_throttle()
+        else:
+            log_exception(error, f"Request error on attempt {retry_count + 1}/{self.max_retries + 1}")
+
+    def get(self, url, params=None, headers=None, stream=False, cancel_event=None):
+        """发送GET请求
+
+        Args:
+            cancel_event: 可选的threading.Event，被设置后不再重试，并中止正在读取的响应体
+        """
         retry_count = 0
         merged_headers = self.headers.copy()
         if headers:
             merged_headers.update(headers)
+        limiter = self._limiter(params)
+        endpoint = params.get('qt', 'other') if params else 'other'
 
         while retry_count <= self.max_retries:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"Request to {url} cancelled")
+
+            retry_after = None
             try:
                 logger.debug(f"Sending GET request to {url}")
-                response = self.session.get(
-                    url,
-                    params=params,
-                    headers=merged_headers,
-                    timeout=self.timeout,
-                    stream=stream
-                )
+                if limiter:
+                    wait_start = time.perf_counter()
+                    limiter.acquire()
+                    metrics.observe('rate_limit_wait_seconds', time.perf_counter() - wait_start, endpoint=endpoint)
+                response = self._send(url, params, merged_headers, stream, limiter, endpoint, cancel_event)
+
                 if response.status_code == 200:
                     return response
                 else:
                     logger.warning(f"HTTP request failed with status code {response.status_code}: {url}")
-            except (ConnectionError, Timeout) as e:
-                log_exception(e, f"Connection error on attempt {retry_count + 1}/{self.max_retries + 1}")
+                    # 429与5xx视为服务器限流
+                    if response.status_code == 429 or response.status_code >= 500:
+                        metrics.inc('http_throttled_total', endpoint=endpoint)
+                        retry_after = self._parse_retry_after(response)
+                        if limiter:
+                            limiter.on_throttle(retry_after)
+            except RequestCancelled:
+                raise
             except RequestException as e:
-                log_exception(e, f"Request error on attempt {retry_count + 1}/{self.max_retries + 1}")
+                if cancel_event is not None and cancel_event.is_set():
+                    # 对冲请求已胜出，本请求的超时或连接错误不再记录与重试
+                    raise RequestCancelled(f"Request to {url} cancelled") from e
+                self._on_request_error(e, retry_count, limiter, endpoint)
 
             retry_count += 1
             if retry_count <= self.max_retries:
-                # 增加随机延迟，避免被检测为爬虫
-                sleep_time = self.retry_delay * (1 + random.random())
+                metrics.inc('http_retries_total', endpoint=endpoint)
+                sleep_time = self._backoff(retry_count, retry_after)
                 logger.info(f"Retrying in {sleep_time:.2f} seconds...")
-                time.sleep(sleep_time)
+                if cancel_event is not None:
+                    cancel_event.wait(sleep_time)
+                else:
+                    time.sleep(sleep_time)
 
         raise RequestException(f"Failed to get {url} after {self.max_retries} retries")
 
+    def _send_hedge(self, url, params, headers, limiter, endpoint, cancel_event):
+        """发送一次对冲请求(不重试)"""
+        merged_headers = self.headers.copy()
+        if headers:
+            merged_headers.update(headers)
+        if limiter:
+            limiter.acquire()
+        response = self._send(url, params, merged_headers, True, limiter, endpoint, cancel_event)
+        if response.status_code != 200:
+            if limiter and (response.status_code == 429 or response.status_code >= 500):
+                limiter.on_throttle(self._parse_retry_after(response))
+            raise RequestException(f"Hedged request failed with status code {response.status_code}: {url}")
+        return response
+
+    def get_hedged(self, url, params=None, headers=None):
+        """发送GET请求，请求耗时超过近期分位数时再发送一个对冲请求，返回先成功的响应
+
+        对冲请求同样经过接口限速器，且数量受HedgePolicy限额，因此不会超出接口的速率预算。未胜出的请求被取消: 不再重试，正在读取的响应体被中止。
+        未启用对冲请求(HEDGE_CONFIG['enabled'])时等同于get(stream=True)。
+        """
+        endpoint = params.get('qt', 'other') if params else 'other'
+        delay = self.hedge_policy.delay(endpoint) if HEDGE_CONFIG['enabled'] else None
+        if delay is None:
+            return self.get(url, params, headers, stream=True)
+
+        executor = get_hedge_executor()
+        primary_cancel = threading.Event()
+        primary = executor.submit(self.get, url, params, headers, True, primary_cancel)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        if not self.hedge_policy.try_hedge(endpoint):
+            return primary.result()
+        limiter = self._limiter(params)
+
+        metrics.inc('http_hedges_total', endpoint=endpoint)
+        hedge_cancel = threading.Event()
+        hedge = executor.submit(self._send_hedge, url, params, headers, limiter, endpoint, hedge_cancel)
+        cancels = {primary: primary_cancel, hedge: hedge_cancel}
+
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            metrics.inc('http_hedge_wins_total', endpoint=endpoint)
+                        return future.result()
+            # 两个请求都失败时以原始请求的异常为准
+            return primary.result()
+        finally:
+            for future in pending:
+                cancels[future].set()
+
     def get_json(self, url, params=None, headers=None):
         """发送GET请求并解析JSON响应"""
         response = self.get(url, params, headers)
@@ -73,9 +331,16 @@ class HttpClient:
             log_exception(e, "Failed to parse JSON response")
             raise
 
-    def get_image(self, url, params=None, headers=None):
-        """获取图片内容"""
-        response = self.get(url, params, headers, stream=True)
+    def get_image(self, url, params=None, headers=None, hedge=False):
+        """获取图片内容
+
+        Args:
+            hedge: 是否允许发送对冲请求(见get_hedged)
+        """
+        if hedge:
+            response = self.get_hedged(url, params, headers)
+        else:
+            response = self.get(url, params, headers, stream=True)
         return response.content
 
 
@@ -0,0 +1,273 @@
+# utils/image_layout.py
+import csv
+import hashlib
+import math
+import os
+import threading
+from pathlib import Path
+
+from config.config import IMAGE_OUTPUT_DIR, DIRECTIONAL_IMAGE_DIR, PANORAMIC_IMAGE_DIR, IMAGE_LAYOUT_CONFIG
+from utils.logger import logger, log_exception
+
+
+class ImageLayout:
+    """图片目录布局
+
+    flat: 所有图片直接保存在图片目录下(原有布局)
+    hash: 按PID哈希值的前几位分为多级子目录，各子目录的文件数量均匀
+    pid:  按数值PID分桶(PID // pid_bucket)，相邻采样点的图片位于同一子目录
+    grid: 按采样点经纬度所在的网格分目录，同一区域的图片位于同一子目录
+
+    分目录时结果中的图片路径为相对于图片根目录的相对路径。
+    """
+
+    def __init__(self, root, layout='flat', depth=2, width=2, pid_bucket=1000, grid_size=0.01):
+        if layout not in ('flat', 'hash', 'pid', 'grid'):
+            raise ValueError(f"Unknown image layout: {layout}")
+
+        self.root = Path(root)
+        self.layout = layout
+        self.depth = depth
+        self.width = width
+        self.pid_bucket = pid_bucket
+        self.grid_size = grid_size
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def _hash_shard(self, pid):
+        digest = hashlib.md5(str(pid).encode('utf-8')).hexdigest()
+        return [digest[i * self.width:(i + 1) * self.width] for i in range(self.depth)]
+
+    def shard(self, pid, lon, lat):
+        """计算采样点图片所在的子目录
+
+        Returns:
+            list: 各级子目录名称
+        """
+        if self.layout == 'hash':
+            return self._hash_shard(pid)
+
+        if self.layout == 'pid':
+            try:
+                return [str(int(float(pid)) // self.pid_bucket)]
+            except (TypeError, ValueError):
+                # 非数值PID使用哈希分目录
+                return self._hash_shard(pid)
+
+        if self.layout == 'grid':
+            return [f"{math.floor(float(lon) / self.grid_size)}_{math.floor(float(lat) / self.grid_size)}"]
+
+        return []
+
+    def image_path(self, base_dir, file_name, pid, lon, lat):
+        """计算图片保存路径，并确保所在目录存在
+
+        每个子目录在进程内只创建一次，文件数量增加时创建文件的开销保持不变。
+
+        Args:
+            base_dir: 图片类型目录(四方向/全景)
+            file_name: 文件名
+            pid: 采样点ID
+            lon: 经度
+            lat: 纬度
+
+        Returns:
+            Path: 图片保存路径
+        """
+        directory = Path(base_dir).joinpath(*self.shard(pid, lon, lat))
+        if directory not in self._created:
+            with self._lock:
+                if directory not in self._created:
+                    os.makedirs(directory, exist_ok=True)
+                    self._created.add(directory)
+        return directory / file_name
+
+    def result_path(self, path):
+        """返回写入结果的图片路径，分目录时为相对于图片根目录的相对路径"""
+        if self.layout == 'flat':
+            return str(path)
+        try:
+            return Path(path).relative_to(self.root).as_posix()
+        except ValueError:
+            return str(path)
+
+
+class ImageManifest:
+    """采样点图片清单
+
+    以追加方式记录每个采样点对应的图片键与图片路径(PID, Tag, ImageKey, Path)，
+    可据此按PID或全景图查找图片，而不需要遍历图片目录。同一采样点重复爬取时以最后一条记录为准。
+    """
+
+    columns = ['PID', 'Tag', 'ImageKey', 'Path']
+
+    def __init__(self, manifest_file, enabled=True):
+        self.manifest_file = Path(manifest_file)
+        self.enabled = enabled
+        self._file = None
+        self._writer = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def record(self, pid, tag, image_key, path):
+        """追加一条图片记录"""
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                if self._file is None or self._pid != os.getpid():
+                    is_new = not self.manifest_file.exists() or self.manifest_file.stat().st_size == 0
+                    self._file = open(self.manifest_file, 'a', encoding='utf-8', newline='')
+                    self._writer = csv.writer(self._file)
+                    self._pid = os.getpid()
+                    if is_new:
+                        self._writer.writerow(self.columns)
+                self._writer.writerow([pid, tag or '', image_key, path])
+                self._file.flush()
+        except Exception as e:
+            log_exception(e, f"Failed to write image manifest {self.manifest_file}")
+
+    def close(self):
+        """关闭清单文件"""
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+                logger.debug(f"Closed image manifest {self.manifest_file}")
+            self._file = None
+            self._writer = None
+
+
+class ExistingImageIndex:
+    """断点续传时已存在的图片索引
+
+    启动时遍历一次图片目录记录已有的图片文件，之后判断图片是否已下载只需查询索引，
+    不再对每个文件调用exists。命中索引的图片使用前检查文件大小与JPEG文件头/文件尾，
+    写入中断的不完整图片会被删除并重新下载。
+    """
+
+    def __init__(self, directories, min_size=128):
+        self.directories = [str(directory) for directory in directories]
+        self.min_size = min_size
+        self.reused = 0
+        self.rejected = 0
+        self._paths = None
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """遍历图片目录(包括分目录布局的子目录)，建立已有图片索引
+
+        Returns:
+            int: 已有图片数量
+        """
+        paths = set()
+        pending = list(self.directories)
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.endswith('.jpg'):
+                            paths.add(entry.path)
+            except FileNotFoundError:
+                continue
+
+        self._paths = paths
+        logger.info(f"Indexed {len(paths)} existing images")
+        return len(paths)
+
+    def snapshot(self):
+        """返回已建立的索引，未建立索引时返回None"""
+        return self._paths
+
+    def restore(self, paths):
+        """使用主进程建立的索引
+
+        多进程模式下工作进程在启动时调用。spawn方式启动的工作进程不会继承主进程的内存，
+        而工作进程各自遍历目录又可能把其他进程正在写入的图片当作已有图片，因此只使用主进程启动时的索引。
+        """
+        self._paths = paths
+
+    def _is_complete(self, path):
+        """检查文件大小与JPEG文件头(SOI)、文件尾(EOI)"""
+        try:
+            with open(path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size < self.min_size:
+                    return False
+                f.seek(0)
+                if f.read(2) != b'\xff\xd8':
+                    return False
+                # 文件尾之后可能有少量填充字节
+                f.seek(-32, os.SEEK_END)
+                return b'\xff\xd9' in f.read()
+        except OSError:
+            return False
+
+    def drain_stats(self):
+        """取出并清空复用统计，用于多进程模式下子进程向主进程汇总
+
+        Returns:
+            tuple: (复用数量, 不完整数量)
+        """
+        with self._lock:
+            reused, rejected = self.reused, self.rejected
+            self.reused = self.rejected = 0
+        return reused, rejected
+
+    def merge_stats(self, reused, rejected):
+        """合并drain_stats()取出的复用统计"""
+        with self._lock:
+            self.reused += reused
+            self.rejected += rejected
+
+    def lookup(self, path):
+        """判断图片是否在启动时已完整存在
+
+        Args:
+            path: 图片保存路径
+
+        Returns:
+            bool: 图片已完整存在时返回True，未建立索引时始终返回False
+        """
+        if not self._paths:
+            return False
+
+        path = str(path)
+        if path not in self._paths:
+            return False
+
+        complete = self._is_complete(path)
+        with self._lock:
+            if complete:
+                self.reused += 1
+            else:
+                self.rejected += 1
+        if not complete:
+            # 删除不完整的图片，避免图片去重索引继续引用它
+            logger.warning(f"Existing image {path} is incomplete, downloading again")
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove incomplete image {path}: {str(e)}")
+        return complete
+
+
+# 创建全局图片布局与清单实例
+image_layout = ImageLayout(
+    IMAGE_OUTPUT_DIR,
+    layout=IMAGE_LAYOUT_CONFIG['layout'],
+    depth=IMAGE_LAYOUT_CONFIG['depth'],
+    width=IMAGE_LAYOUT_CONFIG['width'],
+    pid_bucket=IMAGE_LAYOUT_CONFIG['pid_bucket'],
+    grid_size=IMAGE_LAYOUT_CONFIG['grid_size']
+)
+
+image_manifest = ImageManifest(
+    IMAGE_OUTPUT_DIR / IMAGE_LAYOUT_CONFIG['manifest_file'],
+    enabled=IMAGE_LAYOUT_CONFIG['manifest']
+)
+
+existing_images = ExistingImageIndex([DIRECTIONAL_IMAGE_DIR, PANORAMIC_IMAGE_DIR])
@@ -1,13 +1,20 @@
 # utils/image_utils.py
 import os
 import io
+import threading
+import uuid
+from multiprocessing import shared_memory
 import numpy as np
 from PIL import Image
 from pathlib import Path
 
+from utils.executor import submit_cpu_task
+from utils.image_workers import decode_tile, encode_canvas
 from utils.logger import logger, log_exception
+from utils.metrics import metrics
 
 
+@metrics.timed('image_write')
 def save_image(image_data, file_path):
     """保存图片数据到文件"""
     try:
@@ -20,49 +27,180 @@ def save_image(image_data, file_path):
         return False
 
 
-def stitch_tiles(tiles, rows, cols):
-    """拼接图像瓦片
+class TileCanvas:
+    """增量拼接全景图瓦片的画布
 
-    Args:
-        tiles: 包含图像数据的二维数组
-        rows: 行数
-        cols: 列数
+    画布在收到第一块瓦片时按瓦片尺寸预先分配，之后每块瓦片下载完成后立即解码并写入对应位置，
+    不再保留瓦片的原始数据。画布使用RGBX四通道数组，生成的图像与数组共享内存，
+    保存JPEG时无需再复制一份完整画布。
 
-    Returns:
-        拼接好的图像
+    processes为True时画布分配在共享内存(或内存映射文件)中，瓦片解码与JPEG编码提交到CPU进程池执行，
+    paste只负责把瓦片数据写入共享内存并立即返回，下载线程可以继续下载其他瓦片。
     """
+
+    def __init__(self, rows, cols, memmap_dir=None, processes=False):
+        """
+        Args:
+            rows: 瓦片行数
+            cols: 瓦片列数
+            memmap_dir: 指定目录时画布使用该目录下的内存映射文件，否则使用内存数组
+            processes: 是否使用CPU进程池解码瓦片与编码JPEG
+        """
+        self.rows = rows
+        self.cols = cols
+        self.memmap_dir = memmap_dir
+        self.processes = processes
+        self.memmap_path = None
+        self.shm = None
+        self.backing = None
+        self.array = None
+        self.tile_width = None
+        self.tile_height = None
+        self.filled = set()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _allocate(self, tile_width, tile_height):
+        """按瓦片尺寸分配画布"""
+        shape = (self.rows * tile_height, self.cols * tile_width, 4)
+        if self.memmap_dir is not None:
+            self.memmap_path = Path(self.memmap_dir) / f"canvas_{uuid.uuid4().hex}.dat"
+            self.array = np.memmap(self.memmap_path, dtype=np.uint8, mode='w+', shape=shape)
+            self.backing = ('file', str(self.memmap_path))
+        elif self.processes:
+            self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+            self.array = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+            self.backing = ('shm', self.shm.name)
+        else:
+            self.array = np.zeros(shape, dtype=np.uint8)
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+
+    @metrics.timed('tile_paste')
+    def paste(self, row, col, tile_data):
+        """解码瓦片并写入画布(使用进程池时只提交解码任务)
+
+        Args:
+            row: 行索引
+            col: 列索引
+            tile_data: 瓦片图像数据
+        """
+        if self.processes:
+            self._submit_paste(row, col, tile_data)
+            return
+
+        with Image.open(io.BytesIO(tile_data)) as img:
+            img = img.convert('RGB')
+
+        with self._lock:
+            if self.array is None:
+                self._allocate(img.width, img.height)
+
+        if img.size != (self.tile_width, self.tile_height):
+            logger.warning(f"Tile ({row}, {col}) size {img.size} differs from "
+                           f"{(self.tile_width, self.tile_height)}, resizing")
+            img = img.resize((self.tile_width, self.tile_height))
+
+        top = row * self.tile_height
+        left = col * self.tile_width
+        self.array[top:top + self.tile_height, left:left + self.tile_width, :3] = np.asarray(img)
+
+        with self._lock:
+            self.filled.add((row, col))
+
+    def _submit_paste(self, row, col, tile_data):
+        """将瓦片数据写入共享内存并提交解码任务"""
+        # 只解析图像头获取瓦片尺寸，不解码像素
+        with Image.open(io.BytesIO(tile_data)) as img:
+            size = img.size
+
+        with self._lock:
+            if self.array is None:
+                self._allocate(*size)
+
+        tile_shm = shared_memory.SharedMemory(create=True, size=len(tile_data))
+        try:
+            tile_shm.buf[:len(tile_data)] = tile_data
+            future = submit_cpu_task(
+                decode_tile,
+                self.backing,
+                self.array.shape,
+                (self.tile_width, self.tile_height),
+                tile_shm.name,
+                len(tile_data),
+                row * self.tile_height,
+                col * self.tile_width
+            )
+        except Exception:
+            _release_shared_memory(tile_shm)
+            raise
+
+        future.add_done_callback(lambda _: _release_shared_memory(tile_shm))
+        with self._lock:
+            self._pending.append((row, col, future))
+
+    @metrics.timed('tile_decode_wait')
+    def wait(self):
+        """等待已提交的瓦片解码任务全部完成"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for row, col, future in pending:
+            try:
+                size = future.result()
+            except Exception as e:
+                log_exception(e, f"Failed to decode tile ({row}, {col})")
+                continue
+
+            if size != (self.tile_width, self.tile_height):
+                logger.warning(f"Tile ({row}, {col}) size {size} differs from "
+                               f"{(self.tile_width, self.tile_height)}, resized")
+            with self._lock:
+                self.filled.add((row, col))
+
+    def missing(self):
+        """返回缺失瓦片的位置"""
+        return [(i, j) for i in range(self.rows) for j in range(self.cols) if (i, j) not in self.filled]
+
+    def to_image(self):
+        """生成与画布共享内存的图像"""
+        height, width = self.array.shape[:2]
+        return Image.frombuffer('RGBX', (width, height), self.array, 'raw', 'RGBX', 0, 1)
+
+    @metrics.timed('panorama_encode')
+    def save(self, file_path, quality=95):
+        """将画布保存为JPEG文件(使用进程池时在子进程中编码)"""
+        if self.processes:
+            if isinstance(self.array, np.memmap):
+                self.array.flush()
+            submit_cpu_task(encode_canvas, self.backing, self.array.shape, str(file_path), quality).result()
+            return
+
+        image = self.to_image()
+        try:
+            image.save(file_path, "JPEG", quality=quality)
+        finally:
+            # 先释放与画布共享内存的图像，之后才能删除画布
+            del image
+
+    def close(self):
+        """释放画布，删除共享内存或内存映射文件"""
+        self.array = None
+        if self.shm is not None:
+            _release_shared_memory(self.shm)
+            self.shm = None
+        if self.memmap_path is not None:
+            try:
+                os.remove(self.memmap_path)
+            except OSError as e:
+                logger.warning(f"Failed to remove canvas file {self.memmap_path}: {str(e)}")
+            self.memmap_path = None
+
+
+def _release_shared_memory(shm):
+    """关闭并删除共享内存"""
     try:
-        # 把所有tiles转换为PIL图像
-        pil_tiles = []
-        for i in range(rows):
-            row_tiles = []
-            for j in range(cols):
-                if (i, j) in tiles:
-                    img = Image.open(io.BytesIO(tiles[(i, j)]))
-                    row_tiles.append(img)
-                else:
-                    # 如果缺失瓦片，创建一个空白图像
-                    logger.warning(f"Missing tile at position ({i}, {j})")
-                    # 获取其他瓦片的大小
-                    example_tile = next(iter(tiles.values()))
-                    example_img = Image.open(io.BytesIO(example_tile))
-                    blank_img = Image.new('RGB', example_img.size, (255, 255, 255))
-                    row_tiles.append(blank_img)
-            pil_tiles.append(row_tiles)
-
-        # 获取单个瓦片的宽度和高度
-        tile_width = pil_tiles[0][0].width
-        tile_height = pil_tiles[0][0].height
-
-        # 创建最终图像
-        stitched = Image.new('RGB', (cols * tile_width, rows * tile_height))
-
-        # 将瓦片放入最终图像
-        for i in range(rows):
-            for j in range(cols):
-                stitched.paste(pil_tiles[i][j], (j * tile_width, i * tile_height))
-
-        return stitched
-    except Exception as e:
-        log_exception(e, "Failed to stitch tiles")
-        raise
\ No newline at end of file
+        shm.close()
+        shm.unlink()
+    except (OSError, BufferError) as e:
+        logger.warning(f"Failed to release shared memory {shm.name}: {str(e)}")
@@ -0,0 +1,92 @@
+# utils/image_workers.py
+"""CPU进程池中执行的图像处理函数
+
+本模块只依赖NumPy与Pillow，不导入配置与日志模块，子进程启动时不会产生额外的副作用。
+瓦片数据与画布都通过共享内存(或内存映射文件)在进程间传递，任务参数中只包含名称、形状与坐标。
+"""
+
+import io
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+
+def _attach_canvas(backing, shape):
+    """打开父进程创建的画布
+
+    Args:
+        backing: ('shm', 共享内存名称) 或 ('file', 内存映射文件路径)
+        shape: 画布数组形状
+
+    Returns:
+        tuple: (共享内存对象 或 None, 画布数组)
+    """
+    kind, name = backing
+    if kind == 'file':
+        return None, np.memmap(name, dtype=np.uint8, mode='r+', shape=shape)
+
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+
+def decode_tile(backing, shape, tile_size, tile_name, data_size, top, left):
+    """解码共享内存中的瓦片并写入画布
+
+    Args:
+        backing: 画布存储位置
+        shape: 画布数组形状
+        tile_size: 画布中单个瓦片的尺寸(宽, 高)
+        tile_name: 保存瓦片数据的共享内存名称
+        data_size: 瓦片数据字节数
+        top: 瓦片在画布中的起始行
+        left: 瓦片在画布中的起始列
+
+    Returns:
+        tuple: 瓦片的原始尺寸(宽, 高)
+    """
+    tile_shm = shared_memory.SharedMemory(name=tile_name)
+    try:
+        data = io.BytesIO(tile_shm.buf[:data_size])
+    finally:
+        tile_shm.close()
+
+    with Image.open(data) as img:
+        img = img.convert('RGB')
+    original_size = img.size
+    if img.size != tuple(tile_size):
+        img = img.resize(tuple(tile_size))
+
+    shm, canvas = _attach_canvas(backing, shape)
+    try:
+        width, height = tile_size
+        canvas[top:top + height, left:left + width, :3] = np.asarray(img)
+        if shm is None:
+            canvas.flush()
+    finally:
+        del canvas
+        if shm is not None:
+            shm.close()
+
+    return original_size
+
+
+def encode_canvas(backing, shape, file_path, quality=95):
+    """将画布编码为JPEG文件
+
+    Args:
+        backing: 画布存储位置
+        shape: 画布数组形状
+        file_path: 输出文件路径
+        quality: JPEG质量
+    """
+    shm, canvas = _attach_canvas(backing, shape)
+    try:
+        height, width = shape[:2]
+        image = Image.frombuffer('RGBX', (width, height), canvas, 'raw', 'RGBX', 0, 1)
+        image.save(file_path, "JPEG", quality=quality)
+        del image
+    finally:
+        del canvas
+        if shm is not None:
+            shm.close()
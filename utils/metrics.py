@@ -0,0 +1,296 @@
+# utils/metrics.py
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config.config import METRICS_CONFIG
+from utils.logger import logger, log_exception
+
+# 延迟直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in key) + '}'
+
+
+class Histogram:
+    """固定分桶的延迟直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """按分桶线性插值估计分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= target and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'p99': round(self.quantile(0.99), 6)
+        }
+
+
+class Metrics:
+    """进程内的指标注册表
+
+    counter: 单调递增计数(请求数、错误数、下载字节数等)
+    gauge:   当前值(进行中的请求数等)
+    histogram: 延迟分布(各接口请求耗时、各处理阶段耗时)
+    指标名称与标签遵循Prometheus约定，可导出为Prometheus文本文件或JSON快照。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """增加计数"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge_add(self, name, delta, **labels):
+        """调整当前值"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        """记录一次耗时(秒)"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage):
+        """统计代码块耗时，记录到stage_seconds直方图"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage):
+        """装饰器：统计函数耗时，记录到stage_seconds直方图"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def drain(self):
+        """取出并清空计数与直方图，用于多进程模式下子进程向主进程汇总指标
+
+        Returns:
+            dict: {'counters': {键: 值}, 'histograms': {键: (分桶计数, 总数, 总和)}}
+        """
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+        return {
+            'counters': counters,
+            'histograms': {key: (h.counts, h.count, h.sum) for key, h in histograms.items()}
+        }
+
+    def merge(self, drained):
+        """合并drain()取出的指标"""
+        if not self.enabled or not drained:
+            return
+        with self._lock:
+            for key, value in drained['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, count, total) in drained['histograms'].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.sum += total
+
+    def snapshot(self):
+        """返回所有指标的快照"""
+        with self._lock:
+            def entries(items, convert):
+                return [{'name': name, 'labels': dict(key), 'value': convert(value)}
+                        for (name, key), value in sorted(items.items())]
+
+            return {
+                'timestamp': time.time(),
+                'uptime': round(time.time() - self.started_at, 3),
+                'counters': entries(self._counters, lambda v: v),
+                'gauges': entries(self._gauges, lambda v: v),
+                'histograms': entries(self._histograms, lambda h: h.to_dict())
+            }
+
+    def to_prometheus(self, prefix='street_view'):
+        """生成Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            for kind, items in (('counter', self._counters), ('gauge', self._gauges)):
+                declared = set()
+                for (name, key), value in sorted(items.items()):
+                    metric = f"{prefix}_{name}"
+                    if metric not in declared:
+                        lines.append(f"# TYPE {metric} {kind}")
+                        declared.add(metric)
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+
+            declared = set()
+            for (name, key), histogram in sorted(self._histograms.items()):
+                metric = f"{prefix}_{name}"
+                if metric not in declared:
+                    lines.append(f"# TYPE {metric} histogram")
+                    declared.add(metric)
+                cumulative = 0
+                for bucket, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    bucket_key = key + (('le', bucket),)
+                    lines.append(f"{metric}_bucket{_format_labels(bucket_key)} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, fmt='prometheus'):
+        """将指标写入文件(先写临时文件再重命名，读取方不会看到写了一半的文件)"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                if fmt == 'json':
+                    json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+                else:
+                    f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log_exception(e, f"Failed to export metrics to {path}")
+
+    def summary_rows(self):
+        """生成各接口与各处理阶段的汇总数据
+
+        Returns:
+            tuple: (接口汇总列表, 阶段汇总列表)
+        """
+        with self._lock:
+            requests = {}
+            for (name, key), value in self._counters.items():
+                labels = dict(key)
+                if name == 'http_requests_total':
+                    row = requests.setdefault(labels['endpoint'], {'requests': 0, 'errors': 0, 'bytes': 0, 'hedges': 0})
+                    row['requests'] += value
+                    # 对冲请求中被取消的一方不计为错误
+                    if labels.get('status') not in ('200', 'cancelled'):
+                        row['errors'] += value
+                elif name == 'http_bytes_total':
+                    row = requests.setdefault(labels['endpoint'], {'requests': 0, 'errors': 0, 'bytes': 0, 'hedges': 0})
+                    row['bytes'] += value
+                elif name == 'http_hedges_total':
+                    row = requests.setdefault(labels['endpoint'], {'requests': 0, 'errors': 0, 'bytes': 0, 'hedges': 0})
+                    row['hedges'] += value
+
+            endpoints = []
+            for endpoint, row in sorted(requests.items()):
+                histogram = self._histograms.get(('http_request_seconds', (('endpoint', endpoint),)))
+                wait = self._histograms.get(('rate_limit_wait_seconds', (('endpoint', endpoint),)))
+                endpoints.append({
+                    'endpoint': endpoint,
+                    **row,
+                    'error_rate': row['errors'] / row['requests'] if row['requests'] else 0.0,
+                    'p50': histogram.quantile(0.5) if histogram else 0.0,
+                    'p95': histogram.quantile(0.95) if histogram else 0.0,
+                    'wait': wait.sum if wait else 0.0
+                })
+
+            stages = []
+            for (name, key), histogram in sorted(self._histograms.items()):
+                if name == 'stage_seconds':
+                    stages.append({
+                        'stage': dict(key)['stage'],
+                        'count': histogram.count,
+                        'total': histogram.sum,
+                        'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                        'p95': histogram.quantile(0.95)
+                    })
+            return endpoints, stages
+
+
+class MetricsExporter:
+    """后台定期导出指标的线程"""
+
+    def __init__(self, registry, path, fmt='prometheus', interval=15.0):
+        self.registry = registry
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self._thread.start()
+        logger.info(f"Exporting {self.fmt} metrics to {self.path} every {self.interval}s")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.registry.export(self.path, self.fmt)
+
+    def stop(self):
+        """停止导出线程，并写入最后一次快照"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.registry.export(self.path, self.fmt)
+
+
+# 创建全局指标实例
+metrics = Metrics(enabled=METRICS_CONFIG['enabled'])
@@ -0,0 +1,115 @@
+# utils/rate_limiter.py
+import threading
+import time
+
+from utils.logger import logger
+
+
+class AdaptiveRateLimiter:
+    """单个接口的自适应限速器
+
+    使用令牌桶控制请求速率，同时限制同时进行的请求数量。
+    请求正常时按AIMD规则加性提高速率与并发上限，遇到429/5xx或超时时乘性降低，
+    服务器返回Retry-After时在指定时间内暂停该接口的全部请求。
+    adaptive为False时不调整速率，rate为None时不限制速率，只限制并发数量。
+    """
+
+    def __init__(self, name, rate=5.0, min_rate=0.5, max_rate=50.0, concurrency=4, max_concurrency=16,
+                 increase_step=0.5, decrease_factor=0.5, decrease_cooldown=1.0, adaptive=True):
+        self.name = name
+        self.rate = float(rate) if rate else None
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.concurrency = float(min(concurrency, max_concurrency))
+        self.adaptive = adaptive and self.rate is not None
+        self.max_concurrency = max_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+
+        self._cond = threading.Condition()
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+
+    def _refill(self, now):
+        """按当前速率补充令牌，桶容量约为一秒的请求量"""
+        if self.rate is None:
+            self._tokens = 1.0
+            return
+        capacity = max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """等待直到允许发送一个请求"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._in_flight >= int(self.concurrency):
+                    wait = None
+                elif self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+
+                self._cond.wait(wait)
+
+    def release(self):
+        """请求结束后释放并发名额"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        """请求成功：加性提高速率与并发上限(每秒约提高increase_step)"""
+        with self._cond:
+            self.successes += 1
+            if not self.adaptive:
+                return
+            self.rate = min(self.max_rate, self.rate + self.increase_step / max(self.rate, 1.0))
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(self.concurrency, 1.0))
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        """请求被限流(429/5xx/超时)：乘性降低速率与并发上限
+
+        Args:
+            retry_after: 服务器要求的等待时间(秒)
+        """
+        with self._cond:
+            self.throttles += 1
+            now = time.monotonic()
+
+            # 同一波限流响应只降速一次，避免并发请求同时失败时速率被连续减半
+            if self.adaptive and now - self._last_decrease >= self.decrease_cooldown:
+                self._last_decrease = now
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+                logger.warning(
+                    f"Endpoint {self.name} throttled, rate reduced to {self.rate:.2f}/s, "
+                    f"concurrency {int(self.concurrency)}")
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def stats(self):
+        """返回当前限速状态"""
+        with self._cond:
+            return {
+                'rate': round(self.rate, 2) if self.rate is not None else None,
+                'concurrency': int(self.concurrency),
+                'in_flight': self._in_flight,
+                'successes': self.successes,
+                'throttles': self.throttles
+            }
@@ -0,0 +1,247 @@
+# utils/result_writer.py
+import csv
+import os
+import re
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from utils.logger import logger, log_exception
+from utils.metrics import metrics
+
+PART_PATTERN = re.compile(r'^part-(\d+)\.(csv|parquet)$')
+
+
+def _require_pyarrow():
+    """导入pyarrow，未安装时给出明确提示"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError as e:
+        raise ImportError("Parquet output requires pyarrow, please run: pip install pyarrow") from e
+
+
+class PartitionedResultWriter:
+    """分片追加写入爬取结果
+
+    每批结果写入输出文件旁 `<输出文件名>.parts/` 目录下的一个新分片，写入开销只与批次大小有关；
+    运行结束(或执行merge)时再将所有分片流式合并为最终输出文件。
+    """
+
+    def __init__(self, output_path, fmt='csv', dtypes=None):
+        """
+        Args:
+            output_path: 输出文件路径
+            fmt: 输出格式 csv 或 parquet
+            dtypes: 写入前转换的列类型{列名: 类型}，保证各分片的列类型一致
+        """
+        self.output_path = Path(output_path)
+        self.fmt = fmt
+        self.dtypes = dtypes or {}
+        self.parts_dir = self.output_path.parent / f"{self.output_path.name}.parts"
+        # 下一个分片的序号，首次写入时扫描一次分片目录确定，之后在内存中递增
+        self._next_index = None
+        if fmt == 'parquet':
+            _require_pyarrow()
+
+    def part_files(self):
+        """按写入顺序返回已有的分片文件"""
+        if not self.parts_dir.exists():
+            return []
+
+        parts = []
+        for entry in os.scandir(self.parts_dir):
+            match = PART_PATTERN.match(entry.name)
+            if match and match.group(2) == self.fmt:
+                parts.append((int(match.group(1)), Path(entry.path)))
+        return [path for _, path in sorted(parts)]
+
+    def reset(self):
+        """清除上次运行遗留的分片"""
+        if self.parts_dir.exists():
+            shutil.rmtree(self.parts_dir)
+        self._next_index = 1
+
+    @metrics.timed('result_write')
+    def write(self, records):
+        """将一批结果写入新的分片
+
+        Args:
+            records: 结果字典列表
+
+        Returns:
+            Path: 分片文件路径 或 None(没有结果时)
+        """
+        if not records:
+            return None
+
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        if self._next_index is None:
+            parts = self.part_files()
+            self._next_index = int(PART_PATTERN.match(parts[-1].name).group(1)) + 1 if parts else 1
+        part_path = self.parts_dir / f"part-{self._next_index:06d}.{self.fmt}"
+        self._next_index += 1
+        tmp_path = part_path.with_name(part_path.name + '.tmp')
+
+        try:
+            df = pd.DataFrame(records)
+            dtypes = {column: dtype for column, dtype in self.dtypes.items() if column in df.columns}
+            if dtypes:
+                df = df.astype(dtypes)
+            if self.fmt == 'parquet':
+                df.to_parquet(tmp_path, index=False)
+            else:
+                df.to_csv(tmp_path, index=False, encoding='utf-8')
+            # 写完后再重命名，避免中断时留下不完整的分片
+            os.replace(tmp_path, part_path)
+            logger.info(f"Successfully wrote result part: {part_path}, rows: {len(df)}")
+            return part_path
+        except Exception as e:
+            log_exception(e, f"Failed to write result part {part_path}")
+            raise
+
+    @metrics.timed('result_merge')
+    def merge(self, include_existing=False):
+        """将所有分片合并为最终输出文件，合并成功后删除分片
+
+        Args:
+            include_existing: 是否将已有的输出文件作为第一个分片一起合并(用于断点续传)
+
+        Returns:
+            int: 合并后的结果行数
+        """
+        parts = self.part_files()
+        sources = list(parts)
+        if include_existing and self.output_path.exists():
+            sources.insert(0, self.output_path)
+
+        if not parts:
+            logger.info(f"No result parts to merge for {self.output_path}")
+            return None
+
+        tmp_path = self.output_path.with_name(self.output_path.name + '.tmp')
+        try:
+            if self.fmt == 'parquet':
+                rows = _merge_parquet(sources, tmp_path)
+            else:
+                rows = _merge_csv(sources, tmp_path)
+            os.replace(tmp_path, self.output_path)
+        except Exception as e:
+            log_exception(e, f"Failed to merge result parts into {self.output_path}")
+            raise
+
+        self.reset()
+        logger.info(f"Merged {len(parts)} result parts into {self.output_path}, rows: {rows}")
+        return rows
+
+
+def merge_result_files(sources, target, fmt='csv', dedup_field=None):
+    """将多个结果文件(如多个节点的输出与分片)流式合并为一个文件
+
+    Args:
+        sources: 结果文件路径列表，按优先级排序
+        target: 合并后的输出文件路径
+        fmt: 文件格式 csv 或 parquet
+        dedup_field: 去重字段(采样点ID)，同一ID出现在多个文件中时只保留最先出现的文件中的结果
+
+    Returns:
+        int: 合并后的结果行数
+    """
+    target = Path(target)
+    tmp_path = target.with_name(target.name + '.tmp')
+    try:
+        if fmt == 'parquet':
+            rows = _merge_parquet(sources, tmp_path, dedup_field)
+        else:
+            rows = _merge_csv(sources, tmp_path, dedup_field)
+        os.replace(tmp_path, target)
+    except Exception as e:
+        log_exception(e, f"Failed to merge result files into {target}")
+        raise
+
+    logger.info(f"Merged {len(sources)} result files into {target}, rows: {rows}")
+    return rows
+
+
+def _merge_csv(sources, target, dedup_field=None):
+    """流式合并CSV文件，各文件表头不一致时按列名对齐
+
+    Args:
+        dedup_field: 去重字段，同一ID只保留最先出现的文件中的行(同一文件中的多行全部保留)
+    """
+    # 元数据字段可能很长，放宽csv模块的单字段长度限制
+    csv.field_size_limit(2 ** 31 - 1)
+
+    headers = []
+    for path in sources:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            headers.append(next(csv.reader(f), []))
+
+    columns = []
+    for header in headers:
+        for column in header:
+            if column not in columns:
+                columns.append(column)
+
+    rows = 0
+    seen = set()
+    with open(target, 'w', encoding='utf-8-sig', newline='') as out:
+        writer = csv.writer(out, lineterminator=os.linesep)
+        writer.writerow(columns)
+
+        for path, header in zip(sources, headers):
+            positions = [header.index(column) if column in header else None for column in columns]
+            aligned = header == columns
+            key_index = header.index(dedup_field) if dedup_field in header else None
+            source_keys = set()
+
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    if key_index is not None and key_index < len(row):
+                        if row[key_index] in seen:
+                            continue
+                        source_keys.add(row[key_index])
+                    if not aligned:
+                        row = [row[i] if i is not None and i < len(row) else '' for i in positions]
+                    writer.writerow(row)
+                    rows += 1
+            seen.update(source_keys)
+
+    return rows
+
+
+def _merge_parquet(sources, target, dedup_field=None):
+    """按行组流式合并Parquet文件，各文件结构不一致时统一为兼容的schema
+
+    Args:
+        dedup_field: 去重字段，同一ID只保留最先出现的文件中的行(同一文件中的多行全部保留)
+    """
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    schema = pa.unify_schemas([pq.read_schema(path) for path in sources], promote_options='permissive')
+    rows = 0
+    seen = set()
+    with pq.ParquetWriter(target, schema) as writer:
+        for path in sources:
+            parquet_file = pq.ParquetFile(path)
+            source_keys = set()
+            for batch in parquet_file.iter_batches():
+                table = pa.Table.from_batches([batch])
+                if dedup_field in table.column_names:
+                    keys = [str(key) for key in table.column(dedup_field).to_pylist()]
+                    table = table.filter(pa.array([key not in seen for key in keys]))
+                    source_keys.update(keys)
+                for field in schema:
+                    if field.name not in table.column_names:
+                        table = table.append_column(field.name, pa.nulls(len(table), field.type))
+                table = table.select(schema.names).cast(schema)
+                writer.write_table(table)
+                rows += len(table)
+            seen.update(source_keys)
+
+    return rows
@@ -0,0 +1,348 @@
+# utils/work_queue.py
+import io
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+import pandas as pd
+
+from utils.logger import logger, log_exception
+
+
+def shard_mask(pid_strs, index, count):
+    """返回属于指定分片的采样点掩码
+
+    按采样点ID字符串的CRC32哈希取模分片，结果与进程、机器和输入文件的行顺序无关。
+
+    Args:
+        pid_strs: 采样点ID字符串Series
+        index: 分片序号
+        count: 分片数量
+
+    Returns:
+        Series: 布尔掩码
+    """
+    hashes = pid_strs.map(lambda pid: zlib.crc32(pid.encode('utf-8')))
+    return hashes % count == index
+
+
+def default_worker_id():
+    """默认的工作节点ID: 主机名-进程ID"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """基于SQLite的租约式工作队列
+
+    第一个连接到队列的节点将输入采样点按批写入队列，之后各节点领取(租用)批次并处理，
+    处理期间定期续租，批次结果写入后标记为完成。节点中断或宕机时租约过期，批次会被其他节点重新领取。
+    队列文件需位于各节点都能访问的位置(本机多进程，或支持文件锁的共享文件系统)。
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS batches (
+            id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_batches_status ON batches(status, lease_until);
+        CREATE TABLE IF NOT EXISTS queue_info (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, db_path, worker_id=None, lease_seconds=600, heartbeat_interval=60, poll_interval=5):
+        self.db_path = db_path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+
+        # 写事务都很短，等待写锁的时间不会太长
+        self._conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.schema)
+        self._lock = threading.Lock()
+
+        # 已领取但结果尚未全部写入的批次 {批次ID: 剩余采样点数量}
+        self._remaining = {}
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def is_populated(self):
+        """队列是否已写入采样点"""
+        row = self._execute("SELECT value FROM queue_info WHERE key = 'populated'").fetchone()
+        return row is not None
+
+    def _get_info(self, key):
+        row = self._conn.execute('SELECT value FROM queue_info WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO queue_info (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def _try_start_populate(self):
+        """尝试取得填充队列的权限
+
+        同一时间只有一个节点填充队列；填充节点超过租约时长没有进展时(如已宕机)，其他节点可以接手。
+
+        Returns:
+            int: 已写入队列的输入采样点数量(接手时跳过这些采样点) 或 None(队列已填充或其他节点正在填充)
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                owner = self._get_info('populating')
+                heartbeat = float(self._get_info('populate_heartbeat') or 0)
+                if self._get_info('populated') is not None or \
+                        (owner not in (None, self.worker_id) and time.time() - heartbeat < self.lease_seconds):
+                    self._conn.execute('COMMIT')
+                    return None
+
+                self._set_info('populating', self.worker_id)
+                self._set_info('populate_heartbeat', time.time())
+                rows = int(self._get_info('populated_rows') or 0)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        if owner not in (None, self.worker_id):
+            logger.warning(f"Taking over work queue population from {owner} after {rows} points")
+        return rows
+
+    def _insert_batch(self, part, rows):
+        """写入一个批次并记录已写入的输入采样点数量(每个批次单独提交)
+
+        Returns:
+            bool: 是否写入，填充已被其他节点接手时返回False
+        """
+        payload = part.to_json(orient='split', index=False)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._get_info('populating') != self.worker_id:
+                    self._conn.execute('COMMIT')
+                    return False
+                self._conn.execute('INSERT INTO batches (payload, size, updated_at) VALUES (?, ?, ?)',
+                                   (payload, len(part), time.time()))
+                self._set_info('populated_rows', rows)
+                self._set_info('populate_heartbeat', time.time())
+                self._conn.execute('COMMIT')
+                return True
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def populate(self, chunks, batch_size):
+        """将输入采样点按批写入队列
+
+        每个批次单独提交，其他节点不会长时间等待写锁；全部写入后最后记录填充完成的标记。
+        其他节点正在填充时定期检查填充是否完成，填充节点中断后由其他节点从中断处继续填充。
+
+        Args:
+            chunks: 采样点数据块的迭代器
+            batch_size: 每个队列批次的采样点数量
+
+        Returns:
+            int: 本节点写入的批次数量，队列由其他节点填充时为0
+        """
+        while True:
+            skip_rows = self._try_start_populate()
+            if skip_rows is not None:
+                break
+            if self.is_populated():
+                return 0
+            logger.info(f"Waiting for another node to populate work queue {self.db_path}")
+            time.sleep(self.poll_interval)
+
+        batches = 0
+        rows = 0
+        for chunk in chunks:
+            chunk = chunk.drop(columns=['_pid_str'], errors='ignore')
+            # 跳过中断的填充节点已写入队列的采样点
+            if rows < skip_rows:
+                skipped = min(skip_rows - rows, len(chunk))
+                chunk = chunk.iloc[skipped:]
+                rows += skipped
+            for start in range(0, len(chunk), batch_size):
+                part = chunk.iloc[start:start + batch_size]
+                rows += len(part)
+                if not self._insert_batch(part, rows):
+                    logger.warning(f"Work queue population was taken over by another node, stopped after {batches} batches")
+                    return batches
+                batches += 1
+
+        with self._lock:
+            self._set_info('populated', time.time())
+        return batches
+
+    def claim(self):
+        """领取一个待处理或租约已过期的批次
+
+        Returns:
+            tuple: (批次ID, 采样点DataFrame) 或 None(没有可领取的批次)
+        """
+        with self._lock:
+            now = time.time()
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts FROM batches "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+
+                batch_id, payload, attempts = row
+                self._conn.execute(
+                    "UPDATE batches SET status = 'leased', owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (self.worker_id, now + self.lease_seconds, now, batch_id))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        if attempts:
+            logger.warning(f"Re-leased queue batch {batch_id} (attempt {attempts + 1})")
+        return batch_id, pd.read_json(io.StringIO(payload), orient='split', dtype=False, convert_dates=False)
+
+    def iter_chunks(self, pid_field, skip_pids=None):
+        """逐个领取批次并产出采样点数据块
+
+        Args:
+            pid_field: 采样点ID字段
+            skip_pids: 本节点已写入结果的采样点ID集合(字符串形式)，重新领取的批次中跳过这些采样点
+
+        Yields:
+            DataFrame: 增加了'_pid_str'与'_queue_batch'字段的采样点数据块
+        """
+        self._start_heartbeat()
+        waiting = False
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                # 其他节点持有的批次完成之前继续等待，其租约过期(节点中断或宕机)时由本节点重新领取
+                if not self._has_unfinished():
+                    logger.info(f"No more batches to claim in work queue {self.db_path}")
+                    return
+                if not waiting:
+                    logger.info(f"Waiting for batches leased by other nodes in work queue {self.db_path}")
+                    waiting = True
+                time.sleep(self.poll_interval)
+                continue
+            waiting = False
+
+            batch_id, chunk = claimed
+            chunk['_pid_str'] = chunk[pid_field].astype(str)
+            chunk['_queue_batch'] = batch_id
+            if skip_pids:
+                chunk = chunk[~chunk['_pid_str'].isin(skip_pids)]
+            if chunk.empty:
+                # 批次的采样点都已有结果，直接标记完成
+                self._mark_batches_done([batch_id])
+                continue
+
+            with self._lock:
+                self._remaining[batch_id] = len(chunk)
+            yield chunk
+
+    def _has_unfinished(self):
+        """是否还有未完成的批次(本节点正在处理的批次不计入)
+
+        同一节点ID上次运行遗留的租约也需要等待过期后重新领取。
+        """
+        rows = self._execute("SELECT id FROM batches WHERE status IN ('pending', 'leased')").fetchall()
+        with self._lock:
+            return any(batch_id not in self._remaining for batch_id, in rows)
+
+    def mark_done(self, batch_ids):
+        """记录已写入结果的采样点，批次的采样点全部写入后标记该批次完成
+
+        Args:
+            batch_ids: 已写入结果的采样点所属的批次ID列表(每个采样点一个)
+        """
+        completed = []
+        with self._lock:
+            for batch_id in batch_ids:
+                if batch_id not in self._remaining:
+                    continue
+                self._remaining[batch_id] -= 1
+                if self._remaining[batch_id] <= 0:
+                    del self._remaining[batch_id]
+                    completed.append(batch_id)
+
+        self._mark_batches_done(completed)
+
+    def _mark_batches_done(self, batch_ids):
+        """将批次标记为完成"""
+        with self._lock:
+            now = time.time()
+            for batch_id in batch_ids:
+                self._conn.execute(
+                    "UPDATE batches SET status = 'done', owner = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                    (self.worker_id, now, batch_id))
+
+    def release(self):
+        """释放本节点尚未完成的批次，使其他节点可以立即领取"""
+        with self._lock:
+            batch_ids = list(self._remaining)
+            self._remaining.clear()
+            for batch_id in batch_ids:
+                self._conn.execute(
+                    "UPDATE batches SET status = 'pending', owner = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE id = ? AND owner = ? AND status = 'leased'",
+                    (time.time(), batch_id, self.worker_id))
+        if batch_ids:
+            logger.info(f"Released {len(batch_ids)} unfinished queue batches")
+
+    def _renew(self):
+        """为本节点持有的批次续租"""
+        with self._lock:
+            batch_ids = list(self._remaining)
+            if not batch_ids:
+                return
+            lease_until = time.time() + self.lease_seconds
+            self._conn.executemany(
+                "UPDATE batches SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                [(lease_until, batch_id, self.worker_id) for batch_id in batch_ids])
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._renew()
+            except Exception as e:
+                log_exception(e, f"Failed to renew queue leases in {self.db_path}")
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='queue-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def stats(self):
+        """返回队列中各状态的批次与采样点数量"""
+        rows = self._execute('SELECT status, COUNT(*), SUM(size) FROM batches GROUP BY status').fetchall()
+        return {status: {'batches': batches, 'points': points or 0} for status, batches, points in rows}
+
+    def close(self):
+        """停止续租并关闭连接"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with self._lock:
+            self._conn.close()